@@ -0,0 +1,83 @@
+# Benchmark for the deck browser (the 'Browse deck' checkbox)
+# Opens the app on synthetic decks of growing size (see synthdeck.py),
+# opens the browser and times scrolling it row by row, dragging the
+# scrollbar to random places and clicking a row. Every step is timed
+# until Tk has redrawn (update_idletasks()). The times should stay the
+# same no matter how big the deck is.
+# Needs a display (e.g. run it under xvfb-run on a server).
+#
+#     python3 benchmarks/bench_browser.py -n 10000,1000000
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tkinter as tk
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main
+from synthdeck import writeSyntheticDeck
+
+def constructAndGetArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", default='10000,1000000', help="Comma seperated list of deck sizes", required=False)
+    parser.add_argument("-s", "--steps", type=int, default=1000, help="Number of scroll, drag and click steps", required=False)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the deck and the scrollbar positions", required=False)
+
+    return parser.parse_args()
+
+def timeStep(top_lvl_win, step):
+    # Idle time between two events, like between two mouse wheel notches
+    top_lvl_win.update()
+    time_started = time.perf_counter()
+    step()
+    top_lvl_win.update_idletasks()
+
+    return time.perf_counter() - time_started
+
+def getPercentile(latencies, share):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * share))]
+
+def benchDeckSize(rowcount, args, tmpdir):
+    path_csv_deck = os.path.join(tmpdir, f'deck_{rowcount}.csv')
+    writeSyntheticDeck(path_csv_deck, rowcount, 0.0, 0.5, args.seed)
+
+    sys.argv = ['main.py', '-p', path_csv_deck, '--no-deck-cache']
+    top_lvl_win = tk.Tk()
+    app = main.FlashcardsApp(top_lvl_win, '1368x720', 'TPFlashcards', 'bench', '#303031', [path_csv_deck], 'Linux', main.constructAndGetArgs())
+
+    while app.session is None:
+        top_lvl_win.update()
+        time.sleep(0.005)
+
+    rng = random.Random(args.seed)
+    browser = app.deck_browser
+    app.browse.set(1)
+    opening = timeStep(top_lvl_win, app.toggleDeckBrowser)
+    scrolling = [timeStep(top_lvl_win, lambda: browser.onScrollbar('scroll', '1', 'units')) for i in range(args.steps)]
+    dragging = [timeStep(top_lvl_win, lambda: browser.onScrollbar('moveto', str(rng.random()))) for i in range(args.steps)]
+    clicking = [timeStep(top_lvl_win, lambda: app.gotoBrowsedFlashcard(browser.top + rng.randrange(browser.VISIBLE_ROWS)))
+                for i in range(args.steps)]
+
+    print(f'{rowcount:>9} {opening * 1000:>8.2f}ms', *(f'{getPercentile(latencies, share) * 1000:>8.3f}ms'
+                                                      for latencies in (scrolling, dragging, clicking) for share in (0.5, 0.99)),
+          f'{browser.getStats()["cached_rows"]:>7}')
+
+    app.onExitCloseAutoflipThread()
+    os.remove(path_csv_deck)
+
+def runBenchmark():
+    args = constructAndGetArgs()
+
+    print(f'{"rows":>9} {"open":>10} {"scroll p50":>10} {"p99":>10} {"drag p50":>10} {"p99":>10} {"click p50":>10} {"p99":>10} {"cached":>7}')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for rowcount in (int(rowcount) for rowcount in args.rows.split(',')):
+            benchDeckSize(rowcount, args, tmpdir)
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -0,0 +1,46 @@
+# Benchmark for the duplicate removal stage used by --remove-duplicates
+# Generates decks from 1k up to 1M rows where roughly
+# every fifth row is a duplicate and prints the time per row.
+# If the stage scales linearly the time per row stays (roughly) flat.
+#
+# Run like this from the repository root:
+#
+#     python3 benchmarks/bench_dedup.py
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from main import Deck, removeDuplicatesDeck
+
+ROW_COUNTS = [1000, 10000, 100000, 1000000]
+DUPLICATE_RATIO = 0.2
+
+def buildDeck(rowcount, duplicate_ratio):
+    unique_count = max(1, int(rowcount * (1 - duplicate_ratio)))
+    deck = Deck()
+
+    for i in range(1, rowcount + 1):
+        n = i if i <= unique_count else random.randint(1, unique_count)
+        deck.appendCard(i, f'front {n}', f'雞蛋{n}----gai1 daan2 {n}', f'{n}')
+
+    return deck
+
+def main():
+    random.seed(0)
+    print(f'{"rows":>10} {"removed":>10} {"seconds":>10} {"ns/row":>10}')
+
+    for rowcount in ROW_COUNTS:
+        deck = buildDeck(rowcount, DUPLICATE_RATIO)
+
+        time_started = time.perf_counter()
+        removed_count = removeDuplicatesDeck(deck)
+        elapsed = time.perf_counter() - time_started
+
+        print(f'{rowcount:>10} {removed_count:>10} {elapsed:>10.4f} {elapsed / rowcount * 1e9:>10.1f}')
+
+if __name__ == '__main__':
+    main()
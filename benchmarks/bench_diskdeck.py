@@ -0,0 +1,98 @@
+# Benchmark for the SQLite backed deck (main.py --disk-store)
+# Imports synthetic decks of growing size into their store, then opens
+# them again and times walking forward and backward (like autowalk
+# does), random jumps (goto), shuffling and walking the shuffled deck.
+# Peak memory is measured with tracemalloc from opening the store to
+# the end of the navigation and should stay the same no matter how big
+# the deck is.
+#
+#     python3 benchmarks/bench_diskdeck.py -n 10000,100000,1000000
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main
+from synthdeck import writeSyntheticDeck
+
+NAVIGATION_STEPS = 20000
+GOTO_STEPS = 5000
+
+def constructAndGetArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", default='10000,100000,1000000', help="Comma seperated list of deck sizes", required=False)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for deck generation, jumps and shuffling", required=False)
+
+    return parser.parse_args()
+
+def timeSteps(step, count):
+    time_started = time.perf_counter()
+
+    for i in range(count):
+        step(i)
+
+    return (time.perf_counter() - time_started) / count * 1e6
+
+def benchDeckSize(rowcount, args, tmpdir):
+    path_csv_deck = os.path.join(tmpdir, f'deck_{rowcount}.csv')
+    writeSyntheticDeck(path_csv_deck, rowcount, 0.0, 0.5, args.seed)
+
+    time_started = time.perf_counter()
+    main.DiskDeck(path_csv_deck, tmpdir).connection.close()
+    importing = time.perf_counter() - time_started
+
+    rng = random.Random(args.seed)
+    positions = [rng.randint(1, rowcount) for i in range(GOTO_STEPS)]
+    timings, peak = None, None
+
+    # Timed without tracemalloc first (it slows Python code down a lot),
+    # then the same again for the peak memory
+    for measure_memory in (False, True):
+        if measure_memory:
+            tracemalloc.start()
+
+        time_started = time.perf_counter()
+        deck = main.DiskDeck(path_csv_deck, tmpdir)
+        opening = time.perf_counter() - time_started
+
+        forward = timeSteps(lambda i: deck.nextCard(), NAVIGATION_STEPS)
+        backward = timeSteps(lambda i: deck.prevCard(), NAVIGATION_STEPS)
+        goto = timeSteps(lambda i: deck.gotoCard(positions[i]), GOTO_STEPS)
+
+        time_started = time.perf_counter()
+        deck.shuffleCards(random.Random(args.seed), keep_current=True)
+        shuffling = time.perf_counter() - time_started
+
+        shuffled_forward = timeSteps(lambda i: deck.nextCard(), NAVIGATION_STEPS)
+        deck.connection.close()
+
+        if measure_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        else:
+            timings = (opening, forward, backward, goto, shuffling, shuffled_forward)
+
+    opening, forward, backward, goto, shuffling, shuffled_forward = timings
+    print(f'{rowcount:>9} {importing:>9.2f}s {opening * 1000:>8.2f}ms {forward:>8.2f}us {backward:>8.2f}us '
+          f'{goto:>8.2f}us {shuffling * 1000:>8.3f}ms {shuffled_forward:>8.2f}us {peak / 1e6:>8.2f}MB')
+
+    os.remove(path_csv_deck)
+    os.remove(f'{path_csv_deck}{main.DISK_DECK_SUFFIX}')
+
+def runBenchmarks():
+    args = constructAndGetArgs()
+
+    print(f'{"rows":>9} {"import":>10} {"open":>10} {"next":>10} {"prev":>10} {"goto":>10} {"shuffle":>10} {"shuf next":>10} {"peak mem":>10}')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for rowcount in (int(rowcount) for rowcount in args.rows.split(',')):
+            benchDeckSize(rowcount, args, tmpdir)
+
+if __name__ == '__main__':
+    runBenchmarks()
@@ -0,0 +1,110 @@
+# Flip latency benchmark on a deck with long card texts
+# Opens the app on a synthetic deck whose cards hold long English
+# fronts and long CJK----Jyutping backs, then flips and walks through
+# it. Every flip or step is timed from the click handler until Tk has
+# redrawn the label (update_idletasks()), with the event loop running
+# in between like it does between two clicks. Reports p50 and p99.
+# Needs a display (e.g. run it under xvfb-run on a server).
+#
+#     python3 benchmarks/bench_flip.py --rows 2000 --flips 2000
+#     python3 benchmarks/bench_flip.py --no-layout-cache    (Tk wraps the texts itself, for comparison)
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tkinter as tk
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main
+from synthdeck import ENGLISH_WORDS, HANZI, JYUTPING_SYLLABLES
+
+def constructAndGetArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", type=int, default=2000, help="Number of cards", required=False)
+    parser.add_argument("-f", "--flips", type=int, default=2000, help="Number of flips (every second one also walks to the next card)", required=False)
+    parser.add_argument("-w", "--words", type=int, default=40, help="Maximum number of words/characters per card side", required=False)
+    parser.add_argument("--no-layout-cache", action='store_true', help="Hand the texts to Tk unwrapped", required=False)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the deck", required=False)
+
+    return parser.parse_args()
+
+def writeLongTextDeck(path, rowcount, max_words, seed):
+    rng = random.Random(seed)
+
+    with open(path, 'w', encoding='utf8') as csvfile:
+        csvfile.write('id;front_content;back_content;front_sound_file_path\n')
+
+        for _id in range(1, rowcount + 1):
+            front = ' '.join(rng.choice(ENGLISH_WORDS) for i in range(rng.randint(max_words // 2, max_words)))
+            syllable_indices = [rng.randrange(len(HANZI)) for i in range(rng.randint(max_words // 2, max_words))]
+            native = ''.join(HANZI[i] for i in syllable_indices)
+            romanized = ' '.join(JYUTPING_SYLLABLES[i] for i in syllable_indices)
+            csvfile.write(f'{_id};{front} {_id};{native}----{romanized};\n')
+
+class UnwrappedLayouts(main.TextLayoutCache):
+    # Stand-in that leaves all wrapping to Tk
+    def get(self, text):
+        return text
+
+    def prepare(self, text):
+        return text
+
+def getPercentile(latencies, share):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * share))]
+
+def printLatencies(name, latencies):
+    latencies = sorted(latencies)
+    print(f'  {name:<10} p50 {getPercentile(latencies, 0.5) * 1000:>7.3f}ms  p99 {getPercentile(latencies, 0.99) * 1000:>7.3f}ms  '
+          f'max {latencies[-1] * 1000:>7.3f}ms  ({len(latencies)} samples)')
+
+def runBenchmark():
+    args = constructAndGetArgs()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path_csv_deck = os.path.join(tmpdir, 'deck.csv')
+        writeLongTextDeck(path_csv_deck, args.rows, args.words, args.seed)
+
+        sys.argv = ['main.py', '-p', path_csv_deck, '--no-deck-cache', '-z', '22']
+        app_args = main.constructAndGetArgs()
+        top_lvl_win = tk.Tk()
+        app = main.FlashcardsApp(top_lvl_win, '1368x720', 'TPFlashcards', 'bench', '#303031', [path_csv_deck], 'Linux', app_args)
+
+        if args.no_layout_cache:
+            app.text_layouts = UnwrappedLayouts(app.flashcard_font, main.FLASHCARD_WRAPLENGTH)
+
+        while app.session is None:
+            top_lvl_win.update()
+            time.sleep(0.005)
+
+        flip_latencies = []
+        navigate_latencies = []
+
+        for i in range(args.flips):
+            # Idle time between two clicks, layoutAhead() runs here
+            top_lvl_win.update()
+
+            time_started = time.perf_counter()
+            app.flipFlashcard()
+            top_lvl_win.update_idletasks()
+            flip_latencies.append(time.perf_counter() - time_started)
+
+            if i % 2:
+                top_lvl_win.update()
+                time_started = time.perf_counter()
+                app.navigateFlashcards('forward')
+                top_lvl_win.update_idletasks()
+                navigate_latencies.append(time.perf_counter() - time_started)
+
+        app.onExitCloseAutoflipThread()
+
+    print(f'{args.rows} cards with up to {args.words} words per side, '
+          f'{"Tk wraps the texts" if args.no_layout_cache else "texts wrapped ahead of time"}')
+    printLatencies('flip', flip_latencies)
+    printLatencies('navigate', navigate_latencies)
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -0,0 +1,86 @@
+# Benchmark for the import pipeline (main.py --import)
+# Writes the rows of a synthetic deck (see synthdeck.py) as an Anki
+# style TSV export (HTML, [sound:...] tags, native and romanized back
+# only seperated by a space) and as JSON lines, then imports both into a
+# deck CSV alone and into a deck CSV with its deck cache. Reports rows
+# per second and the peak memory of the importing process, which should
+# grow only by the 8 bytes per row of the used ids (the chunks are parsed
+# by worker processes when there is more than one CPU).
+#
+#     python3 benchmarks/bench_import.py -n 1000000
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main
+from synthdeck import generateRows
+
+def constructAndGetArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", type=int, default=1000000, help="Number of rows in the input", required=False)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the input", required=False)
+
+    return parser.parse_args()
+
+def writeInputs(tmpdir, args):
+    path_tsv = os.path.join(tmpdir, 'export.txt')
+    path_jsonl = os.path.join(tmpdir, 'export.jsonl')
+
+    with open(path_tsv, 'w', encoding='utf8') as tsvfile, open(path_jsonl, 'w', encoding='utf8') as jsonlfile:
+        tsvfile.write('#separator:tab\n#html:true\n')
+
+        for _id, front, back, sound in generateRows(args.rows, 0.0, 0.5, args.seed):
+            native, romanized = back.split('----') if '----' in back else ('', back)
+            sound_tag = f'[sound:{sound}]' if sound else ''
+            tsvfile.write(f'<b>{front}</b>\t{native} {romanized}{sound_tag}\n')
+            jsonlfile.write(f'{json.dumps({"front": front, "native": native, "romanized": romanized, "sound": sound}, ensure_ascii=False)}\n')
+
+    return path_tsv, path_jsonl
+
+def runImport(path_input, path_csv_deck, import_to):
+    import_args = argparse.Namespace(import_path=path_input, path_to_deck=[path_csv_deck], import_format='auto', import_to=import_to)
+
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        main.importDeck(import_args)
+
+def benchImport(path_input, path_csv_deck, import_to, rowcount):
+    time_started = time.perf_counter()
+    runImport(path_input, path_csv_deck, import_to)
+    elapsed = time.perf_counter() - time_started
+
+    # Again with tracemalloc, it slows Python code down a lot
+    tracemalloc.start()
+    runImport(path_input, path_csv_deck, import_to)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'  {os.path.basename(path_input):<14} {import_to:<6} {elapsed:>8.2f}s {rowcount / elapsed:>10.0f} rows/s {peak / 1e6:>8.2f}MB peak')
+
+def runBenchmark():
+    args = constructAndGetArgs()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path_tsv, path_jsonl = writeInputs(tmpdir, args)
+        path_csv_deck = os.path.join(tmpdir, 'deck.csv')
+        print(f'{args.rows} rows, {os.path.getsize(path_tsv) / 1e6:.1f} MB TSV, '
+              f'{os.path.getsize(path_jsonl) / 1e6:.1f} MB JSON lines, {os.cpu_count()} CPU(s)')
+
+        for path_input in (path_tsv, path_jsonl):
+            for import_to in ('csv', 'deck'):
+                benchImport(path_input, path_csv_deck, import_to, args.rows)
+
+        # The imported deck loads straight from its cache
+        time_started = time.perf_counter()
+        deck = main.readDeckCache(path_csv_deck, main.getSoundBasePath(path_csv_deck))
+        print(f'Loading the imported deck from its cache took {time.perf_counter() - time_started:.3f}s ({len(deck)} cards)')
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -0,0 +1,47 @@
+# Memory benchmark for loading a deck
+# Writes synthetic CSV decks with 10k, 100k and 1M rows, loads them the
+# same way the app does (CSV parsing plus classifying the sound files)
+# and prints the bytes per card that stay allocated afterwards as well
+# as the peak while loading. Measured with tracemalloc.
+#
+# Run like this from the repository root:
+#
+#     python3 benchmarks/bench_memory.py
+
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from main import readDeckCsv, classifySoundFiles
+
+ROW_COUNTS = [10000, 100000, 1000000]
+
+def writeDeckCsv(path, rowcount):
+    with open(path, 'w', encoding='utf8') as csvfile:
+        csvfile.write('id;front_content;back_content;front_sound_file_path\n')
+
+        for i in range(1, rowcount + 1):
+            csvfile.write(f'{i};front {i};雞蛋{i}----gai1 daan2 {i};{i}\n')
+
+def main():
+    print(f'{"rows":>10} {"bytes/card":>12} {"peak bytes/card":>16}')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for rowcount in ROW_COUNTS:
+            path_csv_deck = os.path.join(tmpdir, f'deck_{rowcount}.csv')
+            writeDeckCsv(path_csv_deck, rowcount)
+
+            tracemalloc.start()
+            deck = readDeckCsv(path_csv_deck)
+            deck = classifySoundFiles(deck, tmpdir)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print(f'{rowcount:>10} {current / rowcount:>12.1f} {peak / rowcount:>16.1f}')
+            del deck
+
+if __name__ == '__main__':
+    main()
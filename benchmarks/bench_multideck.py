@@ -0,0 +1,72 @@
+# Benchmark for loading a directory of decks (main.py -p <directory>)
+# Writes a directory of synthetic decks of different sizes (see
+# synthdeck.py) and compares loading them one after the other with
+# loadDecks(), which parses them in parallel worker processes, and with
+# loading only the largest deck. Without the deck cache unless --cache.
+#
+#     python3 benchmarks/bench_multideck.py --decks 50 --rows 2000,50000
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main
+from synthdeck import writeSyntheticDeck
+
+def constructAndGetArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--decks", type=int, default=50, help="Number of decks in the directory", required=False)
+    parser.add_argument("-n", "--rows", default='2000,50000', help="Smallest and largest deck size (rows), the sizes in between are random", required=False)
+    parser.add_argument("--cache", action='store_true', help="Load the decks from their compiled cache (written by a first load)", required=False)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the deck sizes and contents", required=False)
+
+    return parser.parse_args()
+
+def getLoadArgs(use_cache):
+    return argparse.Namespace(stream=False, disk_store=False, shuffle=False, remove_duplicates=False, near_duplicates=None, no_deck_cache=not use_cache)
+
+def timeIt(function):
+    time_started = time.perf_counter()
+
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        result = function()
+
+    return time.perf_counter() - time_started, result
+
+def runBenchmark():
+    args = constructAndGetArgs()
+    min_rows, max_rows = (int(rowcount) for rowcount in args.rows.split(','))
+    rng = random.Random(args.seed)
+    load_args = getLoadArgs(args.cache)
+    profiler = main.Profiler()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        rowcounts = [max_rows] + [rng.randint(min_rows, max_rows) for i in range(args.decks - 1)]
+
+        for deck_number, rowcount in enumerate(rowcounts):
+            writeSyntheticDeck(os.path.join(tmpdir, f'deck_{deck_number:03}.csv'), rowcount, 0.0, 0.5, args.seed + deck_number)
+
+        paths_csv_deck = main.getDeckPaths([tmpdir])
+        path_largest = os.path.join(tmpdir, 'deck_000.csv')
+
+        if args.cache:
+            timeIt(lambda: main.loadDecks(paths_csv_deck, load_args, profiler))
+
+        largest, deck = timeIt(lambda: main.loadDecks([path_largest], load_args, profiler))
+        one_by_one, decks = timeIt(lambda: [main.loadDecks([path], load_args, profiler) for path in paths_csv_deck])
+        parallel, deck = timeIt(lambda: main.loadDecks(paths_csv_deck, load_args, profiler))
+
+    print(f'{len(rowcounts)} decks, {sum(rowcounts)} rows, {os.cpu_count()} CPU(s){", from cache" if args.cache else ""}')
+    print(f'  largest deck only ({max_rows} rows) {largest:>8.3f}s')
+    print(f'  one deck after the other       {one_by_one:>8.3f}s')
+    print(f'  loadDecks() in parallel        {parallel:>8.3f}s ({parallel / largest:.1f}x the largest deck)')
+    print(f'  {len(deck)} cards in the merged deck')
+
+if __name__ == '__main__':
+    runBenchmark()
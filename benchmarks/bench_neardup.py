@@ -0,0 +1,79 @@
+# Benchmark for the near-duplicate detection (main.py --near-duplicates)
+# Builds synthetic decks (see synthdeck.py) and plants near-duplicates
+# of some cards: the front with one of its words repeated after a slash,
+# the front in upper case or the Jyutping without spaces and tone
+# numbers. Reports the time findNearDuplicateClusters() takes, which
+# should grow about linearly with the deck size, and how many of the
+# planted near-duplicates it found.
+#
+#     python3 benchmarks/bench_neardup.py -n 10000,100000,500000
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main
+from synthdeck import generateRows
+
+PLANTED_ID_OFFSET = 10 ** 9
+
+def constructAndGetArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", default='10000,100000,500000', help="Comma seperated list of deck sizes", required=False)
+    parser.add_argument("-p", "--planted", type=float, default=0.05, help="Share of cards that get a near-duplicate", required=False)
+    parser.add_argument("--similarity", type=main.getSimilarity, default=0.8, help="Similarity threshold", required=False)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the deck and the near-duplicates", required=False)
+
+    return parser.parse_args()
+
+def getNearDuplicate(rng, front, back):
+    romanized = back.split('----')[-1]
+    variant = rng.randrange(3)
+
+    if variant == 0:
+        return f'{front}/{front.split()[0]}', back
+
+    if variant == 1:
+        return front.upper(), back
+
+    return front, back.replace(romanized, re.sub(r'[\d ]', '', romanized))
+
+def buildDeck(rowcount, args):
+    rng = random.Random(args.seed)
+    deck = main.Deck()
+    planted = 0
+
+    for _id, front, back, sound in generateRows(rowcount, 0.0, 0.5, args.seed):
+        deck.appendCard(_id, front, back, sound)
+
+        if rng.random() < args.planted:
+            deck.appendCard(PLANTED_ID_OFFSET + _id, *getNearDuplicate(rng, front, back), '')
+            planted += 1
+
+    deck.order = main.array('I', range(len(deck.ids)))
+
+    return deck, planted
+
+def runBenchmark():
+    args = constructAndGetArgs()
+
+    print(f'similarity >= {args.similarity}, {main.getLshBandRows(args.similarity)} rows per band')
+    print(f'{"cards":>9} {"planted":>9} {"found":>9} {"clusters":>9} {"time":>9} {"per card":>10}')
+
+    for rowcount in (int(rowcount) for rowcount in args.rows.split(',')):
+        deck, planted = buildDeck(rowcount, args)
+
+        time_started = time.perf_counter()
+        clusters = main.findNearDuplicateClusters(deck, args.similarity)
+        elapsed = time.perf_counter() - time_started
+
+        found = sum(1 for cluster in clusters for index in cluster if deck.ids[index] >= PLANTED_ID_OFFSET)
+        print(f'{len(deck):>9} {planted:>9} {found:>9} {len(clusters):>9} {elapsed:>8.2f}s {elapsed / len(deck) * 1e6:>8.1f}us')
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -0,0 +1,187 @@
+# Benchmark suite for the deck loading and navigation pipeline
+# Generates synthetic decks (see synthdeck.py), runs every stage of
+# loadDeck() headless, times it and measures its peak
+# memory with tracemalloc, then times cursor navigation on the result.
+# The results are written as JSON so two runs can be compared:
+#
+#     python3 benchmarks/bench_pipeline.py -n 1000,10000,100000 -o before.json
+#     ... change something ...
+#     python3 benchmarks/bench_pipeline.py -n 1000,10000,100000 -o after.json --compare before.json
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main
+from synthdeck import writeSyntheticDeck
+
+NAVIGATION_STEPS = 100000
+GOTO_STEPS = 10000
+
+def constructAndGetArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", default='1000,10000,100000,1000000', help="Comma seperated list of deck sizes", required=False)
+    parser.add_argument("-d", "--duplicate-ratio", type=float, default=0.1, help="Share of duplicate cards (0.0 - 1.0)", required=False)
+    parser.add_argument("-c", "--cjk-ratio", type=float, default=0.5, help="Share of cards with a CJK----romanized backside (0.0 - 1.0)", required=False)
+    parser.add_argument("-o", "--output", default='bench_pipeline.json', help="Path of the JSON file the results are written to", required=False)
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare the timings with", required=False)
+    parser.add_argument("--no-memory", action='store_true', help="Skip the (slower) peak memory pass", required=False)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for deck generation and shuffling", required=False)
+
+    return parser.parse_args()
+
+def getPipelineStages(path_csv_deck, sndfile_basepath):
+    # Same order as loadDeck() with shuffle and
+    # duplicate removal enabled. Each stage gets the deck of the
+    # previous one and returns the deck for the next.
+    def readCsv(deck):
+        return main.readDeckCsv(path_csv_deck)
+
+    def classifySounds(deck):
+        return main.classifySoundFiles(deck, sndfile_basepath)
+
+    def writeCache(deck):
+        main.writeDeckCache(path_csv_deck, sndfile_basepath, deck)
+        return deck
+
+    def readCache(deck):
+        return main.readDeckCache(path_csv_deck, sndfile_basepath)
+
+    def checkSounds(deck):
+        main.checkSoundFilesExist(deck)
+        return deck
+
+    def shuffle(deck):
+        return main.shuffleDeck(deck)
+
+    def removeDuplicates(deck):
+        main.removeDuplicatesDeck(deck)
+        return deck
+
+    return [('csv_read', readCsv), ('classify_sounds', classifySounds), ('cache_write', writeCache),
+            ('cache_read', readCache), ('sound_check', checkSounds), ('shuffle', shuffle),
+            ('dedup', removeDuplicates)]
+
+def runStages(stages, measure_memory):
+    results = {}
+    deck = None
+
+    if measure_memory:
+        tracemalloc.start()
+
+    for stage_name, stage in stages:
+        if measure_memory:
+            tracemalloc.reset_peak()
+            before, peak = tracemalloc.get_traced_memory()
+
+        time_started = time.perf_counter()
+        deck = stage(deck)
+        elapsed = time.perf_counter() - time_started
+
+        if measure_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            results[stage_name] = {'peak_bytes': peak - before}
+        else:
+            results[stage_name] = {'seconds': elapsed}
+
+    if measure_memory:
+        tracemalloc.stop()
+
+    return results, deck
+
+def benchNavigation(deck, rng):
+    results = {}
+    steps = min(NAVIGATION_STEPS, len(deck) * 2)
+
+    time_started = time.perf_counter()
+    for i in range(steps):
+        deck.nextCard()
+    elapsed = time.perf_counter() - time_started
+    results['navigate_next'] = {'seconds': elapsed, 'ns_per_op': elapsed / steps * 1e9}
+
+    positions = [rng.randint(1, len(deck)) for i in range(GOTO_STEPS)]
+    time_started = time.perf_counter()
+    for position in positions:
+        deck.gotoCard(position)
+    elapsed = time.perf_counter() - time_started
+    results['navigate_goto'] = {'seconds': elapsed, 'ns_per_op': elapsed / GOTO_STEPS * 1e9}
+
+    return results
+
+def benchDeckSize(rowcount, args, tmpdir):
+    path_csv_deck = os.path.join(tmpdir, f'deck_{rowcount}.csv')
+    writeSyntheticDeck(path_csv_deck, rowcount, args.duplicate_ratio, args.cjk_ratio, args.seed)
+    stages = getPipelineStages(path_csv_deck, tmpdir)
+
+    random.seed(args.seed)
+    results, deck = runStages(stages, measure_memory=False)
+    results['cards_loaded'] = len(deck)
+    results.update(benchNavigation(deck, random.Random(args.seed)))
+    del deck
+
+    if not args.no_memory:
+        random.seed(args.seed)
+        memory_results, deck = runStages(stages, measure_memory=True)
+
+        for stage_name, memory_result in memory_results.items():
+            results[stage_name].update(memory_result)
+
+        del deck
+
+    os.remove(path_csv_deck)
+    os.remove(f'{path_csv_deck}{main.DECK_CACHE_SUFFIX}')
+
+    return results
+
+def printResults(rowcount, results, previous_results):
+    print(f'\n{rowcount} rows ({results["cards_loaded"]} cards after dedup)')
+    print(f'  {"stage":<16} {"seconds":>10} {"peak MB":>10} {"vs. before":>11}')
+
+    for stage_name, result in results.items():
+        if not isinstance(result, dict):
+            continue
+
+        peak = f'{result["peak_bytes"] / 1e6:>10.1f}' if 'peak_bytes' in result else f'{"-":>10}'
+        ratio = f'{"-":>11}'
+        previous = previous_results.get(stage_name)
+
+        if previous and previous.get('seconds'):
+            ratio = f'{result["seconds"] / previous["seconds"]:>10.2f}x'
+
+        print(f'  {stage_name:<16} {result["seconds"]:>10.4f} {peak} {ratio}')
+
+def runBenchmarks():
+    args = constructAndGetArgs()
+    rowcounts = [int(rowcount) for rowcount in args.rows.split(',')]
+    previous = {}
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf8') as f:
+            previous = json.load(f)['results']
+
+    output = {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                       'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'duplicate_ratio': args.duplicate_ratio,
+                       'cjk_ratio': args.cjk_ratio, 'seed': args.seed},
+              'results': {}}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for rowcount in rowcounts:
+            results = benchDeckSize(rowcount, args, tmpdir)
+            output['results'][str(rowcount)] = results
+            printResults(rowcount, results, previous.get(str(rowcount), {}))
+
+    with open(args.output, 'w', encoding='utf8') as f:
+        json.dump(output, f, indent=2)
+
+    print(f'\nResults written to {args.output}')
+
+if __name__ == '__main__':
+    runBenchmarks()
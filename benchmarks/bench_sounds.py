@@ -0,0 +1,91 @@
+# Benchmark for the sound bundle (main.py --pack-sounds)
+# Writes a synthetic deck whose cards reference many tiny sound files
+# with numeric names like the Anki media folder, then compares loose
+# files with a packed bundle: the existence check while loading the
+# deck and reading the sounds of random cards the way playing them does.
+# Point --media-dir at a network share or a spinning disk to see the
+# difference that matters, a local SSD with a warm page cache hides most of it.
+#
+#     python3 benchmarks/bench_sounds.py --sounds 5000 --reads 20000
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main
+from synthdeck import writeSyntheticDeck
+
+def constructAndGetArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--sounds", type=int, default=5000, help="Number of sound files", required=False)
+    parser.add_argument("-n", "--rows", type=int, default=20000, help="Number of cards in the deck", required=False)
+    parser.add_argument("-r", "--reads", type=int, default=20000, help="Number of sounds to read", required=False)
+    parser.add_argument("-b", "--bytes", type=int, default=8000, help="Size of every sound file", required=False)
+    parser.add_argument("--media-dir", help="Directory to write the deck and sound files to (default: a temp directory)", required=False)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the deck and the cards read", required=False)
+
+    return parser.parse_args()
+
+def writeSounds(tmpdir, args):
+    path_csv_deck = os.path.join(tmpdir, 'deck.csv')
+    # The deck references the sound files 1 to args.sounds
+    writeSyntheticDeck(path_csv_deck, args.rows, 0.0, 0.5, args.seed, args.sounds)
+
+    for number in range(1, args.sounds + 1):
+        with open(os.path.join(tmpdir, str(number)), 'wb') as f:
+            f.write(os.urandom(args.bytes))
+
+    return path_csv_deck
+
+def timeIt(function):
+    time_started = time.perf_counter()
+    result = function()
+
+    return time.perf_counter() - time_started, result
+
+def benchSounds(tmpdir, args):
+    path_csv_deck = writeSounds(tmpdir, args)
+    sndfile_basepath = main.getSoundBasePath(path_csv_deck)
+    deck = main.classifySoundFiles(main.readDeckCsv(path_csv_deck), sndfile_basepath)
+    main.checkSoundFilesExist(deck)
+
+    packing, (count, size) = timeIt(lambda: main.writeSoundBundle(path_csv_deck, deck))
+    print(f'Packed {count} sound files ({size / 1e6:.1f} MB) in {packing:.3f}s')
+
+    rng = random.Random(args.seed)
+    sndfiles = [deck.getLocalSoundfile(rng.randrange(len(deck))) for i in range(args.reads)]
+    sndfiles = [sndfile for sndfile in sndfiles if sndfile]
+    loose_reader = main.SoundReader()
+    bundle_reader = main.SoundReader.open([path_csv_deck])
+
+    check_loose, missing = timeIt(lambda: main.checkSoundFilesExist(deck))
+    check_bundle, missing = timeIt(lambda: main.checkSoundFilesExist(deck, sound_reader=bundle_reader))
+    read_loose, result = timeIt(lambda: [loose_reader.read(sndfile) for sndfile in sndfiles])
+    read_bundle, result = timeIt(lambda: [bundle_reader.read(sndfile) for sndfile in sndfiles])
+    stats = bundle_reader.getStats()
+    bundle_reader.close()
+
+    print(f'  {"":<22} {"loose files":>12} {"bundle":>12}')
+    print(f'  {"existence check":<22} {check_loose:>11.4f}s {check_bundle:>11.4f}s')
+    print(f'  {f"{len(sndfiles)} sound reads":<22} {read_loose:>11.4f}s {read_bundle:>11.4f}s')
+    print(f'  {"per read":<22} {read_loose / len(sndfiles) * 1e6:>10.1f}us {read_bundle / len(sndfiles) * 1e6:>10.1f}us')
+    print(f'The bundle saved {stats["opens_saved"]} open() and {stats["stats_saved"]} stat() calls, '
+          f'{stats["file_reads"]} sound(s) still came from loose files')
+
+def runBenchmark():
+    args = constructAndGetArgs()
+
+    if args.media_dir:
+        benchSounds(args.media_dir, args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        benchSounds(tmpdir, args)
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -0,0 +1,65 @@
+# Startup benchmark: time from launching main.py to the first painted card
+# Starts the app on a synthetic deck with --exit-after-first-card a few
+# times and reports how long it took until the app reported the first
+# card as shown. Needs a display (e.g. run it under xvfb-run on a server).
+#
+#     python3 benchmarks/bench_startup.py --rows 100000 --runs 5
+#     python3 benchmarks/bench_startup.py --rows 100000 --runs 5 --cache
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthdeck import writeSyntheticDeck
+
+PATH_MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main.py')
+
+def constructAndGetArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", type=int, default=100000, help="Size of the synthetic deck", required=False)
+    parser.add_argument("-r", "--runs", type=int, default=5, help="Number of app starts", required=False)
+    parser.add_argument("--cache", action='store_true', help="Start from the compiled deck cache (written by a first start that is not counted)", required=False)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the deck", required=False)
+
+    return parser.parse_args()
+
+def timeStartup(path_csv_deck, use_cache):
+    command = [sys.executable, PATH_MAIN, '-p', path_csv_deck, '--exit-after-first-card']
+
+    if not use_cache:
+        command.append('--no-deck-cache')
+
+    time_started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    for line in process.stdout:
+        if line.startswith('First card shown'):
+            elapsed = time.perf_counter() - time_started
+            process.wait()
+            return elapsed
+
+    process.wait()
+    raise RuntimeError(f'The app exited without showing a card: {process.stderr.read().strip()}')
+
+def runBenchmark():
+    args = constructAndGetArgs()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path_csv_deck = os.path.join(tmpdir, 'deck.csv')
+        writeSyntheticDeck(path_csv_deck, args.rows, 0.0, 0.5, args.seed)
+
+        if args.cache:
+            timeStartup(path_csv_deck, True)
+
+        timings = sorted(timeStartup(path_csv_deck, args.cache) for i in range(args.runs))
+
+    print(f'{args.rows} rows{" from the deck cache" if args.cache else ""}, {args.runs} starts')
+    print(f'  launch to first card: min {timings[0]:.3f}s  median {timings[len(timings) // 2]:.3f}s  max {timings[-1]:.3f}s')
+
+if __name__ == '__main__':
+    runBenchmark()
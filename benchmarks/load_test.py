@@ -0,0 +1,184 @@
+# Load test for the server mode (main.py --serve)
+# Simulates many learners at once: every learner opens a keep-alive
+# connection, creates a session and then flips, walks, jumps, shuffles
+# and searches through the deck like someone studying would. Reports
+# the request throughput and latency percentiles.
+#
+# Against a server that is already running:
+#
+#     python3 main.py -p deck.csv --serve 127.0.0.1:8080
+#     python3 benchmarks/load_test.py --port 8080 --learners 500 --requests 100
+#
+# Or let it start a server on a synthetic deck by itself:
+#
+#     python3 benchmarks/load_test.py --spawn --rows 100000 --learners 500
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthdeck import writeSyntheticDeck
+
+PATH_MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main.py')
+SEARCH_QUERIES = ['egg', 'living room', 'gai', 'zuk1 kau4', '雞', '電視', 'ca', 'water']
+
+def constructAndGetArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default='127.0.0.1', help="Host the server listens on", required=False)
+    parser.add_argument("--port", type=int, default=8080, help="Port the server listens on", required=False)
+    parser.add_argument("-l", "--learners", type=int, default=200, help="Number of concurrent learners (sessions)", required=False)
+    parser.add_argument("-r", "--requests", type=int, default=100, help="Number of requests every learner sends after creating its session", required=False)
+    parser.add_argument("--spawn", action='store_true', help="Start a server on a synthetic deck for the test and stop it afterwards", required=False)
+    parser.add_argument("-n", "--rows", type=int, default=100000, help="Size of the synthetic deck for --spawn", required=False)
+    parser.add_argument("-o", "--output", help="Path of a JSON file the results are written to", required=False)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the deck and the learners' actions", required=False)
+
+    return parser.parse_args()
+
+async def sendRequest(reader, writer, method, target, latencies):
+    time_started = time.perf_counter()
+    writer.write(f'{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: 0\r\n\r\n'.encode('latin-1'))
+    await writer.drain()
+
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+    content_length = 0
+
+    for header_line in header_lines:
+        name, _, value = header_line.partition(':')
+
+        if name.strip().lower() == 'content-length':
+            content_length = int(value)
+
+    body = await reader.readexactly(content_length)
+    latencies.append(time.perf_counter() - time_started)
+
+    return int(status_line.split(' ')[1]), body
+
+def getNextRequest(rng, session_path, card_count):
+    # Mostly flipping and walking forward, now and then something else
+    action = rng.random()
+
+    if action < 0.45:
+        return 'POST', f'{session_path}/flip'
+    elif action < 0.85:
+        return 'POST', f'{session_path}/next'
+    elif action < 0.90:
+        return 'POST', f'{session_path}/prev'
+    elif action < 0.95:
+        return 'POST', f'{session_path}/goto?position={rng.randint(1, card_count)}'
+    elif action < 0.96:
+        return 'POST', f'{session_path}/shuffle?on={rng.randint(0, 1)}'
+
+    return 'GET', f'{session_path}/search?q={urllib.parse.quote(rng.choice(SEARCH_QUERIES))}'
+
+async def runLearner(args, seed, latencies, errors):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+
+    try:
+        status, body = await sendRequest(reader, writer, 'POST', '/sessions', latencies)
+
+        if status != 200:
+            errors.append(status)
+            return
+
+        state = json.loads(body)
+        session_path = f'/sessions/{state["session"]}'
+
+        for i in range(args.requests):
+            status, body = await sendRequest(reader, writer, *getNextRequest(rng, session_path, state['count']), latencies)
+
+            if status != 200:
+                errors.append(status)
+
+        await sendRequest(reader, writer, 'DELETE', session_path, latencies)
+    finally:
+        writer.close()
+
+async def runLearners(args):
+    latencies = []
+    errors = []
+    time_started = time.perf_counter()
+    results = await asyncio.gather(*[runLearner(args, args.seed + i, latencies, errors) for i in range(args.learners)],
+                                   return_exceptions=True)
+    elapsed = time.perf_counter() - time_started
+    failed_learners = [result for result in results if isinstance(result, Exception)]
+
+    return latencies, errors, failed_learners, elapsed
+
+def waitForServer(host, port, process, timeout=120.0):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('The server exited before it was ready')
+
+        try:
+            with socket.create_connection((host, port), timeout=1.0):
+                return
+        except OSError:
+            time.sleep(0.1)
+
+    raise RuntimeError(f'The server did not come up within {timeout} seconds')
+
+def getLatencyStats(latencies):
+    latencies = sorted(latencies)
+
+    def percentile(share):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * share))]
+
+    return {'count': len(latencies), 'mean_ms': sum(latencies) / len(latencies) * 1000,
+            'p50_ms': percentile(0.5) * 1000, 'p90_ms': percentile(0.9) * 1000,
+            'p99_ms': percentile(0.99) * 1000, 'max_ms': latencies[-1] * 1000}
+
+def runLoadTest():
+    args = constructAndGetArgs()
+    server_process = None
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.spawn:
+            path_csv_deck = os.path.join(tmpdir, 'deck.csv')
+            writeSyntheticDeck(path_csv_deck, args.rows, 0.0, 0.5, args.seed)
+            server_process = subprocess.Popen([sys.executable, PATH_MAIN, '-p', path_csv_deck, '--no-deck-cache',
+                                               '--serve', f'{args.host}:{args.port}'], stdout=subprocess.DEVNULL)
+            waitForServer(args.host, args.port, server_process)
+
+        try:
+            latencies, errors, failed_learners, elapsed = asyncio.run(runLearners(args))
+        finally:
+            if server_process:
+                server_process.terminate()
+                server_process.wait()
+
+    if not latencies:
+        print(f'No request succeeded, e.g. {failed_learners[0] if failed_learners else "no learners"}')
+        return
+
+    stats = getLatencyStats(latencies)
+    stats.update({'learners': args.learners, 'seconds': elapsed, 'requests_per_s': len(latencies) / elapsed,
+                  'error_responses': len(errors), 'failed_learners': len(failed_learners)})
+
+    print(f'{args.learners} learners, {len(latencies)} requests in {elapsed:.2f}s ({stats["requests_per_s"]:.0f} requests/s)')
+    print(f'latency p50 {stats["p50_ms"]:.2f}ms  p90 {stats["p90_ms"]:.2f}ms  p99 {stats["p99_ms"]:.2f}ms  max {stats["max_ms"]:.2f}ms')
+    print(f'{len(errors)} error response(s), {len(failed_learners)} learner(s) failed')
+
+    if failed_learners:
+        print(f'e.g. {failed_learners[0]!r}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump(stats, f, indent=2)
+
+if __name__ == '__main__':
+    runLoadTest()
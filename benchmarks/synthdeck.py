@@ -0,0 +1,72 @@
+# Generator for synthetic decks in the format of cantonese_sampledeck.csv
+# Used by the benchmarks but can also be run on its own to get a deck
+# to play around with:
+#
+#     python3 benchmarks/synthdeck.py -o /tmp/deck.csv -n 100000 -d 0.1 -c 0.5
+
+import argparse
+import random
+
+JYUTPING_SYLLABLES = ['gai1', 'daan2', 'din6', 'si6', 'zuk1', 'kau4', 'haak3', 'teng1', 'aa3', 'zau1',
+                      'sik6', 'faan6', 'jam2', 'seoi2', 'hok6', 'saang1', 'ngo5', 'nei5', 'keoi5', 'hai6',
+                      'm4', 'goi1', 'zou2', 'san4', 'maai5', 'je5', 'gwong2', 'dung1', 'waa2', 'tin1']
+HANZI = ['雞', '蛋', '電', '視', '足', '球', '客', '廳', '亞', '洲', '食', '飯', '飲', '水', '學',
+         '生', '我', '你', '佢', '係', '唔', '該', '早', '晨', '買', '嘢', '廣', '東', '話', '天']
+ENGLISH_WORDS = ['egg', 'television', 'soccer', 'ball', 'living', 'room', 'Asia', 'to', 'eat', 'rice',
+                 'drink', 'water', 'student', 'I', 'you', 'he', 'is', 'not', 'thanks', 'morning',
+                 'buy', 'things', 'Cantonese', 'sky', 'big', 'small', 'red', 'green', 'house', 'car']
+
+def generateCard(rng, cjk_ratio):
+    wordcount = rng.randint(1, 4)
+    front = ' '.join(rng.choice(ENGLISH_WORDS) for i in range(wordcount))
+    syllable_indices = [rng.randrange(len(JYUTPING_SYLLABLES)) for i in range(rng.randint(1, 4))]
+    romanized = ' '.join(JYUTPING_SYLLABLES[i] for i in syllable_indices)
+
+    if rng.random() < cjk_ratio:
+        native = ''.join(HANZI[i] for i in syllable_indices)
+        back = f'{native}----{romanized}'
+    else:
+        back = romanized
+
+    return front, back
+
+def generateRows(rowcount, duplicate_ratio=0.0, cjk_ratio=0.5, seed=0, soundcount=5000):
+    # Yields (id, front, back, sound) tuples, the sounds are the files 1 to
+    # soundcount. Roughly duplicate_ratio of
+    # the rows repeat the front and romanized back of an earlier row
+    # (with a different native script half, which still counts as a
+    # duplicate), the rest get a unique number appended to the front.
+    rng = random.Random(seed)
+    generated = []
+
+    for _id in range(1, rowcount + 1):
+        if generated and rng.random() < duplicate_ratio:
+            front, back = rng.choice(generated)
+        else:
+            front, back = generateCard(rng, cjk_ratio)
+            front = f'{front} {_id}'
+            generated.append((front, back))
+
+        yield _id, front, back, str(rng.randint(1, soundcount))
+
+def writeSyntheticDeck(path, rowcount, duplicate_ratio=0.0, cjk_ratio=0.5, seed=0, soundcount=5000):
+    with open(path, 'w', encoding='utf8') as csvfile:
+        csvfile.write('id;front_content;back_content;front_sound_file_path\n')
+
+        for row in generateRows(rowcount, duplicate_ratio, cjk_ratio, seed, soundcount):
+            csvfile.write(';'.join(str(field) for field in row))
+            csvfile.write('\n')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", help="Path of the CSV to write", required=True)
+    parser.add_argument("-n", "--rows", type=int, default=10000, help="Number of cards", required=False)
+    parser.add_argument("-d", "--duplicate-ratio", type=float, default=0.0, help="Share of duplicate cards (0.0 - 1.0)", required=False)
+    parser.add_argument("-c", "--cjk-ratio", type=float, default=0.5, help="Share of cards with a CJK----romanized backside (0.0 - 1.0)", required=False)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random generator", required=False)
+    args = parser.parse_args()
+
+    writeSyntheticDeck(args.output, args.rows, args.duplicate_ratio, args.cjk_ratio, args.seed)
+
+if __name__ == '__main__':
+    main()
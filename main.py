@@ -10,50 +10,4030 @@ import random
 import platform
 import argparse
 import subprocess
+import queue
+import concurrent.futures
+import struct
+import hashlib
+import bisect
+import heapq
+import itertools
+import json
+import io
+import html
+import tempfile
+import cProfile
+import contextlib
+import mmap
+import secrets
+import signal
+import shutil
+import functools
+import importlib.util
+import urllib.parse
+from array import array
+from collections import deque, OrderedDict
 
-ffplay_pids = []
+def importLazily(name):
+    # The module gets loaded on first use. For the ones only some modes
+    # need (e.g. asyncio for --serve), so they do not slow down opening
+    # the window. A module that is already imported is used as it is.
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+asyncio = importLazily('asyncio')
+mimetypes = importLazily('mimetypes')
+sqlite3 = importLazily('sqlite3')
+multiprocessing = importLazily('multiprocessing')
+
+# Compiled deck cache that lives next to the CSV (<deck>.csv.tpfc)
+# Layout: header (see DECK_CACHE_HEADER), sound base path (utf8),
+# the id column (array 'q'), the sound prefix index column (array 'I'),
+# the sound state column (array 'B') and then the sound prefixes, front-, back- and soundfile columns
+# one after the other as one utf8 blob seperated by NUL characters
+DECK_CACHE_SUFFIX = '.tpfc'
+DECK_CACHE_MAGIC = b'TPFC'
+DECK_CACHE_VERSION = 3
+DECK_CACHE_HEADER = struct.Struct('<4sHQqI20sII')
+DECK_CACHE_FIELD_SEP = '\0'
+
+# Result of the last sound file existence check next to the CSV
+# (<deck>.csv.soundcheck): a hex key, the number of directories of the
+# checked sound files, the number of missing sound files, the
+# directories and the missing sound files, all seperated by NUL
+# characters. The checked sound states themselves are written into the
+# deck cache. The key covers the mtime of the deck cache, the sound
+# bundles and the mtimes of the directories: adding or removing a file
+# changes the mtime of its directory, so the check runs again then.
+SOUND_CHECK_SUFFIX = '.soundcheck'
+
+# What a card's sound file reference points to, resolved once while
+# loading the deck. SOUND_LOCAL is only a candidate until
+# checkSoundFilesExist() confirmed the file is there.
+SOUND_NONE = 0
+SOUND_URL = 1
+SOUND_LOCAL = 2
+SOUND_MISSING = 3
+SOUND_PLAYABLE = (SOUND_URL, SOUND_LOCAL)
+
+URL_REGEX = re.compile(r"(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’]))")
+
+# Search terms are lowercased words (e.g. English or Jyutping) and,
+# for runs of CJK characters, the single characters and their bigrams
+CJK_CHARACTERS = '\u2e80-\u9fff\uf900-\ufaff\uac00-\ud7af\U00020000-\U0002fa1f'
+CJK_REGEX = re.compile(f'[{CJK_CHARACTERS}]')
+SEARCH_TOKEN_REGEX = re.compile(f'[{CJK_CHARACTERS}]+|[^\\W_{CJK_CHARACTERS}]+')
+
+# Card texts get wrapped to the label's width in pixels ahead of time
+# (see TextLayoutCache): CJK characters one by one, everything else at spaces
+FLASHCARD_WRAPLENGTH = 450
+LAYOUT_TOKEN_REGEX = re.compile(f'[{CJK_CHARACTERS}]|[^\\s{CJK_CHARACTERS}]+|\\s+')
+
+# Near-duplicate detection (--near-duplicates): MinHash signatures of
+# NEAR_DUPLICATE_BINS values (one permutation hashing), split into LSH
+# bands whose row count depends on the similarity threshold. Cards
+# sharing a band are candidates, their exact Jaccard similarity decides.
+# A card gets compared with at most NEAR_DUPLICATE_BUCKET_SIZE earlier
+# cards per band, so a band many cards share cannot make it quadratic.
+NEAR_DUPLICATE_BINS = 48
+NEAR_DUPLICATE_SHINGLE_LENGTH = 3
+NEAR_DUPLICATE_BACKSIDE_SALT = 0x5bd1e995
+NEAR_DUPLICATE_BUCKET_SIZE = 8
+NEAR_DUPLICATE_SHINGLE_CACHE_SIZE = 16384
+NEAR_DUPLICATE_REPORT_LIMIT = 20
+# Tone digits are the ones right after the letters of a syllable
+# ('gai1'), other numbers like in 'rec1446758865' are kept
+ROMANIZED_TONE_REGEX = re.compile(r'(?<=[^\W\d_])[0-9](?!\d)')
+ROMANIZED_NOISE_REGEX = re.compile(r'[\W_]+')
+
+# Headless import (--import) of semicolon CSV, TSV and JSONL files.
+# The input is split into byte ranges of about IMPORT_CHUNK_SIZE that
+# end at a line break, so rows have to be single lines.
+IMPORT_CHUNK_SIZE = 4 * 1024 * 1024
+IMPORT_FORMATS = {'.csv': 'csv', '.tsv': 'tsv', '.txt': 'tsv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+# Rows looked at to tell whether the first column holds the card ids
+IMPORT_SAMPLE_ROWS = 100
+# Anki exports start with header lines like '#separator:tab' or '#deck column:3'
+ANKI_HEADER_REGEX = re.compile(r'#[A-Za-z][\w ]*:')
+CSV_HEADER = ['id', 'front_content', 'back_content', 'front_sound_file_path']
+ANKI_SOUND_REGEX = re.compile(r'\[sound:([^\]]+)\]')
+HTML_BREAK_REGEX = re.compile(r'(?i)<br\s*/?>|</?(?:div|p)\b[^>]*>')
+HTML_TAG_REGEX = re.compile(r'<[^>]+>')
+NATIVE_ROMANIZED_SEP_REGEX = re.compile(r'\s*-{3,}\s*')
+# A CJK part followed by its romanization, e.g. '雞蛋 gai1 daan2' or '雞蛋 (gai1 daan2)'
+NATIVE_ROMANIZED_REGEX = re.compile(f'^([{CJK_CHARACTERS}](?:[^A-Za-z]*[{CJK_CHARACTERS}])?)[\\s(（\\[]*([A-Za-z][^{CJK_CHARACTERS}]*?)[\\s)）\\]]*$')
+
+# Spaced repetition: append-only review log (<deck>.csv.reviews, one
+# 'seq;timestamp;card_id;grade' line per review) plus a binary snapshot
+# of all card states (<deck>.csv.srs) the log gets compacted into.
+# Snapshot layout: header (see SRS_SNAPSHOT_HEADER), then the columns
+# card id (array 'q'), repetitions (array 'I'), interval in days,
+# easiness factor and due timestamp (arrays 'd')
+SRS_LOG_SUFFIX = '.reviews'
+SRS_SNAPSHOT_SUFFIX = '.srs'
+SRS_SNAPSHOT_MAGIC = b'TPSR'
+SRS_SNAPSHOT_VERSION = 1
+SRS_SNAPSHOT_HEADER = struct.Struct('<4sHQI')
+SRS_GRADES = {'Again': 1, 'Hard': 3, 'Good': 4, 'Easy': 5}
+
+# Sound bundle: every local sound file a deck references packed into
+# one file next to the CSV (<deck>.csv.sounds), see SoundBundle.
+# Layout: header (see SOUND_BUNDLE_HEADER), the data offsets of all
+# sounds plus the end of the last one (array 'Q', relative to the start
+# of the data), the sound file names as found in the CSV as one utf8
+# blob seperated by NUL characters and then the sound data itself
+SOUND_BUNDLE_SUFFIX = '.sounds'
+SOUND_BUNDLE_MAGIC = b'TPSB'
+SOUND_BUNDLE_VERSION = 1
+SOUND_BUNDLE_HEADER = struct.Struct('<4sHII')
+
+# SQLite store a deck gets imported into for --disk-store (see DiskDeck)
+DISK_DECK_SUFFIX = '.sqlite'
+DISK_DECK_VERSION = 1
+
+# Seconds until the first flip after enabling auto flip/walk
+# and between two flips when only auto flip is enabled
+AUTOFLIP_INTERVAL = 4.0
+
+# Seconds between two checks whether the deck's CSV changed (--watch)
+DECK_WATCH_INTERVAL = 0.25
+
+# Seconds between two checks whether the deck finished loading
+DECK_LOAD_POLL_INTERVAL = 0.01
+
+# Seconds the search box waits for the next key before searching
+SEARCH_DEBOUNCE_INTERVAL = 0.05
+
+def getSimilarity(value):
+    # argparse type of --similarity, a Jaccard similarity in (0, 1]
+    try:
+        similarity = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value!r} is not a number')
+
+    if not 0 < similarity <= 1:
+        raise argparse.ArgumentTypeError(f'{value} is not greater than 0 and at most 1')
+
+    return similarity
 
 def constructAndGetArgs():
     parser = argparse.ArgumentParser()
-    parser.add_argument("-p", "--path-to-deck", help="Path to deck and also important for prepending path to sound file", required=False)
+    parser.add_argument("-p", "--path-to-deck", nargs='+', help="Path to one or more decks or directories of decks, sound files are looked up next to each deck. Several decks get loaded in parallel and merged into one", required=False)
     parser.add_argument("-f", "--font", help="Name of a font family installed on your system", required=False)
     parser.add_argument("-n", "--font-name", help="Name of a font installed on your system", required=False)
     parser.add_argument("-t", "--font-style", choices=['bold', 'normal'], help="bold or normal", required=False)
     parser.add_argument("-z", "--font-size", help="Well, the font size", required=False)
     parser.add_argument("-s", "--shuffle", action='store_true', help="If specified deck will be shuffled at start", required=False)
+    parser.add_argument("--seed", type=int, help="Seed for shuffling, the same seed gives the same order every time", required=False)
     parser.add_argument("-r", "--remove-duplicates", action='store_true', help="Remove duplicates before loading CSV into memory", required=False)
+    parser.add_argument("--near-duplicates", choices=['report', 'remove'], help="Find cards that are nearly the same (e.g. 'soccer ball/soccer' and 'soccer ball', or Jyutping that only differs in spacing or tone numbers) and report them or keep only the first card of each cluster", required=False)
+    parser.add_argument("--similarity", type=getSimilarity, default=0.8, help="Jaccard similarity of the normalized front and romanized back from which on --near-duplicates considers two cards the same (default: 0.8)", required=False)
     parser.add_argument("-l", "--fliptime", type=float, help="Time in seconds (may be a float) to flip a card.", required=False)
     parser.add_argument("-w", "--switchtime", type=float, help="Time in seconds (may be a float) to switch between two cards", required=False)
     parser.add_argument("-u", "--path-to-ffplay", help="Path to ffplay binary including the binary itself.", required=False)
+    parser.add_argument("--srs", action='store_true', help="Spaced repetition mode: grade each card after flipping it and get the next due card (SM-2). Reviews are stored next to the deck", required=False)
+    parser.add_argument("--watch", action='store_true', help="Watch the deck's CSV and apply changes to it while studying, without restarting (not together with --stream)", required=False)
+    parser.add_argument("--stream", action='store_true', help="Do not load the whole CSV at start: index it in the background and read cards only when they are shown (for very large decks, --remove-duplicates is not supported)", required=False)
+    parser.add_argument("--disk-store", action='store_true', help="Import the CSV once into an SQLite store next to it (<deck>.csv.sqlite) and read the cards from there when they are shown, memory use does not grow with the deck (for decks larger than RAM, --remove-duplicates and search are not supported)", required=False)
+    parser.add_argument("--prefetch-cards", type=int, default=5, help="Number of upcoming cards whose sound files get loaded in the background", required=False)
+    parser.add_argument("--sound-cache-mb", type=float, default=32.0, help="Memory budget in MB for prefetched sound files", required=False)
+    parser.add_argument("--profile", nargs='?', const='tpflashcards_profile.json', help="Record durations of deck loading, flipping, navigating and playing sounds and write them as JSON to the given path on exit (default: tpflashcards_profile.json)", required=False)
+    parser.add_argument("--profile-cprofile", help="Also run cProfile during the session and dump its stats to the given path on exit", required=False)
+    parser.add_argument("--serve", nargs='?', const='127.0.0.1:8080', metavar='HOST:PORT', help="Do not open a window but serve the deck to many learners over HTTP (JSON API, see FlashcardServer) on the given address (default: 127.0.0.1:8080)", required=False)
+    parser.add_argument("--pack-sounds", action='store_true', help="Do not open a window but pack every local sound file the deck references into one bundle next to it (<deck>.csv.sounds) and exit. Sounds then get played from the bundle", required=False)
+    parser.add_argument("--import", dest='import_path', metavar='INPUT', help="Do not open a window but convert INPUT (semicolon CSV, TSV or an Anki text export, or JSON lines) into the deck given with -p and exit. The cards get normalized (HTML, [sound:...] tags, 'native----romanized' backsides)", required=False)
+    parser.add_argument("--import-format", choices=['auto', 'csv', 'tsv', 'jsonl'], default='auto', help="Format of the --import input, auto goes by the file extension", required=False)
+    parser.add_argument("--import-to", choices=['csv', 'deck'], default='deck', help="Write only the deck CSV, or also its compiled deck cache so the first start does not have to parse it (default)", required=False)
+    parser.add_argument("--exit-after-first-card", action='store_true', help="Quit as soon as the first card is shown, for measuring the startup time (see benchmarks/bench_startup.py)", required=False)
+    parser.add_argument("--no-deck-cache", action='store_true', help="Always parse the CSV and do not read or write the compiled deck cache", required=False)
+
+    args = parser.parse_args()
+    return args
+
+@functools.lru_cache(maxsize=None)
+def findFfplay(system):
+    # In-process PATH lookup instead of a whereis pipeline,
+    # done once per session
+    path_ffplay = shutil.which('ffplay')
+
+    if path_ffplay:
+        return path_ffplay
+
+    return 'C:/ffmpeg/bin/ffplay.exe' if system == 'Windows' else '/usr/bin/ffplay'
+
+def isUrl(string):
+    return URL_REGEX.search(string) is not None
+
+def getFileDigest(path):
+    sha1 = hashlib.sha1()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+
+    return sha1.digest()
+
+def getFileStamp(file_stat):
+    # Changes when the file is written, and also when it is replaced
+    # within the mtime granularity of the file system
+    return file_stat.st_ino, file_stat.st_mtime_ns
+
+def readDeckCache(path_csv_deck, sndfile_basepath):
+    # Returns the already resolved deck from the cache
+    # or None if there is no cache or it is stale.
+    # Size and mtime of the CSV are checked first. Only if the mtime
+    # changed but the size did not the content hash decides.
+    path_cache = f'{path_csv_deck}{DECK_CACHE_SUFFIX}'
+
+    try:
+        csv_stat = os.stat(path_csv_deck)
+
+        with open(path_cache, 'rb') as cachefile:
+            data = cachefile.read()
+    except OSError:
+        return None
+
+    # A truncated or otherwise damaged cache is just stale,
+    # the CSV gets parsed again
+    try:
+        return parseDeckCache(path_csv_deck, path_cache, csv_stat, data, sndfile_basepath)
+    except (ValueError, struct.error):
+        return None
+
+def parseDeckCache(path_csv_deck, path_cache, csv_stat, data, sndfile_basepath):
+    # ValueError (UnicodeDecodeError included) or struct.error if the
+    # data is damaged, see readDeckCache()
+    if len(data) < DECK_CACHE_HEADER.size:
+        return None
+
+    magic, version, size, mtime_ns, basepath_len, digest, rowcount, prefixcount = DECK_CACHE_HEADER.unpack_from(data)
+
+    if magic != DECK_CACHE_MAGIC or version != DECK_CACHE_VERSION or size != csv_stat.st_size:
+        return None
+
+    offset = DECK_CACHE_HEADER.size
+
+    if data[offset:offset + basepath_len].decode('utf8') != (sndfile_basepath or ''):
+        return None
+
+    if mtime_ns != csv_stat.st_mtime_ns:
+        if digest != getFileDigest(path_csv_deck):
+            return None
+
+        # Only touched or copied: store the new mtime so the next
+        # start does not have to hash the CSV again
+        try:
+            with open(path_cache, 'r+b') as cachefile:
+                cachefile.write(DECK_CACHE_HEADER.pack(magic, version, size, csv_stat.st_mtime_ns, basepath_len, digest, rowcount, prefixcount))
+        except OSError:
+            pass
+
+    deck = Deck()
+    offset += basepath_len
+
+    if len(data) < offset + rowcount * (deck.ids.itemsize + deck.sound_prefix_indices.itemsize + deck.sound_states.itemsize):
+        return None
+
+    ids_len = rowcount * deck.ids.itemsize
+    deck.ids.frombytes(data[offset:offset + ids_len])
+    offset += ids_len
+    prefix_indices_len = rowcount * deck.sound_prefix_indices.itemsize
+    deck.sound_prefix_indices.frombytes(data[offset:offset + prefix_indices_len])
+    offset += prefix_indices_len
+    sound_states_len = rowcount * deck.sound_states.itemsize
+    deck.sound_states.frombytes(data[offset:offset + sound_states_len])
+    offset += sound_states_len
+
+    fields = data[offset:].decode('utf8').split(DECK_CACHE_FIELD_SEP)
+
+    if len(fields) != prefixcount + rowcount * 3:
+        return None
+
+    deck.sound_prefixes = fields[:prefixcount]
+    offset = prefixcount
+    deck.frontsides = fields[offset:offset + rowcount]
+    deck.backsides = fields[offset + rowcount:offset + 2 * rowcount]
+    deck.soundfiles = fields[offset + 2 * rowcount:]
+    deck.order = array('I', range(rowcount))
+
+    try:
+        deck.cache_stamp = getFileStamp(os.stat(path_cache))
+    except OSError:
+        pass
+
+    return deck
+
+def writeDeckCache(path_csv_deck, sndfile_basepath, deck):
+    # Fails silently: the cache is only an optimization and the
+    # CSV may live in a read-only directory
+    path_cache = f'{path_csv_deck}{DECK_CACHE_SUFFIX}'
+    path_cache_tmp = f'{path_cache}.tmp'
+    fields = deck.sound_prefixes + deck.frontsides + deck.backsides + deck.soundfiles
+    blob = DECK_CACHE_FIELD_SEP.join(fields)
+
+    # A NUL character inside a field would break the layout
+    if blob.count(DECK_CACHE_FIELD_SEP) != len(fields) - 1:
+        return False
+
+    try:
+        csv_stat = os.stat(path_csv_deck)
+        digest = getFileDigest(path_csv_deck)
+        basepath = (sndfile_basepath or '').encode('utf8')
+        header = DECK_CACHE_HEADER.pack(DECK_CACHE_MAGIC, DECK_CACHE_VERSION, csv_stat.st_size,
+                                        csv_stat.st_mtime_ns, len(basepath), digest, len(deck),
+                                        len(deck.sound_prefixes))
+
+        with open(path_cache_tmp, 'wb') as cachefile:
+            cachefile.write(header)
+            cachefile.write(basepath)
+            cachefile.write(deck.ids.tobytes())
+            cachefile.write(deck.sound_prefix_indices.tobytes())
+            cachefile.write(deck.sound_states.tobytes())
+            cachefile.write(blob.encode('utf8'))
+
+        os.replace(path_cache_tmp, path_cache)
+        deck.cache_stamp = getFileStamp(os.stat(path_cache))
+    except OSError:
+        return False
+
+    return True
+
+def writeDeckCacheSoundStates(path_csv_deck, deck):
+    # Overwrites the sound states in the deck cache the deck was read
+    # from or written to with the checked ones, in place. Returns the
+    # new stamp of the cache or None if the cache changed meanwhile.
+    path_cache = f'{path_csv_deck}{DECK_CACHE_SUFFIX}'
+
+    try:
+        with open(path_cache, 'r+b') as cachefile:
+            if getFileStamp(os.fstat(cachefile.fileno())) != deck.cache_stamp:
+                return None
+
+            magic, version, size, mtime_ns, basepath_len, digest, rowcount, prefixcount = \
+                DECK_CACHE_HEADER.unpack(cachefile.read(DECK_CACHE_HEADER.size))
+
+            if magic != DECK_CACHE_MAGIC or version != DECK_CACHE_VERSION or rowcount != len(deck):
+                return None
+
+            cachefile.seek(DECK_CACHE_HEADER.size + basepath_len + rowcount * (deck.ids.itemsize + deck.sound_prefix_indices.itemsize))
+            cachefile.write(deck.sound_states.tobytes())
+
+        return getFileStamp(os.stat(path_cache))
+    except (OSError, struct.error):
+        return None
+
+def readDeckCsv(path_csv_deck):
+    deck = Deck()
+
+    with open(path_csv_deck, 'r', encoding='utf8') as csvfile:
+        reader = csv.reader(csvfile, delimiter=';')
+
+        for row in reader:
+            # Skip CSV header and empty lines
+            if not row or row[0] == 'id':
+                continue
+
+            deck.appendCard(row[0], row[1], row[2], row[3])
+
+    return deck
+
+def classifySoundFiles(deck, sndfile_basepath):
+    # Decide once per card whether its sound file is a URL or a local
+    # file. The base path is stored only once as a sound prefix of the
+    # deck, every card that references a local file just points to it.
+    prefix_index = 0
+
+    if sndfile_basepath:
+        prefix = sndfile_basepath if sndfile_basepath.endswith('/') else f'{sndfile_basepath}/'
+        prefix_index = deck.getSoundPrefixIndex(prefix)
+
+    for index, soundfile in enumerate(deck.soundfiles):
+        if not soundfile:
+            deck.sound_states[index] = SOUND_NONE
+        elif isUrl(soundfile):
+            deck.sound_states[index] = SOUND_URL
+        else:
+            deck.sound_states[index] = SOUND_LOCAL
+            deck.sound_prefix_indices[index] = prefix_index
+
+    return deck
+
+def classifySoundFile(deck, index, sndfile_basepath, sound_reader=None):
+    # classifySoundFiles() plus the existence check for a single card,
+    # e.g. one that got added or changed after loading. Like in
+    # checkSoundFilesExist() a sound in a bundle of the sound_reader
+    # needs no stat.
+    soundfile = deck.soundfiles[index]
+    deck.sound_prefix_indices[index] = 0
+
+    if not soundfile:
+        deck.sound_states[index] = SOUND_NONE
+    elif isUrl(soundfile):
+        deck.sound_states[index] = SOUND_URL
+    else:
+        if sndfile_basepath:
+            prefix = sndfile_basepath if sndfile_basepath.endswith('/') else f'{sndfile_basepath}/'
+            deck.sound_prefix_indices[index] = deck.getSoundPrefixIndex(prefix)
+
+        sndfile = deck.getSoundfile(index)
+
+        if sound_reader and sound_reader.isBundled(sndfile):
+            sound_reader.stats_saved += 1
+            deck.sound_states[index] = SOUND_LOCAL
+        else:
+            deck.sound_states[index] = SOUND_LOCAL if os.path.exists(sndfile) else SOUND_MISSING
+
+def getSoundCheckKey(cache_stamp, sound_reader, directories):
+    # Changes when the deck cache got written again, a sound bundle
+    # changed or a file was added to or removed from one of the
+    # directories of the checked sound files
+    paths_bundle = [bundle.path_bundle for bundle in sound_reader.bundles] if sound_reader else []
+    sha1 = hashlib.sha1(f'{cache_stamp}\0{len(paths_bundle)}'.encode('utf8'))
+
+    for path in paths_bundle + directories:
+        try:
+            mtime_ns = os.stat(path or '.').st_mtime_ns
+        except OSError:
+            mtime_ns = -1
+
+        sha1.update(f'\0{path}\0{mtime_ns}'.encode('utf8', errors='surrogateescape'))
+
+    return sha1.hexdigest()
+
+def readSoundCheck(path_csv_deck, cache_stamp, sound_reader):
+    # The missing sound files of the last check or None if it is stale
+    try:
+        with open(f'{path_csv_deck}{SOUND_CHECK_SUFFIX}', 'r', encoding='utf8') as checkfile:
+            fields = checkfile.read().split(DECK_CACHE_FIELD_SEP)
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    # A write that got cut off has fewer fields
+    if len(fields) < 3 or not fields[1].isdigit() or not fields[2].isdigit() or len(fields) != int(fields[1]) + int(fields[2]) + 3:
+        return None
+
+    directory_count = int(fields[1])
+
+    if fields[0] != getSoundCheckKey(cache_stamp, sound_reader, fields[3:3 + directory_count]):
+        return None
+
+    return fields[3 + directory_count:]
+
+def writeSoundCheck(path_csv_deck, cache_stamp, sound_reader, directories, missing_sndfiles):
+    # Fails silently like writeDeckCache(). The deck usually lives in
+    # its sound directory: creating the file changes that directory's
+    # mtime, so the key is taken afterwards and the file is written in
+    # place (unlike a rename, rewriting a file leaves the mtime alone).
+    path_check = f'{path_csv_deck}{SOUND_CHECK_SUFFIX}'
+
+    try:
+        open(path_check, 'a').close()
+        key = getSoundCheckKey(cache_stamp, sound_reader, directories)
+
+        with open(path_check, 'w', encoding='utf8') as checkfile:
+            checkfile.write(DECK_CACHE_FIELD_SEP.join([key, str(len(directories)), str(len(missing_sndfiles))] + directories + missing_sndfiles))
+    except (OSError, UnicodeEncodeError):
+        pass
+
+def checkSoundFilesExist(deck, max_workers=16, sound_reader=None, path_csv_deck=None):
+    # Stat every local sound file once (in parallel, the media folder
+    # may well be on a network share) and mark the ones that are not
+    # there as missing. Returns a list of the missing paths.
+    # Sounds found in a bundle of the sound_reader need no stat at all.
+    # With path_csv_deck and a deck that came from (or was just written
+    # to) its deck cache, the checked sound states go into the cache
+    # and the result next to it. As long as nothing was added to or
+    # removed from the sound directories, the next start takes both
+    # from there and only stats those directories, no card is looked at.
+    use_sound_check = path_csv_deck is not None and deck.cache_stamp is not None
+
+    if use_sound_check:
+        missing_sndfiles = readSoundCheck(path_csv_deck, deck.cache_stamp, sound_reader)
+
+        if missing_sndfiles is not None:
+            return missing_sndfiles
+
+    local_indices = [index for index, state in enumerate(deck.sound_states) if state in (SOUND_LOCAL, SOUND_MISSING)]
+    sndfiles = sorted(set(deck.getSoundfile(index) for index in local_indices))
+    existing = {}
+
+    if sound_reader:
+        existing = {sndfile: True for sndfile in sndfiles if sound_reader.isBundled(sndfile)}
+        sound_reader.stats_saved += len(existing)
+
+    unbundled_sndfiles = [sndfile for sndfile in sndfiles if sndfile not in existing]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        existing.update(zip(unbundled_sndfiles, executor.map(os.path.exists, unbundled_sndfiles, chunksize=256)))
+
+    for index in local_indices:
+        deck.sound_states[index] = SOUND_LOCAL if existing[deck.getSoundfile(index)] else SOUND_MISSING
+
+    missing_sndfiles = [sndfile for sndfile in sndfiles if not existing[sndfile]]
+
+    if use_sound_check:
+        cache_stamp = writeDeckCacheSoundStates(path_csv_deck, deck)
+
+        if cache_stamp is not None:
+            deck.cache_stamp = cache_stamp
+            writeSoundCheck(path_csv_deck, cache_stamp, sound_reader, sorted(set(map(os.path.dirname, unbundled_sndfiles))), missing_sndfiles)
+
+    return missing_sndfiles
+
+def getDuplicateCheckKey(frontside_text, backside_text):
+    # Combine front and backside (only roman writing) to make a unique key
+    # If the backside holds a native writing system followed by '----'
+    # only the romanized half after the dashes is taken into account
+    # The two halves are joined by a NUL character so that e.g. 'a|' + 'b'
+    # and 'a' + '|b' do not end up as the same key
+    if backside_text.find('----') > 0:
+        backside_text = backside_text.split('----')[1]
+
+    return f'{frontside_text}\0{backside_text}'
+
+def findFirstOccurrenceIndices(deck):
+    # Single pass over the deck in its current order: remember every key
+    # we have seen in a set, the first occurrence of a card wins and all
+    # later ones are left out. Returns the positions of the cards to keep.
+    seen_keys = set()
+    indices_to_keep = []
+    frontsides = deck.frontsides
+    backsides = deck.backsides
+
+    for position, index in enumerate(deck.order):
+        check_key = getDuplicateCheckKey(frontsides[index], backsides[index])
+
+        if check_key in seen_keys:
+            continue
+
+        seen_keys.add(check_key)
+        indices_to_keep.append(position)
+
+    return indices_to_keep
+
+def keepAtPosition(order, value, position):
+    # Swap value back to position within the permutation order
+    cur_position = order.index(value)
+    order[cur_position] = order[position]
+    order[position] = value
+
+def shuffleDeck(deck, rng=random):
+    deck.shuffleCards(rng)
+
+    return deck
+
+def removeDuplicatesDeck(deck):
+    # Returns the number of removed cards
+    indices_to_keep = findFirstOccurrenceIndices(deck)
+    removed_count = len(deck) - len(indices_to_keep)
+    deck.keepCards(indices_to_keep)
+
+    return removed_count
+
+def getNearDuplicateShingles(frontside_text, backside_text):
+    # Hashes of the character shingles of the distinct front words and
+    # of the romanized backside (like getDuplicateCheckKey()) without
+    # spaces, punctuation and tone digits. So 'soccer ball/soccer' gets
+    # the same shingles as 'soccer ball' and 'gai1 daan2' as 'gaidaan'.
+    # [sound:...] tags are no text of the card, a card without any text
+    # has no shingles and is nobody's near-duplicate.
+    length = NEAR_DUPLICATE_SHINGLE_LENGTH
+    shingles = set()
+
+    if '[sound:' in frontside_text or '[sound:' in backside_text:
+        frontside_text = ANKI_SOUND_REGEX.sub(' ', frontside_text)
+        backside_text = ANKI_SOUND_REGEX.sub(' ', backside_text)
+
+    for word in set(SEARCH_TOKEN_REGEX.findall(frontside_text.lower())):
+        word = f' {word} '
+        shingles.update(hash(word[i:i + length]) for i in range(len(word) - length + 1))
+
+    if backside_text.find('----') > 0:
+        backside_text = backside_text.split('----')[1]
+
+    romanized = ROMANIZED_NOISE_REGEX.sub('', ROMANIZED_TONE_REGEX.sub('', backside_text.lower()))
+
+    if romanized:
+        romanized = f' {romanized} '
+        shingles.update(hash(romanized[i:i + length]) ^ NEAR_DUPLICATE_BACKSIDE_SALT for i in range(len(romanized) - length + 1))
+
+    return shingles
+
+def getDensificationProbes(bincount):
+    # For every bin a fixed pseudo-random order of the other bins it
+    # borrows its value from when it stays empty. Borrowing from the
+    # neighbour instead would make runs of empty bins all copy the
+    # same value, which makes unrelated short cards share bands.
+    rng = random.Random(bincount)
+
+    return [rng.sample([other for other in range(bincount) if other != bin_index], bincount - 1) for bin_index in range(bincount)]
+
+DENSIFICATION_PROBES = getDensificationProbes(NEAR_DUPLICATE_BINS)
+
+def getMinHashSignature(shingles, bincount=NEAR_DUPLICATE_BINS, probes=DENSIFICATION_PROBES):
+    # One permutation hashing: every shingle hash is used once, its low
+    # bits pick a bin that keeps the smallest of the remaining bits.
+    # Empty bins borrow from a filled bin (densification), so this is
+    # O(shingles + bins) instead of O(shingles * bins).
+    empty = 1 << 64
+    signature = [empty] * bincount
+
+    for shingle in shingles:
+        value, bin_index = divmod(shingle & 0xffffffffffffffff, bincount)
+
+        if value < signature[bin_index]:
+            signature[bin_index] = value
+
+    if shingles:
+        filled = signature[:]
+
+        for bin_index in [bin_index for bin_index, value in enumerate(filled) if value == empty]:
+            for other in probes[bin_index]:
+                value = filled[other]
+
+                if value != empty:
+                    signature[bin_index] = value
+                    break
+
+    return signature
+
+def getLshBandRows(threshold, bincount=NEAR_DUPLICATE_BINS):
+    # Rows per band: the most rows (the fewer dissimilar candidates)
+    # with which two cards of exactly the threshold similarity still
+    # share a band with a probability of at least 90%
+    rows = 1
+
+    for candidate_rows in range(1, bincount + 1):
+        if bincount % candidate_rows == 0 and 1 - (1 - threshold ** candidate_rows) ** (bincount // candidate_rows) >= 0.9:
+            rows = candidate_rows
+
+    return rows
+
+def getJaccardSimilarity(shingles, other_shingles):
+    if not shingles or not other_shingles:
+        return 0.0
+
+    intersection = len(shingles & other_shingles)
+
+    return intersection / (len(shingles) + len(other_shingles) - intersection)
+
+def findNearDuplicateClusters(deck, threshold):
+    # Groups the cards with a Jaccard similarity of at least threshold
+    # in roughly linear time: every card gets a MinHash signature, the
+    # band keys go into one array per band. Then, one band at a time,
+    # a dict buckets the cards by band key and every card gets checked
+    # exactly against the (at most NEAR_DUPLICATE_BUCKET_SIZE) earlier
+    # cards of its bucket, similar pairs get merged with union-find.
+    # Returns lists of column indices, the largest cluster first.
+    rows = getLshBandRows(threshold)
+    bandcount = NEAR_DUPLICATE_BINS // rows
+    band_keys = [array('q') for band in range(bandcount)]
+    frontsides = deck.frontsides
+    backsides = deck.backsides
+    # Two cards whose shingle counts differ too much cannot reach the
+    # threshold, they are skipped without looking at the shingles
+    shingle_counts = array('I')
+
+    for frontside_text, backside_text in zip(frontsides, backsides):
+        shingles = getNearDuplicateShingles(frontside_text, backside_text)
+        shingle_counts.append(len(shingles))
+        signature = getMinHashSignature(shingles)
+
+        for band, keys in enumerate(band_keys):
+            keys.append(hash(tuple(signature[band * rows:(band + 1) * rows])))
+
+    parents = array('I', range(len(frontsides)))
+
+    def findRoot(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+
+        return index
+
+    # The cards of crowded buckets get compared over and over
+    @functools.lru_cache(maxsize=NEAR_DUPLICATE_SHINGLE_CACHE_SIZE)
+    def getShingles(index):
+        return getNearDuplicateShingles(frontsides[index], backsides[index])
+
+    for keys in band_keys:
+        # Most band keys belong to a single card, those buckets are
+        # just its index until a second card comes along
+        buckets = {}
+
+        for index, key in enumerate(keys):
+            count = shingle_counts[index]
+
+            # Cards without shingles would all share every band
+            if not count:
+                continue
+
+            bucket = buckets.setdefault(key, index)
+
+            if bucket == index:
+                continue
+
+            if not isinstance(bucket, list):
+                bucket = buckets[key] = [bucket]
+
+            shingles = None
+
+            for other_index in bucket:
+                other_count = shingle_counts[other_index]
+
+                if min(count, other_count) < threshold * max(count, other_count):
+                    continue
+
+                root, other_root = findRoot(other_index), findRoot(index)
+
+                if root == other_root:
+                    continue
+
+                if shingles is None:
+                    shingles = getShingles(index)
+
+                similarity = getJaccardSimilarity(getShingles(other_index), shingles)
+
+                if similarity >= threshold:
+                    parents[max(root, other_root)] = min(root, other_root)
+
+            if len(bucket) < NEAR_DUPLICATE_BUCKET_SIZE:
+                bucket.append(index)
+
+    clusters = {}
+
+    for index in range(len(parents)):
+        root = findRoot(index)
+
+        if root != index:
+            clusters.setdefault(root, [root]).append(index)
+
+    return sorted(clusters.values(), key=len, reverse=True)
+
+def removeNearDuplicatesDeck(deck, clusters):
+    # Like removeDuplicatesDeck(): of every cluster the card that comes
+    # first in the current order is kept. Returns the number of removed cards.
+    cluster_of_index = {index: cluster_number for cluster_number, cluster in enumerate(clusters) for index in cluster}
+    seen_clusters = set()
+    positions_to_keep = []
+
+    for position, index in enumerate(deck.order):
+        cluster_number = cluster_of_index.get(index)
+
+        if cluster_number is not None:
+            if cluster_number in seen_clusters:
+                continue
+
+            seen_clusters.add(cluster_number)
+
+        positions_to_keep.append(position)
+
+    removed_count = len(deck) - len(positions_to_keep)
+    deck.keepCards(positions_to_keep)
+
+    return removed_count
+
+def handleNearDuplicates(deck, args, profiler):
+    # --near-duplicates report|remove, after the exact duplicate removal
+    with profiler.measure('load.near_dedup'):
+        clusters = findNearDuplicateClusters(deck, args.similarity)
+
+    card_count = sum(len(cluster) for cluster in clusters)
+    print(f'Found {len(clusters)} cluster(s) of near-duplicate cards ({card_count} card(s), similarity >= {args.similarity})')
+
+    if args.near_duplicates == 'report':
+        for cluster in clusters[:NEAR_DUPLICATE_REPORT_LIMIT]:
+            print('  ' + ' | '.join(f'{deck.ids[index]}: {deck.frontsides[index]} = {deck.backsides[index]}' for index in cluster))
+
+        if len(clusters) > NEAR_DUPLICATE_REPORT_LIMIT:
+            print(f'  ... and {len(clusters) - NEAR_DUPLICATE_REPORT_LIMIT} more cluster(s)')
+    else:
+        removed_count = removeNearDuplicatesDeck(deck, clusters)
+        print(f'Removed {removed_count} near-duplicate card(s), {len(deck)} card(s) left')
+
+class Flashcard():
+    # Lightweight view of one card of a Deck. The deck itself stores
+    # its cards column wise, Flashcard objects only get created for
+    # the cards that are actually shown.
+    __slots__ = ('id', 'frontside_labeltext', 'backside_labeltext', 'soundfile', 'sound_state', 'cur_side')
+
+    def __init__(self, _id, frontside_labeltext, backside_labeltext, soundfile, sound_state=SOUND_NONE):
+        # We assume the frontside holds the content you know
+        # such as your mother language
+        # The backside holds the stuff you want to learn, the foreign language
+        # There there is only one soundfile member
+        # because it should play what is on the backside (the foreign language)
+        self.id = int(_id)
+        self.frontside_labeltext = frontside_labeltext
+        self.backside_labeltext = backside_labeltext
+        self.soundfile = soundfile
+        self.sound_state = sound_state
+        self.cur_side = 'front'
+
+class Deck():
+    # Ordered container of flashcards with a cursor pointing
+    # at the current card. Positions handed in and out are 1-based
+    # just like the card counter shown to the user.
+    # All cursor movements are O(1).
+    #
+    # Cards are stored column wise: ids in a compact array, the texts
+    # in plain lists. Sound files keep their name as found in the CSV,
+    # the path to prepend (e.g. the sound base path) is stored once in
+    # sound_prefixes and every card only holds an index into it.
+    # sound_states holds the SOUND_* state of each card's sound file.
+    #
+    # The columns always stay in file order. The order cards are shown
+    # in is a separate permutation (order) of column indices, so
+    # shuffling and going back to file order never copy card data.
+    # Positions (cursor, __getitem__) refer to that order.
+
+    # A deck loaded in one go is always complete, see StreamingDeck
+    index_complete = True
+    # StreamingDeck and DiskDeck read cards only when they are shown and
+    # have no columns for the search index, SRS, DeckWatcher or the
+    # duplicate removal (keepCards()) to use
+    holds_columns = True
+
+    def __init__(self):
+        self.ids = array('q')
+        self.frontsides = []
+        self.backsides = []
+        self.soundfiles = []
+        self.sound_prefixes = ['']
+        self.sound_prefix_indices = array('I')
+        self.sound_states = array('B')
+        self.order = array('I')
+        self.positions = None
+        self.is_shuffled = False
+        self.cur_index = 0
+        # getFileStamp() of the deck cache the columns were read from or
+        # written to, see checkSoundFilesExist()
+        self.cache_stamp = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, position):
+        index = self.order[position]
+
+        return Flashcard(self.ids[index], self.frontsides[index], self.backsides[index],
+                         self.getSoundfile(index), self.sound_states[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def getCards(self, position, count):
+        # The cards at position and after it in the shown order,
+        # fewer at the end of the deck (for the DeckBrowser)
+        return [self[position] for position in range(position, min(position + count, len(self)))]
+
+    def appendCard(self, _id, frontside, backside, soundfile, sound_prefix_index=0, sound_state=SOUND_NONE):
+        self.ids.append(int(_id))
+        self.frontsides.append(frontside)
+        self.backsides.append(backside)
+        self.soundfiles.append(soundfile)
+        self.sound_prefix_indices.append(sound_prefix_index)
+        self.sound_states.append(sound_state)
+        self.order.append(len(self.order))
+        self.positions = None
+
+    def createView(self):
+        # Deck sharing the columns of this one with an own order and
+        # cursor, e.g. one per server session. The columns are shared
+        # read-only: reordering only ever replaces a view's order, but
+        # appendCard() on a view would change every deck sharing them.
+        view = Deck.__new__(Deck)
+        view.__dict__.update(self.__dict__)
+        view.cur_index = 0
+
+        return view
+
+    def getSoundPrefixIndex(self, prefix):
+        try:
+            return self.sound_prefixes.index(prefix)
+        except ValueError:
+            self.sound_prefixes.append(prefix)
+            return len(self.sound_prefixes) - 1
+
+    def getSoundfile(self, index):
+        return f'{self.sound_prefixes[self.sound_prefix_indices[index]]}{self.soundfiles[index]}'
+
+    def getLocalSoundfile(self, position):
+        # Path of the card's sound file if it is an existing local file
+        index = self.order[position]
+
+        if self.sound_states[index] != SOUND_LOCAL:
+            return None
+
+        return self.getSoundfile(index)
+
+    def keepCards(self, positions):
+        # Keep only the cards at the given positions in the given order
+        # The columns get compacted (still in file order) and the
+        # order is remapped to the new column indices
+        kept_indices = [self.order[position] for position in positions]
+        kept_indices_file_order = sorted(kept_indices)
+        new_indices = array('I', bytes(self.order.itemsize * len(self.ids)))
+
+        for new_index, index in enumerate(kept_indices_file_order):
+            new_indices[index] = new_index
+
+        self.ids = array('q', [self.ids[i] for i in kept_indices_file_order])
+        self.frontsides = [self.frontsides[i] for i in kept_indices_file_order]
+        self.backsides = [self.backsides[i] for i in kept_indices_file_order]
+        self.soundfiles = [self.soundfiles[i] for i in kept_indices_file_order]
+        self.sound_prefix_indices = array('I', [self.sound_prefix_indices[i] for i in kept_indices_file_order])
+        self.sound_states = array('B', [self.sound_states[i] for i in kept_indices_file_order])
+        self.order = array('I', [new_indices[i] for i in kept_indices])
+        self.positions = None
+        self.cur_index = 0
+
+    def removeCards(self, indices):
+        # Drop the cards in the given column indices. Unlike keepCards()
+        # the columns shrink in place, which is cheap for a few cards.
+        # The cursor is left to the caller.
+        removed = sorted(indices)
+
+        for index in reversed(removed):
+            for column in (self.ids, self.frontsides, self.backsides, self.soundfiles,
+                           self.sound_prefix_indices, self.sound_states):
+                del column[index]
+
+        if self.is_shuffled:
+            removed_set = set(removed)
+            self.order = array('I', [index - bisect.bisect_left(removed, index) for index in self.order if index not in removed_set])
+        else:
+            self.order = array('I', range(len(self.ids)))
+
+        self.positions = None
+
+    def shuffleCards(self, rng=random, keep_current=False):
+        # O(n) on the order only. With keep_current the card at the
+        # cursor stays where it is and only the others get shuffled
+        # around it, otherwise the cursor goes back to the first card.
+        # The order gets shuffled as a copy, views may share it
+        cur_index = self.order[self.cur_index] if len(self) else None
+        order = array('I', self.order)
+        rng.shuffle(order)
+        self.order = order
+        self.positions = None
+        self.is_shuffled = True
+
+        if keep_current and cur_index is not None:
+            keepAtPosition(self.order, cur_index, self.cur_index)
+        else:
+            self.cur_index = 0
+
+    def restoreFileOrder(self):
+        cur_index = self.order[self.cur_index] if len(self) else 0
+        self.order = array('I', range(len(self.ids)))
+        self.positions = None
+        self.is_shuffled = False
+        self.cur_index = cur_index
+
+    def getPositionOfCard(self, index):
+        # Position of the card in column index within the current order
+        # The inverse of the order is built once after every reordering
+        if self.positions is None:
+            positions = array('I', bytes(self.order.itemsize * len(self.order)))
+
+            for position, card_index in enumerate(self.order):
+                positions[card_index] = position
+
+            self.positions = positions
+
+        return self.positions[index]
+
+    def getCurrentCard(self):
+        if not len(self):
+            return None
+
+        return self[self.cur_index]
+
+    def getPosition(self):
+        return self.cur_index + 1
+
+    def moveCursorTo(self, index):
+        self.cur_index = index
+        return self[index]
+
+    def nextCard(self):
+        # Wraps around to the first card at the end of the deck
+        return self.moveCursorTo((self.cur_index + 1) % len(self))
+
+    def prevCard(self):
+        # Wraps around to the last card at the start of the deck
+        return self.moveCursorTo((self.cur_index - 1) % len(self))
+
+    def firstCard(self):
+        return self.moveCursorTo(0)
+
+    def lastCard(self):
+        return self.moveCursorTo(len(self) - 1)
+
+    def gotoCard(self, position):
+        if not 1 <= position <= len(self):
+            return None
+
+        return self.moveCursorTo(position - 1)
+
+class StreamingDeck(Deck):
+    # Deck backed by the memory-mapped CSV itself, for decks too big to
+    # parse up front. Only an index of the byte offsets where the rows
+    # start is kept in memory. It is built chunk by chunk: the first
+    # chunk right away so the first card can be shown, the rest in a
+    # background thread (len() grows meanwhile, index_complete tells
+    # when it is done). A card is parsed when the cursor reaches it and
+    # the last CACHED_CARDS of them are kept.
+    # Shuffling reorders a copy of the offset index once it is complete,
+    # file_offsets keeps the file order. Rows have to be single lines,
+    # i.e. no line breaks inside quoted fields.
+    INDEX_CHUNK_SIZE = 4 * 1024 * 1024
+    CACHED_CARDS = 1024
+    holds_columns = False
+
+    def __init__(self, path_csv_deck, sndfile_basepath, shuffle=False, rng=random):
+        super().__init__()
+        self.path_csv_deck = path_csv_deck
+        self.sound_prefix = ''
+        self.shuffle_when_indexed = shuffle
+        self.rng = rng
+        self.offsets = array('Q')
+        self.file_offsets = self.offsets
+        self.index_position = 0
+        self.index_complete = False
+        self.index_thread = None
+        self.cached_cards = OrderedDict()
+
+        if sndfile_basepath:
+            self.sound_prefix = sndfile_basepath if sndfile_basepath.endswith('/') else f'{sndfile_basepath}/'
+
+        with open(path_csv_deck, 'rb') as csvfile:
+            self.mm = mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        offsets = self.offsets
+
+        if index < 0:
+            index += len(offsets)
+
+        # Cards are cached by offset so shuffling does not invalidate them
+        offset = offsets[index]
+        flashcard = self.cached_cards.get(offset)
+
+        if flashcard is None:
+            flashcard = self.parseCard(offset)
+            self.cached_cards[offset] = flashcard
+
+            if len(self.cached_cards) > self.CACHED_CARDS:
+                self.cached_cards.popitem(last=False)
+        else:
+            self.cached_cards.move_to_end(offset)
+
+        return flashcard
+
+    def getLocalSoundfile(self, index):
+        flashcard = self[index]
+        return flashcard.soundfile if flashcard.sound_state == SOUND_LOCAL else None
+
+    def parseCard(self, offset):
+        end = self.mm.find(b'\n', offset)
+        end = len(self.mm) if end == -1 else end
+        line = self.mm[offset:end].decode('utf8').rstrip('\r')
+        row = next(csv.reader([line], delimiter=';'))
+        soundfile = row[3]
+        sound_state = SOUND_NONE
+
+        if not soundfile:
+            sound_state = SOUND_NONE
+        elif isUrl(soundfile):
+            sound_state = SOUND_URL
+        else:
+            soundfile = f'{self.sound_prefix}{soundfile}'
+            sound_state = SOUND_LOCAL if os.path.exists(soundfile) else SOUND_MISSING
+
+        return Flashcard(row[0], row[1], row[2], soundfile, sound_state)
+
+    def indexNextChunk(self):
+        # Returns False once the end of the file is reached
+        mm = self.mm
+        start = self.index_position
+
+        if start >= len(mm):
+            return False
+
+        # Chunks always end after a line break (or at the end of the file)
+        end = mm.rfind(b'\n', start, start + self.INDEX_CHUNK_SIZE)
+
+        if start + self.INDEX_CHUNK_SIZE >= len(mm):
+            end = len(mm)
+        elif end == -1:
+            # A single line longer than the chunk size
+            end = mm.find(b'\n', start + self.INDEX_CHUNK_SIZE)
+            end = len(mm) if end == -1 else end + 1
+        else:
+            end += 1
+
+        new_offsets = []
+        position = start
+
+        for line in mm[start:end].split(b'\n'):
+            # Skip CSV header and empty lines
+            if line.strip() and not line.startswith(b'id;'):
+                new_offsets.append(position)
+
+            position += len(line) + 1
+
+        self.offsets.extend(new_offsets)
+        self.index_position = end
+
+        return True
+
+    def indexRemainingChunks(self):
+        while self.indexNextChunk():
+            pass
+
+        if self.shuffle_when_indexed:
+            self.shuffleCards(self.rng, keep_current=True)
+
+        self.index_complete = True
+
+    def startIndexing(self):
+        # Index the first chunk right away so there is something to show
+        self.indexNextChunk()
+        self.index_thread = threading.Thread(target=self.indexRemainingChunks, name='StreamingDeckIndexer', daemon=True)
+        self.index_thread.start()
+
+    def shuffleCards(self, rng=random, keep_current=False):
+        # Until the index is complete just remember to shuffle afterwards
+        if not self.index_complete and threading.current_thread() is not self.index_thread:
+            self.shuffle_when_indexed = True
+            self.rng = rng
+            return
+
+        # Shuffle a copy and swap it in, the indexer and the UI
+        # never see a half shuffled index
+        cur_offset = self.offsets[self.cur_index] if len(self) else None
+        shuffled_offsets = array('Q', self.file_offsets)
+        rng.shuffle(shuffled_offsets)
+
+        if keep_current and cur_offset is not None:
+            keepAtPosition(shuffled_offsets, cur_offset, self.cur_index)
+        else:
+            self.cur_index = 0
+
+        self.offsets = shuffled_offsets
+        self.is_shuffled = True
+
+    def restoreFileOrder(self):
+        self.shuffle_when_indexed = False
+
+        if not self.is_shuffled:
+            return
+
+        cur_offset = self.offsets[self.cur_index]
+        self.offsets = self.file_offsets
+        self.is_shuffled = False
+        self.cur_index = self.offsets.index(cur_offset)
+
+class ShufflePermutation():
+    # Pseudo random permutation of range(count) that needs no memory
+    # per card, unlike shuffling an order array. A four round Feistel
+    # network shuffles the bits of a position within the smallest even
+    # power of two >= count, results outside the range are fed through
+    # again until they land inside (cycle walking, about twice on average).
+    # index() is the inverse, i.e. the position a card ended up at.
+    ROUNDS = 4
+
+    def __init__(self, count, rng=random):
+        self.count = count
+        bits = max(2, (count - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self.keys = [rng.getrandbits(32) for i in range(self.ROUNDS)]
+
+    def mix(self, value, key):
+        value = ((value ^ key) * 0x45d9f3b) & 0xffffffff
+        value = ((value ^ (value >> 16)) * 0x45d9f3b) & 0xffffffff
+
+        return (value ^ (value >> 16)) & self.half_mask
+
+    def encrypt(self, value):
+        left, right = value >> self.half_bits, value & self.half_mask
+
+        for key in self.keys:
+            left, right = right, left ^ self.mix(right, key)
+
+        return (left << self.half_bits) | right
+
+    def decrypt(self, value):
+        left, right = value >> self.half_bits, value & self.half_mask
+
+        for key in reversed(self.keys):
+            left, right = right ^ self.mix(left, key), left
+
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, position):
+        value = self.encrypt(position)
+
+        while value >= self.count:
+            value = self.encrypt(value)
+
+        return value
+
+    def index(self, value):
+        position = self.decrypt(value)
+
+        while position >= self.count:
+            position = self.decrypt(position)
+
+        return position
+
+class DiskDeck(Deck):
+    # Deck backed by an SQLite store next to the CSV (<deck>.csv.sqlite)
+    # for decks larger than the memory of the machine. The CSV gets
+    # imported once (again when it changed), the cards table has one
+    # row per card and its rowid is the card's position in file order
+    # plus one. Cards are fetched by position through an LRU cache of
+    # CACHED_CARDS cards, a miss reads the next PREFETCH_CARDS cards in
+    # the direction the learner is navigating with one query. The
+    # shuffled order is a ShufflePermutation, so memory use does not
+    # depend on the size of the deck. The store is opened in the deck
+    # loader thread and read from the Tk thread, so the connection is
+    # shared across threads, with a lock guarding it and the cache.
+    CACHED_CARDS = 1024
+    PREFETCH_CARDS = 64
+    IMPORT_BATCH_SIZE = 10000
+    holds_columns = False
+
+    def __init__(self, path_csv_deck, sndfile_basepath, sound_reader=None):
+        super().__init__()
+        self.path_csv_deck = path_csv_deck
+        self.path_store = f'{path_csv_deck}{DISK_DECK_SUFFIX}'
+        self.sound_prefix = ''
+        self.sound_reader = sound_reader
+        self.cached_cards = OrderedDict()
+        self.permutation = None
+        self.shift = 0
+        self.direction = 1
+        self.lock = threading.Lock()
+
+        if sndfile_basepath:
+            self.sound_prefix = sndfile_basepath if sndfile_basepath.endswith('/') else f'{sndfile_basepath}/'
+
+        self.connection = self.openStore()
+        self.count = self.connection.execute('SELECT value FROM meta WHERE key = ?', ('count',)).fetchone()[0]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += self.count
+
+        index = self.getCardIndex(position)
+
+        with self.lock:
+            flashcard = self.cached_cards.get(index)
+
+            if flashcard is None:
+                self.fetchCards(position)
+                flashcard = self.cached_cards[index]
+
+            self.cached_cards.move_to_end(index)
+
+        return flashcard
+
+    def getMeta(self, csv_stat):
+        return {'version': DISK_DECK_VERSION, 'size': csv_stat.st_size, 'mtime_ns': csv_stat.st_mtime_ns,
+                'sound_prefix': self.sound_prefix}
+
+    def openStore(self):
+        # The store is only used if it was imported from the CSV as it is
+        # now, with the same sound base path. Otherwise import it again.
+        csv_stat = os.stat(self.path_csv_deck)
+        expected_meta = self.getMeta(csv_stat)
+
+        if os.path.exists(self.path_store):
+            connection = sqlite3.connect(self.path_store, check_same_thread=False)
+
+            try:
+                meta = dict(connection.execute('SELECT key, value FROM meta'))
+            except sqlite3.DatabaseError:
+                meta = {}
+
+            if all(meta.get(key) == value for key, value in expected_meta.items()):
+                return connection
+
+            connection.close()
+
+        self.importCsv(csv_stat)
+
+        return sqlite3.connect(self.path_store, check_same_thread=False)
+
+    def readRows(self):
+        exists = {}
+
+        with open(self.path_csv_deck, 'r', encoding='utf8') as csvfile:
+            for row in csv.reader(csvfile, delimiter=';'):
+                # Skip CSV header and empty lines
+                if not row or row[0] == 'id':
+                    continue
+
+                soundfile = row[3]
+
+                if not soundfile:
+                    sound_state = SOUND_NONE
+                elif isUrl(soundfile):
+                    sound_state = SOUND_URL
+                else:
+                    # Bounded by the number of sound files, not of cards
+                    if soundfile not in exists:
+                        sndfile = f'{self.sound_prefix}{soundfile}'
+                        exists[soundfile] = ((self.sound_reader is not None and self.sound_reader.isBundled(sndfile))
+                                             or os.path.exists(sndfile))
+
+                    sound_state = SOUND_LOCAL if exists[soundfile] else SOUND_MISSING
+
+                yield int(row[0]), row[1], row[2], soundfile, sound_state
+
+    def importCsv(self, csv_stat):
+        # Written to a temp file in batches and renamed, an interrupted
+        # import leaves no half filled store behind
+        path_store_tmp = f'{self.path_store}.tmp'
+
+        if os.path.exists(path_store_tmp):
+            os.remove(path_store_tmp)
+
+        connection = sqlite3.connect(path_store_tmp)
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value)')
+        connection.execute('CREATE TABLE cards (id INTEGER, frontside TEXT, backside TEXT, soundfile TEXT, sound_state INTEGER)')
+        rows = self.readRows()
+        count = 0
+
+        while True:
+            batch = list(itertools.islice(rows, self.IMPORT_BATCH_SIZE))
+
+            if not batch:
+                break
+
+            connection.executemany('INSERT INTO cards VALUES (?, ?, ?, ?, ?)', batch)
+            count += len(batch)
+
+        meta = self.getMeta(csv_stat)
+        meta['count'] = count
+        connection.executemany('INSERT INTO meta VALUES (?, ?)', meta.items())
+        connection.commit()
+        connection.close()
+        os.replace(path_store_tmp, self.path_store)
+
+    def getCardIndex(self, position):
+        # File order index of the card at position in the current order
+        if self.permutation is None:
+            return position
+
+        return self.permutation[(position + self.shift) % self.count]
+
+    def getPositionOfCard(self, index):
+        if self.permutation is None:
+            return index
+
+        return (self.permutation.index(index) - self.shift) % self.count
+
+    def fetchCards(self, position):
+        # Read the card at position and the ones after it in navigation
+        # direction that are not cached yet, all in one query. Called
+        # with self.lock held
+        window = min(self.PREFETCH_CARDS, self.count)
+        positions = [(position + offset * self.direction) % self.count for offset in range(window)]
+        indices = [index for index in map(self.getCardIndex, positions) if index not in self.cached_cards]
+        self.cached_cards.update(self.readCards(indices))
+
+        # Prefetched cards count as least recently used, the wanted one gets
+        # moved to the end by __getitem__
+        while len(self.cached_cards) > self.CACHED_CARDS:
+            self.cached_cards.popitem(last=False)
+
+    def readCards(self, indices):
+        # {card index: Flashcard} of the given cards with one query,
+        # the caller holds self.lock
+        query = f'SELECT rowid, id, frontside, backside, soundfile, sound_state FROM cards WHERE rowid IN ({",".join("?" * len(indices))})'
+        flashcards = {}
+
+        for rowid, _id, frontside, backside, soundfile, sound_state in self.connection.execute(query, [index + 1 for index in indices]):
+            if sound_state in (SOUND_LOCAL, SOUND_MISSING):
+                soundfile = f'{self.sound_prefix}{soundfile}'
+
+            flashcards[rowid - 1] = Flashcard(_id, frontside, backside, soundfile, sound_state)
+
+        return flashcards
+
+    def getCards(self, position, count):
+        # A window of cards read with one query, they do not go into
+        # the cache of the cards around the shown one
+        indices = [self.getCardIndex(position) for position in range(position, min(position + count, self.count))]
+
+        with self.lock:
+            flashcards = self.readCards(indices)
+
+        return [flashcards[index] for index in indices]
+
+    def getLocalSoundfile(self, position):
+        flashcard = self[position]
+        return flashcard.soundfile if flashcard.sound_state == SOUND_LOCAL else None
+
+    def nextCard(self):
+        self.direction = 1
+        return super().nextCard()
+
+    def prevCard(self):
+        self.direction = -1
+        return super().prevCard()
+
+    def firstCard(self):
+        self.direction = 1
+        return super().firstCard()
+
+    def lastCard(self):
+        self.direction = -1
+        return super().lastCard()
+
+    def shuffleCards(self, rng=random, keep_current=False):
+        if not self.count:
+            return
+
+        cur_index = self.getCardIndex(self.cur_index)
+        self.permutation = ShufflePermutation(self.count, rng)
+        self.shift = 0
+
+        if keep_current:
+            # Rotate the new order so the current card stays where it is
+            self.shift = (self.permutation.index(cur_index) - self.cur_index) % self.count
+        else:
+            self.cur_index = 0
+
+        self.is_shuffled = True
+
+    def restoreFileOrder(self):
+        if not self.is_shuffled:
+            return
+
+        self.cur_index = self.getCardIndex(self.cur_index)
+        self.permutation = None
+        self.shift = 0
+        self.is_shuffled = False
+
+def getSearchTerms(text):
+    terms = []
+
+    for token in SEARCH_TOKEN_REGEX.findall(text.lower()):
+        if CJK_REGEX.match(token):
+            terms.extend(token)
+            terms.extend(token[i:i+2] for i in range(len(token) - 1))
+        else:
+            terms.append(token)
+
+    return terms
+
+def getQueryTerms(query):
+    # Returns (term, is_prefix) tuples. Words are matched as prefixes so
+    # results show up while typing and Jyutping matches without tone
+    # numbers ('gai' finds 'gai1'). A CJK run has to match as a whole,
+    # i.e. all of its bigrams (or the character itself) must be there.
+    query_terms = []
+
+    for token in SEARCH_TOKEN_REGEX.findall(query.lower()):
+        if not CJK_REGEX.match(token):
+            query_terms.append((token, True))
+        elif len(token) == 1:
+            query_terms.append((token, False))
+        else:
+            query_terms.extend((token[i:i+2], False) for i in range(len(token) - 1))
+
+    return query_terms
+
+def containsIndex(posting, index):
+    position = bisect.bisect_left(posting, index)
+    return position < len(posting) and posting[position] == index
+
+def containsIndexBetween(posting, index, start, end):
+    # containsIndex() within posting[start:end]
+    position = bisect.bisect_left(posting, index, start, end)
+    return position < end and posting[position] == index
+
+class SearchIndex():
+    # Inverted index over the front and back texts of a Deck.
+    # postings maps every search term to a sorted array of the column
+    # indices of the cards containing it, vocabulary is the sorted list
+    # of all terms for prefix lookups.
+    # A query walks the cards of the term with the fewest cards in
+    # blocks of MIN_BLOCK_SIZE to MAX_BLOCK_SIZE cards, sized by the
+    # share of cards that matched so far, and stops once enough results
+    # are found. The cards of a block still in question (a set) get
+    # intersected with the same range of card indices of every other
+    # term, shortest term first. Where that range holds more than
+    # SLICE_FACTOR times the cards left in the block, those get looked
+    # up by binary search instead. Prefixes of up to
+    # PREFIX_LENGTH characters, which expand to the most terms, have
+    # their postings merged into one posting (prefix_postings) while
+    # building, longer ones are searched in all postings they expand to.
+    MAX_RESULTS = 50
+    PREFIX_LENGTH = 2
+    MIN_BLOCK_SIZE = 64
+    MAX_BLOCK_SIZE = 4096
+    SLICE_FACTOR = 16
+
+    def __init__(self, deck):
+        self.deck = deck
+        self.postings = {}
+        self.vocabulary = []
+        self.prefix_postings = {}
+        self.ready = False
+
+    def getPrefixes(self, terms):
+        # Short prefixes of the (non CJK) terms of one card
+        return set(term[:length] for term in terms if not CJK_REGEX.match(term)
+                   for length in range(1, min(self.PREFIX_LENGTH, len(term)) + 1))
+
+    def build(self):
+        postings = {}
+        prefix_postings = {}
+
+        for index, (frontside_text, backside_text) in enumerate(zip(self.deck.frontsides, self.deck.backsides)):
+            terms = set(getSearchTerms(f'{frontside_text} {backside_text}'))
+
+            for term in terms:
+                posting = postings.get(term)
+
+                if posting is None:
+                    posting = postings[term] = array('I')
+
+                posting.append(index)
+
+            for prefix in self.getPrefixes(terms):
+                posting = prefix_postings.get(prefix)
+
+                if posting is None:
+                    posting = prefix_postings[prefix] = array('I')
+
+                posting.append(index)
+
+        self.postings = postings
+        self.prefix_postings = prefix_postings
+        self.vocabulary = sorted(postings)
+        self.ready = True
+
+    def buildInBackground(self):
+        threading.Thread(target=self.build, name='SearchIndex', daemon=True).start()
+
+    def addCard(self, index):
+        terms = set(getSearchTerms(f'{self.deck.frontsides[index]} {self.deck.backsides[index]}'))
+
+        for term in terms:
+            posting = self.postings.get(term)
+
+            if posting is None:
+                self.postings[term] = array('I', [index])
+                bisect.insort(self.vocabulary, term)
+            else:
+                bisect.insort(posting, index)
+
+        for prefix in self.getPrefixes(terms):
+            posting = self.prefix_postings.setdefault(prefix, array('I'))
+
+            if not containsIndex(posting, index):
+                bisect.insort(posting, index)
+
+    def removeCard(self, index, frontside_text, backside_text):
+        # Needs the texts the card had when it was added
+        terms = set(getSearchTerms(f'{frontside_text} {backside_text}'))
+
+        for prefix in self.getPrefixes(terms):
+            posting = self.prefix_postings.get(prefix)
+
+            if posting is not None and containsIndex(posting, index):
+                del posting[bisect.bisect_left(posting, index)]
+
+        for term in terms:
+            posting = self.postings.get(term)
+
+            if posting is None:
+                continue
+
+            if containsIndex(posting, index):
+                del posting[bisect.bisect_left(posting, index)]
+
+            if not posting:
+                del self.postings[term]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+
+    def getPostings(self, term, is_prefix):
+        if not is_prefix:
+            posting = self.postings.get(term)
+            return [posting] if posting else []
+
+        if len(term) <= self.PREFIX_LENGTH:
+            posting = self.prefix_postings.get(term)
+            return [posting] if posting else []
+
+        start = bisect.bisect_left(self.vocabulary, term)
+        end = bisect.bisect_left(self.vocabulary, f'{term}\U0010ffff')
+
+        return [self.postings[vocable] for vocable in self.vocabulary[start:end]]
+
+    def search(self, query, max_results=MAX_RESULTS):
+        # Returns the column indices of matching cards in file order
+        query_terms = getQueryTerms(query)
+
+        if not query_terms or not self.ready:
+            return []
+
+        # A word that starts with 'cantonese' also starts with 'c', so
+        # prefixes of other prefixes (and repeated terms) are left out
+        prefixes = [term for term, is_prefix in query_terms if is_prefix]
+        query_terms = set((term, is_prefix) for term, is_prefix in query_terms
+                          if not is_prefix or not any(other != term and other.startswith(term) for other in prefixes))
+        term_postings = sorted((self.getPostings(term, is_prefix) for term, is_prefix in query_terms),
+                               key=lambda postings: sum(map(len, postings)))
+        driver = term_postings[0]
+        # A single posting is cut into blocks directly, several get merged
+        candidates = None if len(driver) == 1 else heapq.merge(*driver)
+        block_size = self.MIN_BLOCK_SIZE
+        candidate_count = 0
+        results = []
+
+        while len(results) < max_results:
+            if candidates is None:
+                block = driver[0][candidate_count:candidate_count + block_size]
+            else:
+                block = list(itertools.islice(candidates, block_size))
+
+            if not block:
+                break
+
+            candidate_count += len(block)
+            low, high = block[0], block[-1]
+            # Merged prefix postings may contain a card more than once
+            matches = set(block)
+
+            for postings in term_postings[1:]:
+                ranges = [(posting, bisect.bisect_left(posting, low), bisect.bisect_right(posting, high)) for posting in postings]
+
+                if sum(end - start for posting, start, end in ranges) <= self.SLICE_FACTOR * len(matches):
+                    found = set()
+
+                    for posting, start, end in ranges:
+                        found.update(matches.intersection(posting[start:end]))
+
+                    matches = found
+                elif len(ranges) == 1:
+                    posting, start, end = ranges[0]
+                    bisect_left = bisect.bisect_left
+                    # containsIndexBetween() inlined: posting[end] is past
+                    # high anyway, and the modulo only wraps end == len
+                    matches = {index for index in matches
+                               if posting[bisect_left(posting, index, start, end) % len(posting)] == index}
+                else:
+                    matches = {index for index in matches
+                               if any(containsIndexBetween(posting, index, start, end) for posting, start, end in ranges)}
+
+                if not matches:
+                    break
+
+            results.extend(sorted(matches))
+            # Just enough candidates for the missing results at the
+            # rate they matched so far, twice as many if none did yet
+            missing_count = max_results - len(results)
+            block_size = (missing_count * candidate_count // len(results) + 1) if results else block_size * 2
+            block_size = max(self.MIN_BLOCK_SIZE, min(block_size, self.MAX_BLOCK_SIZE))
+
+        return results[:max_results]
+
+class ReviewLog():
+    # Append-only journal of grades. Writes are buffered and fsynced in
+    # batches (every SYNC_EVERY records or SYNC_INTERVAL seconds, and
+    # on close) instead of syncing each single review.
+    SYNC_EVERY = 32
+    SYNC_INTERVAL = 5.0
+
+    def __init__(self, path):
+        self.path = path
+        self.logfile = None
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def readRecords(self, after_seq=0):
+        # Yields (seq, timestamp, card_id, grade), skipping records that
+        # are already part of the snapshot and a torn last line
+        try:
+            logfile = open(self.path, 'r', encoding='utf8')
+        except OSError:
+            return
+
+        with logfile:
+            for line in logfile:
+                fields = line.rstrip('\n').split(';')
+
+                if len(fields) != 4 or not line.endswith('\n'):
+                    continue
+
+                try:
+                    seq, timestamp, card_id, grade = int(fields[0]), float(fields[1]), int(fields[2]), int(fields[3])
+                except ValueError:
+                    continue
+
+                if seq > after_seq:
+                    yield seq, timestamp, card_id, grade
+
+    def append(self, seq, timestamp, card_id, grade):
+        if self.logfile is None:
+            self.logfile = open(self.path, 'a', encoding='utf8')
+
+        self.logfile.write(f'{seq};{timestamp:.3f};{card_id};{grade}\n')
+        self.unsynced += 1
+
+        if self.unsynced >= self.SYNC_EVERY or time.monotonic() - self.last_sync >= self.SYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        if self.logfile is None or not self.unsynced:
+            return
+
+        self.logfile.flush()
+        os.fsync(self.logfile.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def truncate(self):
+        self.close()
+
+        with open(self.path, 'w', encoding='utf8') as logfile:
+            logfile.flush()
+            os.fsync(logfile.fileno())
+
+    def close(self):
+        self.sync()
+
+        if self.logfile is not None:
+            self.logfile.close()
+            self.logfile = None
+
+class SpacedRepetitionScheduler():
+    # SM-2 scheduling over the cards of a Deck.
+    # Card states live in arrays aligned with the deck's columns.
+    # Reviewed cards sit in a heap of (due, column index) so the next due
+    # card is found in O(log n); an entry whose due does not match the
+    # card's current due is outdated and dropped when it reaches the top.
+    # Cards never reviewed are handed out in deck order once nothing is due.
+    #
+    # On startup the snapshot is loaded and only the log records written
+    # after it are replayed. Once the log holds COMPACT_AFTER records it
+    # is compacted into a new snapshot and truncated.
+    COMPACT_AFTER = 10000
+    DAY = 24 * 60 * 60
+
+    def __init__(self, deck, path_csv_deck):
+        self.deck = deck
+        self.path_csv_deck = path_csv_deck
+        self.path_snapshot = f'{path_csv_deck}{SRS_SNAPSHOT_SUFFIX}'
+        self.review_log = ReviewLog(f'{path_csv_deck}{SRS_LOG_SUFFIX}')
+        card_count = len(deck.ids)
+        self.repetitions = array('I', bytes(4 * card_count))
+        self.intervals = array('d', bytes(8 * card_count))
+        self.easiness = array('d', [2.5]) * card_count
+        self.dues = array('d', bytes(8 * card_count))
+        self.due_heap = []
+        self.new_position = 0
+        self.last_seq = 0
+        self.log_records = 0
+        # States of cards that are not in the deck right now (e.g. removed
+        # as duplicates), kept so compaction does not lose them
+        self.orphan_states = {}
+
+    def load(self):
+        indices_by_id = {card_id: index for index, card_id in enumerate(self.deck.ids)}
+        self.loadSnapshot(indices_by_id)
+
+        for seq, timestamp, card_id, grade in self.review_log.readRecords(self.last_seq):
+            index = indices_by_id.get(card_id)
+            self.last_seq = seq
+            self.log_records += 1
+
+            if index is None:
+                self.gradeOrphan(card_id, grade, timestamp)
+            else:
+                self.applyGrade(index, grade, timestamp)
+
+        self.due_heap = [(due, index) for index, due in enumerate(self.dues) if due]
+        heapq.heapify(self.due_heap)
+
+        if self.log_records >= self.COMPACT_AFTER:
+            self.compact()
+
+    def loadSnapshot(self, indices_by_id):
+        try:
+            with open(self.path_snapshot, 'rb') as snapshotfile:
+                data = snapshotfile.read()
+        except OSError:
+            return
+
+        if len(data) < SRS_SNAPSHOT_HEADER.size:
+            return
+
+        magic, version, last_seq, count = SRS_SNAPSHOT_HEADER.unpack_from(data)
+
+        if magic != SRS_SNAPSHOT_MAGIC or version != SRS_SNAPSHOT_VERSION:
+            return
+
+        columns = [array('q'), array('I'), array('d'), array('d'), array('d')]
+        offset = SRS_SNAPSHOT_HEADER.size
+
+        for column in columns:
+            length = count * column.itemsize
+            column.frombytes(data[offset:offset + length])
+            offset += length
+
+        for card_id, repetitions, interval, easiness, due in zip(*columns):
+            index = indices_by_id.get(card_id)
+
+            if index is None:
+                self.orphan_states[card_id] = (repetitions, interval, easiness, due)
+                continue
+
+            self.repetitions[index] = repetitions
+            self.intervals[index] = interval
+            self.easiness[index] = easiness
+            self.dues[index] = due
+
+        self.last_seq = last_seq
+
+    def compact(self):
+        # Snapshot first (written to a temp file, synced, renamed), then
+        # truncate the log. Should we crash in between, the log records
+        # are skipped on the next start thanks to last_seq.
+        self.review_log.sync()
+        columns = [array('q'), array('I'), array('d'), array('d'), array('d')]
+
+        for index, due in enumerate(self.dues):
+            if due:
+                for column, value in zip(columns, (self.deck.ids[index], self.repetitions[index],
+                                                   self.intervals[index], self.easiness[index], due)):
+                    column.append(value)
+
+        for card_id, state in self.orphan_states.items():
+            for column, value in zip(columns, (card_id,) + state):
+                column.append(value)
+
+        path_snapshot_tmp = f'{self.path_snapshot}.tmp'
+
+        with open(path_snapshot_tmp, 'wb') as snapshotfile:
+            snapshotfile.write(SRS_SNAPSHOT_HEADER.pack(SRS_SNAPSHOT_MAGIC, SRS_SNAPSHOT_VERSION, self.last_seq, len(columns[0])))
+
+            for column in columns:
+                snapshotfile.write(column.tobytes())
+
+            snapshotfile.flush()
+            os.fsync(snapshotfile.fileno())
+
+        os.replace(path_snapshot_tmp, self.path_snapshot)
+        self.review_log.truncate()
+        self.log_records = 0
+
+    def getNextCardIndex(self, now=None):
+        # Column index of the card to study next: the most overdue
+        # reviewed card, else the next new card, else the card due soonest
+        now = time.time() if now is None else now
+        self.dropOutdatedHeapEntries()
+
+        if self.due_heap and self.due_heap[0][0] <= now:
+            return self.due_heap[0][1]
+
+        while self.new_position < len(self.deck):
+            index = self.deck.order[self.new_position]
+
+            if not self.dues[index]:
+                return index
+
+            self.new_position += 1
+
+        return self.due_heap[0][1] if self.due_heap else None
+
+    def dropOutdatedHeapEntries(self):
+        while self.due_heap and self.dues[self.due_heap[0][1]] != self.due_heap[0][0]:
+            heapq.heappop(self.due_heap)
+
+    def grade(self, index, grade, now=None):
+        now = time.time() if now is None else now
+        self.last_seq += 1
+        self.review_log.append(self.last_seq, now, self.deck.ids[index], grade)
+        self.log_records += 1
+        self.applyGrade(index, grade, now)
+        heapq.heappush(self.due_heap, (self.dues[index], index))
+
+        if self.log_records >= self.COMPACT_AFTER:
+            self.compact()
+
+    def applyGrade(self, index, grade, now):
+        self.repetitions[index], self.intervals[index], self.easiness[index], self.dues[index] = getNextSm2State(
+            self.repetitions[index], self.intervals[index], self.easiness[index], grade, now)
+
+    def addCards(self, count):
+        # For cards appended to the deck after loading. A card that was
+        # removed before gets its state back.
+        for index in range(len(self.repetitions), len(self.repetitions) + count):
+            repetitions, interval, easiness, due = self.orphan_states.pop(self.deck.ids[index], (0, 0.0, 2.5, 0.0))
+            self.repetitions.append(repetitions)
+            self.intervals.append(interval)
+            self.easiness.append(easiness)
+            self.dues.append(due)
+
+            if due:
+                heapq.heappush(self.due_heap, (due, index))
+
+    def gradeOrphan(self, card_id, grade, now):
+        repetitions, interval, easiness, due = self.orphan_states.get(card_id, (0, 0.0, 2.5, 0.0))
+        self.orphan_states[card_id] = getNextSm2State(repetitions, interval, easiness, grade, now)
+
+    def close(self):
+        self.review_log.close()
+
+def getNextSm2State(repetitions, interval, easiness, grade, now):
+    # SM-2: grades 0-5, below 3 starts the card over
+    if grade < 3:
+        repetitions = 0
+        interval = 1.0
+    else:
+        repetitions += 1
+
+        if repetitions == 1:
+            interval = 1.0
+        elif repetitions == 2:
+            interval = 6.0
+        else:
+            interval = round(interval * easiness)
+
+    easiness = max(1.3, easiness + (0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02)))
+    due = now + interval * SpacedRepetitionScheduler.DAY
+
+    return repetitions, interval, easiness, due
+
+def getSoundBasePath(path_csv_deck):
+    # Sound files in the CSV are relative to the deck's directory
+    return path_csv_deck[:path_csv_deck.rfind('/')]
+
+def loadDeck(path_csv_deck, sndfile_basepath, args, profiler, rng=random, sound_reader=None):
+    # Load the deck as the given command line args ask for,
+    # with every stage measured by the profiler
+    deck = None
+
+    if args.stream:
+        return loadStreamingDeck(path_csv_deck, sndfile_basepath, args, profiler, rng)
+
+    if args.disk_store:
+        return loadDiskDeck(path_csv_deck, sndfile_basepath, args, profiler, rng, sound_reader)
+
+    if not args.no_deck_cache:
+        with profiler.measure('load.cache_read'):
+            deck = readDeckCache(path_csv_deck, sndfile_basepath)
+
+    if deck is None:
+        # Reading the CSV includes building the deck's columns
+        with profiler.measure('load.csv_read'):
+            deck = readDeckCsv(path_csv_deck)
+
+        with profiler.measure('load.classify_sounds'):
+            deck = classifySoundFiles(deck, sndfile_basepath)
+
+        if not args.no_deck_cache:
+            with profiler.measure('load.cache_write'):
+                writeDeckCache(path_csv_deck, sndfile_basepath, deck)
+
+    with profiler.measure('load.sound_check'):
+        missing_sndfiles = checkSoundFilesExist(deck, sound_reader=sound_reader, path_csv_deck=None if args.no_deck_cache else path_csv_deck)
+
+    if missing_sndfiles:
+        print(f'{len(missing_sndfiles)} sound file(s) referenced by the deck are missing, e.g. {missing_sndfiles[0]}')
+
+    if args.shuffle:
+        with profiler.measure('load.shuffle'):
+            deck = shuffleDeck(deck, rng)
+
+    if args.remove_duplicates:
+        with profiler.measure('load.dedup'):
+            removed_count = removeDuplicatesDeck(deck)
+
+        print(f'Removed {removed_count} duplicate card(s), {len(deck)} card(s) left')
+
+    if args.near_duplicates:
+        handleNearDuplicates(deck, args, profiler)
+
+    return deck
+
+def loadStreamingDeck(path_csv_deck, sndfile_basepath, args, profiler, rng=random):
+    if args.remove_duplicates or args.near_duplicates:
+        print('--remove-duplicates and --near-duplicates are not supported together with --stream, keeping all cards')
+
+    with profiler.measure('load.stream_first_chunk'):
+        deck = StreamingDeck(path_csv_deck, sndfile_basepath, shuffle=args.shuffle, rng=rng)
+        deck.startIndexing()
+
+    return deck
+
+def getDeckPaths(paths):
+    # Every path may be a CSV or a directory of decks, the CSV files
+    # directly inside a directory get loaded (sorted by name)
+    paths_csv_deck = []
+
+    for path in paths or []:
+        if os.path.isdir(path):
+            paths_csv_deck.extend(sorted(os.path.join(path, filename) for filename in os.listdir(path)
+                                         if filename.lower().endswith('.csv') and os.path.isfile(os.path.join(path, filename))))
+        else:
+            paths_csv_deck.append(path)
+
+    return paths_csv_deck
+
+def loadDeckFile(path_csv_deck, use_deck_cache=True):
+    # One deck of a multi deck load with its own sound base path.
+    # Runs in a worker process, so it only gets and returns picklable
+    # data: the deck, its missing sound files, the seconds it took and
+    # whether it came from the cache.
+    time_started = time.perf_counter()
+    sndfile_basepath = getSoundBasePath(path_csv_deck)
+    deck = readDeckCache(path_csv_deck, sndfile_basepath) if use_deck_cache else None
+    from_cache = deck is not None
+
+    if deck is None:
+        deck = classifySoundFiles(readDeckCsv(path_csv_deck), sndfile_basepath)
+
+        if use_deck_cache:
+            writeDeckCache(path_csv_deck, sndfile_basepath, deck)
+
+    sound_reader = SoundReader.open([path_csv_deck])
+    missing_sndfiles = checkSoundFilesExist(deck, sound_reader=sound_reader, path_csv_deck=path_csv_deck if use_deck_cache else None)
+    sound_reader.close()
+
+    return deck, missing_sndfiles, time.perf_counter() - time_started, from_cache
+
+def mergeDecks(decks):
+    # Append the columns of all decks to one deck in the given order.
+    # Sound prefixes are merged, so every card keeps pointing to the
+    # base path of the deck it came from.
+    merged = Deck()
+
+    for deck in decks:
+        prefix_map = [merged.getSoundPrefixIndex(prefix) for prefix in deck.sound_prefixes]
+        merged.ids.extend(deck.ids)
+        merged.frontsides.extend(deck.frontsides)
+        merged.backsides.extend(deck.backsides)
+        merged.soundfiles.extend(deck.soundfiles)
+        merged.sound_states.extend(deck.sound_states)
+
+        if prefix_map == list(range(len(prefix_map))):
+            merged.sound_prefix_indices.extend(deck.sound_prefix_indices)
+        else:
+            merged.sound_prefix_indices.extend(array('I', map(prefix_map.__getitem__, deck.sound_prefix_indices)))
+
+    merged.order = array('I', range(len(merged.ids)))
+
+    return merged
+
+def getProcessPoolContext():
+    # Worker processes must not be forked from this process: its other
+    # threads (Tk, the deck loader, audio, prefetching) may hold locks
+    # that a forked child inherits locked. They get started from a
+    # clean forkserver process instead, or spawned where there is none.
+    return multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+def loadDecks(paths_csv_deck, args, profiler, rng=random, sound_reader=None):
+    # Load one or several decks as the given command line args ask for.
+    # A single deck goes through loadDeck() as always. Several decks get
+    # parsed in parallel worker processes (the largest first, so the
+    # whole load takes about as long as the largest deck) and merged into
+    # one deck, shuffling and duplicate removal then work across decks.
+    if len(paths_csv_deck) == 1:
+        return loadDeck(paths_csv_deck[0], getSoundBasePath(paths_csv_deck[0]), args, profiler, rng, sound_reader)
+
+    if args.stream or args.disk_store:
+        print('--stream and --disk-store are only supported for a single deck, loading all decks completely')
+
+    paths_by_size = sorted(paths_csv_deck, key=lambda path: os.path.getsize(path), reverse=True)
+    max_workers = min(len(paths_csv_deck), os.cpu_count() or 1)
+    results = {}
+
+    with profiler.measure('load.decks'):
+        if max_workers == 1:
+            # A single worker process would only add pickling
+            for path_csv_deck in paths_by_size:
+                results[path_csv_deck] = loadDeckFile(path_csv_deck, not args.no_deck_cache)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=getProcessPoolContext()) as executor:
+                futures = {path_csv_deck: executor.submit(loadDeckFile, path_csv_deck, not args.no_deck_cache)
+                           for path_csv_deck in paths_by_size}
+                results = {path_csv_deck: future.result() for path_csv_deck, future in futures.items()}
+
+    missing_sndfiles = []
+
+    for path_csv_deck in paths_csv_deck:
+        deck, deck_missing_sndfiles, elapsed, from_cache = results[path_csv_deck]
+        missing_sndfiles.extend(deck_missing_sndfiles)
+        profiler.record('load.deck_file', elapsed)
+        print(f'Loaded {len(deck)} card(s) from {path_csv_deck} in {elapsed * 1000:.1f}ms{" (cache)" if from_cache else ""}')
+
+    with profiler.measure('load.merge'):
+        deck = mergeDecks([results[path_csv_deck][0] for path_csv_deck in paths_csv_deck])
+
+    print(f'Merged {len(paths_csv_deck)} decks into {len(deck)} card(s)')
+
+    if missing_sndfiles:
+        print(f'{len(missing_sndfiles)} sound file(s) referenced by the decks are missing, e.g. {missing_sndfiles[0]}')
+
+    if args.shuffle:
+        with profiler.measure('load.shuffle'):
+            deck = shuffleDeck(deck, rng)
+
+    if args.remove_duplicates:
+        with profiler.measure('load.dedup'):
+            removed_count = removeDuplicatesDeck(deck)
+
+        print(f'Removed {removed_count} duplicate card(s) across the decks, {len(deck)} card(s) left')
+
+    if args.near_duplicates:
+        handleNearDuplicates(deck, args, profiler)
+
+    return deck
+
+def loadDiskDeck(path_csv_deck, sndfile_basepath, args, profiler, rng=random, sound_reader=None):
+    if args.remove_duplicates or args.near_duplicates:
+        print('--remove-duplicates and --near-duplicates are not supported together with --disk-store, keeping all cards')
+
+    with profiler.measure('load.disk_store'):
+        deck = DiskDeck(path_csv_deck, sndfile_basepath, sound_reader)
+
+    if args.shuffle:
+        deck.shuffleCards(rng)
+
+    return deck
+
+class DeckChanges():
+    # What DeckWatcher.reload() did to the deck. changed holds
+    # (column index, old front text, old back text) so derived indices
+    # can drop the old texts, added the column indices of new cards.
+    # After cards were removed (or with full_reload, when the whole
+    # deck had to be read again) column indices are no longer valid.
+    __slots__ = ('changed', 'added', 'removed_count', 'full_reload')
+
+    def __init__(self):
+        self.changed = []
+        self.added = []
+        self.removed_count = 0
+        self.full_reload = False
+
+    def __bool__(self):
+        return bool(self.changed or self.added or self.removed_count or self.full_reload)
+
+class DeckWatcher():
+    # Notices changes of the deck's CSV and patches the Deck in place.
+    # The file is remembered as blocks of about BLOCK_SIZE bytes (ending
+    # at line breaks), once counted from the start and once from the
+    # end, with a hash of each, plus the hash of every line and the card
+    # id on it (line_ids, -1 for the header and empty lines). On a
+    # change the blocks at the start and at the end that are still the
+    # same mark the unchanged prefix and suffix. Of the lines in between
+    # only those with a new hash get parsed. Cards are matched by id: a line with a known id changes
+    # that card, an unknown id adds a card (at the end of the order) and
+    # ids that are gone remove theirs. A line that is not a complete row
+    # (rows spanning several lines) makes it read the whole deck again.
+    # Cards dropped by --remove-duplicates come back once their row is
+    # edited, edited rows are not checked for duplicates again.
+    BLOCK_SIZE = 64 * 1024
+    COMPARE_CHUNK_SIZE = 1024
+
+    def __init__(self, deck, path_csv_deck, sndfile_basepath, sound_reader=None):
+        self.deck = deck
+        self.path_csv_deck = path_csv_deck
+        self.sndfile_basepath = sndfile_basepath
+        self.sound_reader = sound_reader
+        self.head_blocks = []
+        self.tail_blocks = []
+        self.line_hashes = array('q')
+        self.line_ids = array('q')
+        self.loaded_stat = None
+        self.pending_stat = None
+
+        data = self.readData()
+
+        if data is not None:
+            self.rememberLines(data)
+
+    def getFileStat(self):
+        try:
+            csv_stat = os.stat(self.path_csv_deck)
+        except OSError:
+            return None
+
+        return csv_stat.st_size, csv_stat.st_mtime_ns
+
+    def readData(self):
+        self.loaded_stat = self.getFileStat()
+
+        try:
+            with open(self.path_csv_deck, 'rb') as csvfile:
+                return csvfile.read()
+        except OSError:
+            return None
+
+    def rememberFile(self, data):
+        # Head blocks are (end, hash), tail blocks (distance of their
+        # start to the end of the file, hash)
+        block_size = self.BLOCK_SIZE
+        self.head_blocks = []
+        self.tail_blocks = []
+        start = 0
+
+        while start < len(data):
+            end = data.rfind(b'\n', start, start + block_size) + 1
+
+            if start + block_size >= len(data):
+                end = len(data)
+            elif end == 0:
+                # A single line longer than the block size
+                end = data.find(b'\n', start + block_size) + 1 or len(data)
+
+            self.head_blocks.append((end, hash(data[start:end])))
+            start = end
+
+        end = len(data)
+
+        while end > 0:
+            start = data.rfind(b'\n', 0, end - block_size) + 1 if end > block_size else 0
+            self.tail_blocks.append((len(data) - start, hash(data[start:end])))
+            end = start
+
+    def rememberLines(self, data):
+        lines = data.split(b'\n')
+        self.rememberFile(data)
+        self.line_hashes = array('q', map(hash, lines))
+        self.line_ids = self.getLineIds(lines)
+
+    def getLineIds(self, lines):
+        # Right after loading the deck's columns are in file order
+        card_ids = iter(self.deck.ids)
+        line_ids = array('q', [-1 if self.isHeaderOrEmpty(line) else next(card_ids, -1) for line in lines])
+
+        if next(card_ids, None) is None and line_ids.count(-1) == sum(map(self.isHeaderOrEmpty, lines)):
+            return line_ids
+
+        # Otherwise (e.g. duplicates were removed) read the ids off the lines
+        return array('q', map(self.getLineId, lines))
+
+    def isHeaderOrEmpty(self, line):
+        return not line.strip() or line.startswith(b'id;')
+
+    def getLineId(self, line):
+        # Cheap id of a line without parsing it, -1 if it holds no card
+        if self.isHeaderOrEmpty(line):
+            return -1
+
+        try:
+            return int(line.split(b';', 1)[0])
+        except ValueError:
+            return -1
+
+    def hasSettledChange(self):
+        # True once the file differs from what was loaded and did not
+        # change since the last call, so a file still being written
+        # is not read half way through
+        cur_stat = self.getFileStat()
+        settled = cur_stat is not None and cur_stat != self.loaded_stat and cur_stat == self.pending_stat
+        self.pending_stat = cur_stat
+
+        return settled
+
+    def reload(self):
+        changes = DeckChanges()
+        data = self.readData()
+
+        if data is None:
+            return changes
+
+        old_head_blocks, old_tail_blocks = self.head_blocks, self.tail_blocks
+        self.rememberFile(data)
+
+        # Unchanged prefix and suffix in bytes, they may not overlap
+        prefix_end = 0
+
+        for old_block, new_block in zip(old_head_blocks, self.head_blocks):
+            if old_block != new_block:
+                break
+
+            prefix_end = new_block[0]
+
+        suffix_length = 0
+        old_size = old_tail_blocks[-1][0] if old_tail_blocks else 0
+
+        for old_block, new_block in zip(old_tail_blocks, self.tail_blocks):
+            if old_block != new_block or min(len(data), old_size) - new_block[0] < prefix_end:
+                break
+
+            suffix_length = new_block[0]
+
+        # Same for the lines, as data.split(b'\n') would count them
+        prefix_lines = data.count(b'\n', 0, prefix_end)
+        suffix_lines = data.count(b'\n', len(data) - suffix_length) + 1 if suffix_length else 0
+        middle_lines = data[prefix_end:len(data) - suffix_length].split(b'\n')
+
+        if suffix_length:
+            del middle_lines[-1]
+
+        old_middle_end = len(self.line_ids) - suffix_lines
+        old_hashes = self.line_hashes[prefix_lines:old_middle_end]
+        new_hashes = array('q', map(hash, middle_lines))
+
+        if len(new_hashes) == len(old_hashes):
+            # Rows were only edited in place (the most common case): the
+            # lines still line up, compare them chunk by chunk
+            new_ids = self.line_ids[prefix_lines:old_middle_end]
+            changed_positions = []
+
+            for chunk_start in range(0, len(new_hashes), self.COMPARE_CHUNK_SIZE):
+                chunk_end = chunk_start + self.COMPARE_CHUNK_SIZE
+
+                if old_hashes[chunk_start:chunk_end] != new_hashes[chunk_start:chunk_end]:
+                    changed_positions.extend(position for position in range(chunk_start, min(chunk_end, len(new_hashes)))
+                                             if old_hashes[position] != new_hashes[position])
+
+            old_ids = set(new_ids[position] for position in changed_positions)
+        else:
+            # Lines that are still there (maybe moved) keep their id
+            ids_by_hash = dict(zip(old_hashes, self.line_ids[prefix_lines:old_middle_end]))
+            new_ids = array('q', map(ids_by_hash.get, new_hashes, itertools.repeat(-1)))
+            changed_positions = [position for position, line_hash in enumerate(new_hashes) if line_hash not in ids_by_hash]
+            old_ids = set(self.line_ids[prefix_lines:old_middle_end])
+
+        old_ids.discard(-1)
+        rows = {}
+
+        for position in changed_positions:
+            line = middle_lines[position]
+
+            if self.isHeaderOrEmpty(line):
+                new_ids[position] = -1
+                continue
+
+            row = next(csv.reader([line.decode('utf8').rstrip('\r')], delimiter=';'))
+
+            try:
+                card_id = int(row[0])
+            except ValueError:
+                card_id = None
+
+            if len(row) != 4 or card_id is None:
+                return self.reloadCompletely(data)
+
+            new_ids[position] = card_id
+            rows[card_id] = row
+
+        self.patchDeck(rows, old_ids.difference(new_ids), changes)
+        self.line_hashes = self.line_hashes[:prefix_lines] + new_hashes + self.line_hashes[old_middle_end:]
+        self.line_ids = self.line_ids[:prefix_lines] + new_ids + self.line_ids[old_middle_end:]
+
+        return changes
+
+    def reloadCompletely(self, data):
+        changes = DeckChanges()
+        changes.full_reload = True
+        cur_card_id = self.deck.ids[self.deck.order[self.deck.cur_index]] if len(self.deck) else None
+
+        # The session shuffles the new deck again if needed
+        self.deck = classifySoundFiles(readDeckCsv(self.path_csv_deck), self.sndfile_basepath)
+        checkSoundFilesExist(self.deck, sound_reader=self.sound_reader)
+        self.rememberLines(data)
+        self.moveCursorToCard(cur_card_id, 0)
+
+        return changes
+
+    def getColumnIndices(self, card_ids):
+        # A few ids are looked up directly, for more one pass over all ids
+        if len(card_ids) <= 16:
+            indices = {}
+
+            for card_id in card_ids:
+                try:
+                    indices[card_id] = self.deck.ids.index(card_id)
+                except ValueError:
+                    pass
+
+            return indices
+
+        return {card_id: index for index, card_id in enumerate(self.deck.ids) if card_id in card_ids}
+
+    def patchDeck(self, rows, removed_ids, changes):
+        deck = self.deck
+        indices = self.getColumnIndices(set(rows).union(removed_ids))
+
+        for card_id, row in rows.items():
+            index = indices.get(card_id)
+
+            if index is None:
+                deck.appendCard(card_id, row[1], row[2], row[3])
+                index = len(deck) - 1
+                changes.added.append(index)
+            elif (deck.frontsides[index], deck.backsides[index], deck.soundfiles[index]) == tuple(row[1:]):
+                # Only moved within the file
+                continue
+            else:
+                changes.changed.append((index, deck.frontsides[index], deck.backsides[index]))
+                deck.frontsides[index] = row[1]
+                deck.backsides[index] = row[2]
+                deck.soundfiles[index] = row[3]
+
+            classifySoundFile(deck, index, self.sndfile_basepath, self.sound_reader)
+
+        removed_indices = set(indices[card_id] for card_id in removed_ids if card_id in indices)
+
+        if removed_indices:
+            cur_index = deck.order[deck.cur_index]
+            cur_card_id = deck.ids[cur_index] if cur_index not in removed_indices else None
+            cur_position = deck.cur_index
+            deck.removeCards(removed_indices)
+            self.moveCursorToCard(cur_card_id, cur_position)
+            changes.removed_count = len(removed_indices)
+
+    def moveCursorToCard(self, card_id, fallback_position):
+        # Keep the cursor on the same card, or about where it was
+        deck = self.deck
+
+        if not len(deck):
+            deck.cur_index = 0
+            return
+
+        try:
+            deck.cur_index = deck.getPositionOfCard(deck.ids.index(card_id))
+        except ValueError:
+            deck.cur_index = min(fallback_position, len(deck) - 1)
+
+class FlashcardSession():
+    # What one learner does with a deck, independent of any UI:
+    # navigating, flipping, shuffling, searching, grading and which
+    # sound to play. Frontends (the Tk app, the server) call these and
+    # render cur_card. A session moves the cursor of its deck, so the
+    # server hands every session its own view of the shared deck
+    # (see Deck.createView()). Navigating returns the card now shown
+    # or None if the cursor did not move.
+    def __init__(self, deck, rng=random, search_index=None, srs_scheduler=None):
+        self.deck = deck
+        self.rng = rng
+        self.search_index = search_index
+        self.srs_scheduler = srs_scheduler
+        self.search_results = []
+        self.cur_card = None
+        self.showCard(deck.getCurrentCard())
+
+    def showCard(self, flashcard):
+        if flashcard:
+            flashcard.cur_side = 'front'
+            self.cur_card = flashcard
+
+        return flashcard
+
+    def flip(self):
+        if self.cur_card is None:
+            return None
+
+        self.cur_card.cur_side = 'back' if self.cur_card.cur_side == 'front' else 'front'
+        return self.cur_card
+
+    def getVisibleText(self):
+        if self.cur_card is None:
+            return 'No data loaded'
+
+        if self.cur_card.cur_side == 'front':
+            return self.cur_card.frontside_labeltext
+
+        return self.cur_card.backside_labeltext
+
+    def navigate(self, direction):
+        if not len(self.deck):
+            return None
+
+        if direction == 'forward':
+            return self.showCard(self.deck.nextCard())
+        elif direction == 'backward':
+            return self.showCard(self.deck.prevCard())
+        elif direction == 'jmp_end':
+            return self.showCard(self.deck.lastCard())
+        elif direction == 'jmp_start':
+            return self.showCard(self.deck.firstCard())
+
+        return None
+
+    def gotoPosition(self, position):
+        # 1-based, like the card counter
+        return self.showCard(self.deck.gotoCard(position))
+
+    def gotoCardIndex(self, index):
+        # Column index, e.g. of a search result or a due card
+        if not 0 <= index < len(self.deck):
+            return None
+
+        return self.gotoPosition(self.deck.getPositionOfCard(index) + 1)
+
+    def search(self, query):
+        self.search_results = self.search_index.search(query) if self.search_index else []
+        return self.search_results
+
+    def setShuffled(self, shuffled):
+        # Reshuffle or go back to file order, the current card stays current
+        if shuffled:
+            self.deck.shuffleCards(self.rng, keep_current=True)
+        else:
+            self.deck.restoreFileOrder()
+
+        if self.srs_scheduler:
+            # New cards are handed out in deck order, start over in the new one
+            self.srs_scheduler.new_position = 0
+
+    def grade(self, grade):
+        self.srs_scheduler.grade(self.deck.order[self.deck.cur_index], grade)
+        return self.showNextDueCard()
+
+    def showNextDueCard(self):
+        index = self.srs_scheduler.getNextCardIndex()
+
+        if index is None:
+            return None
+
+        return self.gotoCardIndex(index)
+
+    def applyDeckChanges(self, changes, deck):
+        # Bring the search index, the scheduler and the shown card up to
+        # date after DeckWatcher.reload() patched (or replaced) the deck
+        cur_card = self.cur_card
+
+        if changes.full_reload:
+            if self.deck.is_shuffled:
+                deck.shuffleCards(self.rng, keep_current=True)
+
+            self.deck = deck
+
+        if changes.full_reload or changes.removed_count:
+            # Column indices changed, build both from scratch
+            if self.search_index:
+                self.search_index = SearchIndex(self.deck)
+                self.search_index.buildInBackground()
+
+            if self.srs_scheduler:
+                self.srs_scheduler.close()
+                self.srs_scheduler = SpacedRepetitionScheduler(self.deck, self.srs_scheduler.path_csv_deck)
+                self.srs_scheduler.load()
+        else:
+            if self.search_index and not self.search_index.ready:
+                self.search_index = SearchIndex(self.deck)
+                self.search_index.buildInBackground()
+            elif self.search_index:
+                for index, frontside_text, backside_text in changes.changed:
+                    self.search_index.removeCard(index, frontside_text, backside_text)
+                    self.search_index.addCard(index)
+
+                for index in changes.added:
+                    self.search_index.addCard(index)
+
+            if self.srs_scheduler and changes.added:
+                self.srs_scheduler.addCards(len(changes.added))
+
+        # Show the new texts, on the same side if it is still the same card
+        self.showCard(self.deck.getCurrentCard())
+
+        if cur_card and self.cur_card and cur_card.id == self.cur_card.id:
+            self.cur_card.cur_side = cur_card.cur_side
+
+    def getSoundToPlay(self):
+        # Whether there is something to play was already
+        # decided while loading the deck, see checkSoundFilesExist()
+        flashcard = self.cur_card
+
+        if flashcard is not None and flashcard.cur_side == 'back' and flashcard.sound_state in SOUND_PLAYABLE:
+            return flashcard.soundfile
+
+        return None
+
+    def getCounterText(self):
+        # A '+' marks a deck that is still being indexed in the background
+        still_indexing = '' if self.deck.index_complete else '+'
+        return f'{self.deck.getPosition()}/{len(self.deck)}{still_indexing}'
+
+class Profiler():
+    # Records how long named hot paths take, e.g.
+    #
+    #     with self.profiler.measure('ui.flip'):
+    #         ...
+    #
+    # When profiling is off measure() hands out one shared no-op
+    # context manager, so the instrumentation costs next to nothing.
+    NULL_MEASUREMENT = contextlib.nullcontext()
+
+    def __init__(self, path_json=None, path_cprofile=None):
+        self.path_json = path_json
+        self.path_cprofile = path_cprofile
+        self.enabled = bool(path_json or path_cprofile)
+        self.durations = {}
+        self.lock = threading.Lock()
+        self.cprofile = None
+
+        if self.path_cprofile:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def measure(self, name):
+        if not self.enabled:
+            return self.NULL_MEASUREMENT
+
+        return ProfilerMeasurement(self, name)
+
+    def record(self, name, duration):
+        # May be called from worker threads (e.g. the audio player)
+        with self.lock:
+            self.durations.setdefault(name, []).append(duration)
+
+    def getStats(self):
+        stats = {}
+
+        with self.lock:
+            for name, durations in self.durations.items():
+                durations = sorted(durations)
+                stats[name] = {'count': len(durations), 'total_s': sum(durations),
+                               'mean_s': sum(durations) / len(durations),
+                               'p50_s': durations[len(durations) // 2],
+                               'p99_s': durations[min(len(durations) - 1, int(len(durations) * 0.99))],
+                               'max_s': durations[-1]}
+
+        return stats
+
+    def finish(self, extra=None):
+        # Write the results, extra is merged into the JSON as is.
+        # A path that cannot be written only costs the results,
+        # the app still has to close.
+        if self.cprofile:
+            self.cprofile.disable()
+
+            try:
+                self.cprofile.dump_stats(self.path_cprofile)
+            except OSError as e:
+                print(f'Could not write the cProfile stats to {self.path_cprofile}: {e}')
+
+            self.cprofile = None
+
+        if self.path_json:
+            results = {'stages': self.getStats()}
+            results.update(extra or {})
+
+            try:
+                with open(self.path_json, 'w', encoding='utf8') as f:
+                    json.dump(results, f, indent=2)
+            except OSError as e:
+                print(f'Could not write the profile to {self.path_json}: {e}')
+
+class ProfilerMeasurement():
+    __slots__ = ('profiler', 'name', 'time_started')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.time_started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name, time.perf_counter() - self.time_started)
+        return False
+
+class TextLayoutCache():
+    # Card texts wrapped to the label's width (with line breaks put in)
+    # for the font of the flashcards, so Tk does not have to find the
+    # line breaks of long texts while a card gets flipped. The app wraps
+    # the texts of the upcoming cards at idle time, showing them is a
+    # lookup then. Widths of words and characters are measured once.
+    # Only to be used from the Tk thread, measuring goes through Tk.
+    MAX_TEXTS = 4096
+    MAX_TOKENS = 65536
+
+    def __init__(self, font, width):
+        self.font = font
+        self.width = width
+        self.token_widths = {}
+        self.layouts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, text):
+        return text in self.layouts
+
+    def measure(self, token):
+        width = self.token_widths.get(token)
+
+        if width is None:
+            if len(self.token_widths) >= self.MAX_TOKENS:
+                self.token_widths.clear()
+
+            width = self.token_widths[token] = self.font.measure(token)
+
+        return width
+
+    def wrap(self, text):
+        # Greedy: a token that does not fit anymore starts the next line.
+        # A single word wider than the label stays on its own line and is
+        # left to Tk's own wrapping.
+        lines = []
+
+        for paragraph in text.split('\n'):
+            line = []
+            line_width = 0
+
+            for token in LAYOUT_TOKEN_REGEX.findall(paragraph):
+                is_space = token.isspace()
+
+                if not line and is_space:
+                    continue
+
+                width = self.measure(token)
+
+                if line and not is_space and line_width + width > self.width:
+                    lines.append(''.join(line).rstrip())
+                    line = []
+                    line_width = 0
+
+                line.append(token)
+                line_width += width
+
+            lines.append(''.join(line).rstrip())
+
+        return '\n'.join(lines)
+
+    def get(self, text):
+        layout = self.layouts.get(text)
+
+        if layout is None:
+            self.misses += 1
+            layout = self.prepare(text)
+        else:
+            self.hits += 1
+            self.layouts.move_to_end(text)
+
+        return layout
+
+    def prepare(self, text):
+        layout = self.layouts[text] = self.wrap(text)
+
+        if len(self.layouts) > self.MAX_TEXTS:
+            self.layouts.popitem(last=False)
+
+        return layout
+
+    def getStats(self):
+        return {'texts': len(self.layouts), 'hits': self.hits, 'misses': self.misses}
+
+class DeckBrowser():
+    # Window listing the cards of the deck in the shown order, clicking
+    # a row jumps the main window to that card. The Listbox only ever
+    # holds the VISIBLE_ROWS rows in view and the scrollbar is driven by
+    # hand, scrolling just moves top. Rows get rendered at idle time, so
+    # dragging the scrollbar renders once per redraw and not once per
+    # motion event. Their texts come from a cache of CACHED_ROWS rows
+    # that a miss fills with FETCH_ROWS rows around the visible ones at
+    # once (one query for a DiskDeck). Opening and scrolling cost the
+    # same no matter how large the deck is.
+    VISIBLE_ROWS = 25
+    FETCH_ROWS = 75
+    CACHED_ROWS = 300
+    MAX_TEXT_LENGTH = 100
+
+    def __init__(self, master, deck, on_select, on_close, profiler):
+        self.master = master
+        self.deck = deck
+        self.on_select = on_select
+        self.on_close = on_close
+        self.profiler = profiler
+        self.window = None
+        self.listbox = None
+        self.scrollbar = None
+        self.top = 0
+        self.cur_position = 0
+        self.rows = OrderedDict()
+        self.render_job = None
+        self.fetches = 0
+
+    def createWidgets(self):
+        self.window = tk.Toplevel(self.master)
+        self.window.title('Deck browser')
+        self.window.resizable(False, False)
+        self.window.protocol('WM_DELETE_WINDOW', self.on_close)
+
+        self.listbox = tk.Listbox(self.window, width=80, height=self.VISIBLE_ROWS, activestyle='none', exportselection=False)
+        self.listbox.bind('<<ListboxSelect>>', lambda event: self.onRowSelected())
+        self.listbox.pack(side='left')
+
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.listbox.bind(sequence, self.onMouseWheel)
+
+        self.listbox.bind('<Prior>', lambda event: self.scrollTo(self.top - self.VISIBLE_ROWS) or 'break')
+        self.listbox.bind('<Next>', lambda event: self.scrollTo(self.top + self.VISIBLE_ROWS) or 'break')
+
+        self.scrollbar = tk.Scrollbar(self.window, orient=tk.VERTICAL, command=self.onScrollbar)
+        self.scrollbar.pack(side='right', fill='y')
+
+    def isOpen(self):
+        return self.window is not None and self.window.state() != 'withdrawn'
+
+    def open(self):
+        if self.window is None:
+            self.createWidgets()
+        else:
+            self.window.deiconify()
+
+        self.showPosition(self.cur_position)
+
+    def close(self):
+        if self.window is not None:
+            self.window.withdraw()
+
+    def setDeck(self, deck):
+        # DeckWatcher may hand over a new deck
+        self.deck = deck
+        self.refresh()
+
+    def refresh(self):
+        # The order of the cards changed (e.g. shuffled), cached rows are stale
+        self.rows.clear()
+        self.scheduleRender()
+
+    def showPosition(self, position):
+        # Highlight the card shown in the main window (0-based position)
+        # and scroll it into view if it is not
+        self.cur_position = position
+
+        if position < self.top:
+            self.scrollTo(position)
+        elif position >= self.top + self.VISIBLE_ROWS:
+            self.scrollTo(position - self.VISIBLE_ROWS + 1)
+        else:
+            self.scheduleRender()
+
+    def scrollTo(self, top):
+        self.top = max(0, min(top, len(self.deck) - self.VISIBLE_ROWS))
+        self.scheduleRender()
+
+    def onScrollbar(self, command, *args):
+        # ('moveto', fraction) while dragging, ('scroll', count, 'units' or 'pages') for the arrows and the trough
+        if command == 'moveto':
+            self.scrollTo(int(float(args[0]) * len(self.deck)))
+        elif command == 'scroll':
+            self.scrollTo(self.top + int(args[0]) * (self.VISIBLE_ROWS if args[1] == 'pages' else 1))
+
+    def onMouseWheel(self, event):
+        # Button-4/5 on X11, MouseWheel with a signed delta elsewhere
+        self.scrollTo(self.top + (-3 if event.num == 4 or event.delta > 0 else 3))
+
+        return 'break'
+
+    def onRowSelected(self):
+        selection = self.listbox.curselection()
+
+        if selection and self.top + selection[0] < len(self.deck):
+            self.on_select(self.top + selection[0])
+
+    def scheduleRender(self):
+        if self.render_job is None and self.isOpen():
+            self.render_job = self.window.after_idle(self.render)
+
+    def cancelRender(self):
+        if self.render_job is not None:
+            self.window.after_cancel(self.render_job)
+            self.render_job = None
+
+    def getRowText(self, position, flashcard):
+        text = f'{position + 1}. {flashcard.frontside_labeltext} - {flashcard.backside_labeltext}'
+
+        return text if len(text) <= self.MAX_TEXT_LENGTH else f'{text[:self.MAX_TEXT_LENGTH - 3]}...'
+
+    def getRowTexts(self, top, count):
+        if any(position not in self.rows for position in range(top, top + count)):
+            # A screen above and below the visible rows as well, so
+            # scrolling on does not read the deck row by row
+            start = max(0, top - (self.FETCH_ROWS - count) // 2)
+            self.fetches += 1
+
+            for position, flashcard in enumerate(self.deck.getCards(start, self.FETCH_ROWS), start):
+                self.rows[position] = self.getRowText(position, flashcard)
+                self.rows.move_to_end(position)
+
+            while len(self.rows) > self.CACHED_ROWS:
+                self.rows.popitem(last=False)
+
+        return [self.rows[position] for position in range(top, top + count)]
+
+    def render(self):
+        self.render_job = None
+        # The deck may have shrunk since scrolling
+        self.top = max(0, min(self.top, len(self.deck) - self.VISIBLE_ROWS))
+        count = max(0, min(self.VISIBLE_ROWS, len(self.deck) - self.top))
+
+        with self.profiler.measure('ui.browser_render'):
+            self.listbox.delete(0, tk.END)
+
+            if count:
+                self.listbox.insert(tk.END, *self.getRowTexts(self.top, count))
+
+            if self.top <= self.cur_position < self.top + count:
+                self.listbox.selection_set(self.cur_position - self.top)
+
+            if len(self.deck):
+                self.scrollbar.set(self.top / len(self.deck), (self.top + count) / len(self.deck))
+            else:
+                self.scrollbar.set(0, 1)
+
+    def getStats(self):
+        return {'cached_rows': len(self.rows), 'fetches': self.fetches}
+
+class SoundCache():
+    # Thread-safe LRU cache of sound file contents bounded by a byte budget
+    # Counts hits and misses of get() so it can be checked whether the
+    # prefetching keeps up with flipping
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.cur_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, sndfile):
+        with self.lock:
+            return sndfile in self.entries
+
+    def touch(self, sndfile):
+        # Mark a cached sound as recently used without counting a hit
+        with self.lock:
+            if sndfile not in self.entries:
+                return False
+
+            self.entries.move_to_end(sndfile)
+            return True
+
+    def get(self, sndfile):
+        with self.lock:
+            data = self.entries.get(sndfile)
+
+            if data is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(sndfile)
+            self.hits += 1
+            return data
+
+    def put(self, sndfile, data):
+        if len(data) > self.max_bytes:
+            return False
+
+        with self.lock:
+            old_data = self.entries.pop(sndfile, None)
+
+            if old_data is not None:
+                self.cur_bytes -= len(old_data)
+
+            self.entries[sndfile] = data
+            self.cur_bytes += len(data)
+
+            # Evict least recently used sounds until we are within budget
+            while self.cur_bytes > self.max_bytes:
+                evicted_sndfile, evicted_data = self.entries.popitem(last=False)
+                self.cur_bytes -= len(evicted_data)
+
+        return True
+
+    def getStats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries),
+                    'bytes': self.cur_bytes, 'max_bytes': self.max_bytes}
+
+def writeSoundBundle(path_csv_deck, deck):
+    # Pack every existing local sound file of the deck that lives below
+    # the deck's own sound base path into <deck>.csv.sounds. Written to
+    # a temp file and renamed. Returns the number of packed sounds and
+    # their total size in bytes.
+    prefix = f'{getSoundBasePath(path_csv_deck)}/'
+    prefix_index = deck.getSoundPrefixIndex(prefix)
+    names = sorted(set(deck.soundfiles[index] for index, state in enumerate(deck.sound_states)
+                       if state == SOUND_LOCAL and deck.sound_prefix_indices[index] == prefix_index))
+    names = [name for name in names if DECK_CACHE_FIELD_SEP not in name]
+    offsets = array('Q', [0])
+
+    for name in names:
+        offsets.append(offsets[-1] + os.path.getsize(f'{prefix}{name}'))
+
+    path_bundle = f'{path_csv_deck}{SOUND_BUNDLE_SUFFIX}'
+    path_bundle_tmp = f'{path_bundle}.tmp'
+    names_blob = DECK_CACHE_FIELD_SEP.join(names).encode('utf8')
+
+    with open(path_bundle_tmp, 'wb') as bundlefile:
+        bundlefile.write(SOUND_BUNDLE_HEADER.pack(SOUND_BUNDLE_MAGIC, SOUND_BUNDLE_VERSION, len(names), len(names_blob)))
+        bundlefile.write(offsets.tobytes())
+        bundlefile.write(names_blob)
+
+        for name, size in zip(names, (offsets[i + 1] - offsets[i] for i in range(len(names)))):
+            with open(f'{prefix}{name}', 'rb') as sndfile:
+                data = sndfile.read()
+
+            # The offsets are already written, a file must not change in between
+            if len(data) != size:
+                raise OSError(f'{prefix}{name} changed while packing')
+
+            bundlefile.write(data)
+
+    os.replace(path_bundle_tmp, path_bundle)
+
+    return len(names), offsets[-1]
+
+class SoundBundle():
+    # Read-only view of a sound bundle written by writeSoundBundle().
+    # The file is memory-mapped, playing a sound is a slice of the map
+    # instead of a directory lookup and an open() of a tiny file.
+    # Sound files are looked up by their full path as the deck resolves
+    # it, i.e. the deck's sound base path (prefix) plus the name.
+    def __init__(self, path_bundle, prefix):
+        self.path_bundle = path_bundle
+        self.prefix = prefix
+
+        with open(path_bundle, 'rb') as bundlefile:
+            self.mmap = mmap.mmap(bundlefile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, names_len = SOUND_BUNDLE_HEADER.unpack_from(self.mmap)
+
+        if magic != SOUND_BUNDLE_MAGIC or version != SOUND_BUNDLE_VERSION:
+            self.mmap.close()
+            raise ValueError(f'{path_bundle} is not a sound bundle of this version')
+
+        offset = SOUND_BUNDLE_HEADER.size
+        self.offsets = array('Q')
+        self.offsets.frombytes(self.mmap[offset:offset + (count + 1) * self.offsets.itemsize])
+        offset += len(self.offsets) * self.offsets.itemsize
+        names = self.mmap[offset:offset + names_len].decode('utf8').split(DECK_CACHE_FIELD_SEP) if count else []
+        self.data_start = offset + names_len
+        self.indices = {name: index for index, name in enumerate(names)}
+
+    def __len__(self):
+        return len(self.indices)
+
+    def getIndex(self, sndfile):
+        if not sndfile.startswith(self.prefix):
+            return None
+
+        return self.indices.get(sndfile[len(self.prefix):])
+
+    def read(self, index):
+        return self.mmap[self.data_start + self.offsets[index]:self.data_start + self.offsets[index + 1]]
+
+    def close(self):
+        self.mmap.close()
+
+def openSoundBundle(path_csv_deck):
+    # The deck's sound bundle or None if it has none (or a broken one)
+    try:
+        return SoundBundle(f'{path_csv_deck}{SOUND_BUNDLE_SUFFIX}', f'{getSoundBasePath(path_csv_deck)}/')
+    except (OSError, ValueError, struct.error):
+        return None
+
+class SoundReader():
+    # Reads sound files from the sound bundles of the loaded decks and
+    # falls back to the loose files for decks without a bundle or sounds
+    # that are not in it. Counts both, so the profile shows how many
+    # opens (and existence stats while loading) the bundles saved.
+    def __init__(self, bundles=()):
+        self.bundles = [bundle for bundle in bundles if bundle is not None]
+        self.lock = threading.Lock()
+        self.bundle_reads = 0
+        self.bundle_bytes = 0
+        self.file_reads = 0
+        self.file_bytes = 0
+        self.stats_saved = 0
+
+    @classmethod
+    def open(cls, paths_csv_deck):
+        return cls(openSoundBundle(path_csv_deck) for path_csv_deck in paths_csv_deck)
+
+    def findInBundles(self, sndfile):
+        for bundle in self.bundles:
+            index = bundle.getIndex(sndfile)
+
+            if index is not None:
+                return bundle, index
+
+        return None, None
+
+    def isBundled(self, sndfile):
+        return self.findInBundles(sndfile)[0] is not None
+
+    def getSize(self, sndfile):
+        bundle, index = self.findInBundles(sndfile)
+
+        if bundle is None:
+            return os.path.getsize(sndfile)
+
+        return bundle.offsets[index + 1] - bundle.offsets[index]
+
+    def readBundled(self, sndfile):
+        # The sound's data if it is in a bundle, else None
+        bundle, index = self.findInBundles(sndfile)
+
+        if bundle is None:
+            return None
+
+        data = bundle.read(index)
+
+        with self.lock:
+            self.bundle_reads += 1
+            self.bundle_bytes += len(data)
+
+        return data
+
+    def read(self, sndfile):
+        # Raises OSError like open() if the sound is neither
+        # in a bundle nor readable as a loose file
+        data = self.readBundled(sndfile)
+
+        if data is None:
+            with open(sndfile, 'rb') as f:
+                data = f.read()
+
+            with self.lock:
+                self.file_reads += 1
+                self.file_bytes += len(data)
+
+        return data
+
+    def getStats(self):
+        return {'bundles': len(self.bundles), 'bundled_sounds': sum(len(bundle) for bundle in self.bundles),
+                'bundle_reads': self.bundle_reads, 'bundle_bytes': self.bundle_bytes,
+                'file_reads': self.file_reads, 'file_bytes': self.file_bytes,
+                'opens_saved': self.bundle_reads, 'stats_saved': self.stats_saved}
+
+    def close(self):
+        for bundle in self.bundles:
+            bundle.close()
+
+class SoundPrefetcher():
+    # Loads the sound files of the cards ahead of the deck cursor
+    # into a SoundCache using a small thread pool, so flipping
+    # does not have to wait for (possibly network mounted) storage.
+    # URLs are left alone, ffplay streams them itself.
+    def __init__(self, sound_cache, lookahead, max_workers=4, sound_reader=None):
+        self.sound_cache = sound_cache
+        self.sound_reader = sound_reader or SoundReader()
+        self.lookahead = lookahead
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='SoundPrefetcher')
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def prefetch(self, deck):
+        if not self.lookahead or not len(deck):
+            return
+
+        # Walk from the farthest card back to the current one so the
+        # nearest cards end up as the most recently used in the cache
+        for offset in reversed(range(min(self.lookahead + 1, len(deck)))):
+            index = (deck.cur_index + offset) % len(deck)
+
+            sndfile = deck.getLocalSoundfile(index)
+
+            if not sndfile or self.sound_cache.touch(sndfile):
+                continue
+
+            with self.lock:
+                if sndfile in self.pending:
+                    continue
+
+                self.pending.add(sndfile)
+
+            self.executor.submit(self.loadSound, sndfile)
+
+    def loadSound(self, sndfile):
+        try:
+            if self.sound_reader.getSize(sndfile) <= self.sound_cache.max_bytes:
+                self.sound_cache.put(sndfile, self.sound_reader.read(sndfile))
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                self.pending.discard(sndfile)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class AudioPlayer():
+    # Long-lived playback service owned by the app.
+    # Play and stop commands are put on a queue and handled by one worker
+    # thread that keeps the Popen handle of the ffplay process currently
+    # playing. Stopping or replacing a sound just signals that very
+    # process, there are no shells, pgrep or kill processes involved.
+    # If the content of the sound file is already in memory it gets
+    # piped into ffplay instead of letting ffplay open the file.
+    # The latency between a play command and ffplay being spawned is
+    # recorded for the last LATENCY_SAMPLES sounds.
+    # Without a path_ffplay the worker looks ffplay up itself, so that
+    # does not hold up opening the window.
+    LATENCY_SAMPLES = 100
+
+    def __init__(self, path_ffplay=None, profiler=None):
+        self.path_ffplay = path_ffplay
+        self.profiler = profiler or Profiler()
+        self.commands = queue.Queue()
+        self.process = None
+        self.latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self.worker = threading.Thread(target=self.run, name='AudioPlayer', daemon=True)
+        self.worker.start()
+
+    def play(self, sndfile, data=None):
+        self.commands.put(('play', sndfile, data, time.perf_counter()))
+
+    def stop(self):
+        self.commands.put(('stop', None, None, time.perf_counter()))
+
+    def shutdown(self):
+        self.commands.put(('quit', None, None, time.perf_counter()))
+
+    def getLatencyStats(self):
+        # Returns count, last, mean and max spawn latency in seconds
+        latencies = list(self.latencies)
+
+        if not latencies:
+            return {'count': 0, 'last': None, 'mean': None, 'max': None}
+
+        return {'count': len(latencies), 'last': latencies[-1],
+                'mean': sum(latencies) / len(latencies), 'max': max(latencies)}
+
+    def getNextCommand(self):
+        # Block for the next command, then skip everything that is
+        # already outdated: when several commands pile up (e.g. while
+        # autowalking or holding a key) only the newest one matters
+        command = self.commands.get()
+
+        while command[0] != 'quit':
+            try:
+                command = self.commands.get_nowait()
+            except queue.Empty:
+                break
+
+        return command
+
+    def run(self):
+        if self.path_ffplay is None:
+            self.path_ffplay = findFfplay(platform.system())
+
+        while True:
+            command, sndfile, data, time_queued = self.getNextCommand()
+            self.stopCurrentSound()
+
+            if command == 'quit':
+                break
+            elif command == 'play':
+                self.startSound(sndfile, data, time_queued)
+
+    def startSound(self, sndfile, data, time_queued):
+        source = sndfile if data is None else 'pipe:0'
+        stdin = subprocess.DEVNULL if data is None else subprocess.PIPE
+
+        try:
+            with self.profiler.measure('audio.spawn'):
+                self.process = subprocess.Popen([self.path_ffplay, '-autoexit', '-vn', '-nodisp', source],
+                                                stdin=stdin, stdout=subprocess.DEVNULL,
+                                                stderr=subprocess.DEVNULL)
+        except OSError as e:
+            print(f'Could not start {self.path_ffplay}: {e}')
+            self.process = None
+            return
+
+        self.latencies.append(time.perf_counter() - time_queued)
+
+        if data is not None:
+            # Feed ffplay from a separate thread so a big file
+            # does not block the worker from handling the next command
+            threading.Thread(target=self.feedSound, args=(self.process, data), daemon=True).start()
+
+    def feedSound(self, process, data):
+        try:
+            process.stdin.write(data)
+            process.stdin.close()
+        except (OSError, ValueError):
+            # ffplay got stopped before it read everything
+            pass
+
+    def stopCurrentSound(self):
+        process = self.process
+        self.process = None
+
+        if process is None or process.poll() is not None:
+            return
+
+        process.terminate()
+
+        try:
+            process.wait(timeout=0.5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+class FlashcardServer():
+    # Serves many learners from one process: a small HTTP/1.1 server
+    # (asyncio, keep-alive, JSON responses) around FlashcardSession.
+    # The deck and its search index are loaded once and only read,
+    # every session works on its own view of the deck (own order and
+    # cursor) and is dropped after SESSION_TIMEOUT seconds without a
+    # request. Session requests are O(1) or a search and are handled
+    # right on the event loop. Shuffling is O(n) in the deck size and,
+    # like reading loose sound files from disk, goes to a thread so the
+    # other sessions are not held up meanwhile. Sounds in a sound bundle
+    # are only a slice of its memory map and get read right away.
+    #
+    #     POST   /sessions                      new session, returns its state
+    #     GET    /sessions/<id>                 state of the session
+    #     POST   /sessions/<id>/<action>        flip, next, prev, first, last,
+    #                                           goto?position=<1-based position>,
+    #                                           card?index=<column index>, shuffle?on=<0|1>
+    #     GET    /sessions/<id>/search?q=<query>
+    #     DELETE /sessions/<id>
+    #     GET    /sounds/<column index>         sound file of a card
+    SESSION_TIMEOUT = 30 * 60
+    EXPIRE_INTERVAL = 60
+    MAX_HEADER_BYTES = 16 * 1024
+    # Requests carry their parameters in the query string, a body only gets skipped
+    MAX_BODY_BYTES = 16 * 1024
+    THREADED_ACTIONS = ('shuffle',)
+    NAVIGATE_ACTIONS = {'next': 'forward', 'prev': 'backward', 'first': 'jmp_start', 'last': 'jmp_end'}
+    STATUS_TEXTS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+                    431: 'Request Header Fields Too Large'}
+
+    def __init__(self, deck, search_index=None, sound_cache=None, seed=None, profiler=None, sound_reader=None):
+        self.deck = deck
+        self.search_index = search_index
+        self.sound_cache = sound_cache if sound_cache is not None else SoundCache(0)
+        self.sound_reader = sound_reader or SoundReader()
+        self.seed = seed
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.sessions = {}
+        self.last_used = {}
+        self.sessions_created = 0
+        self.requests_handled = 0
+
+    def createSession(self):
+        # With a seed every session shuffles reproducibly, but differently
+        rng = random.Random(None if self.seed is None else self.seed + self.sessions_created)
+        session_id = secrets.token_urlsafe(12)
+        self.sessions[session_id] = FlashcardSession(self.deck.createView(), rng, self.search_index)
+        self.last_used[session_id] = time.monotonic()
+        self.sessions_created += 1
+
+        return session_id
+
+    def expireSessions(self):
+        deadline = time.monotonic() - self.SESSION_TIMEOUT
+
+        for session_id in [session_id for session_id, last_used in self.last_used.items() if last_used < deadline]:
+            del self.sessions[session_id]
+            del self.last_used[session_id]
+
+    def getSessionState(self, session_id):
+        session = self.sessions[session_id]
+        flashcard = session.cur_card
+        sndfile = session.getSoundToPlay()
+        sound = None
+
+        if sndfile:
+            index = session.deck.order[session.deck.cur_index]
+            sound = sndfile if self.deck.sound_states[index] == SOUND_URL else f'/sounds/{index}'
+
+        return {'session': session_id, 'position': session.deck.getPosition(), 'count': len(session.deck),
+                'card_id': flashcard.id if flashcard else None, 'side': flashcard.cur_side if flashcard else None,
+                'text': session.getVisibleText(), 'sound': sound, 'shuffled': session.deck.is_shuffled}
+
+    def runSessionAction(self, session, action, query):
+        # Returns False for an unknown action or bad parameters
+        try:
+            if action == 'flip':
+                session.flip()
+            elif action in self.NAVIGATE_ACTIONS:
+                session.navigate(self.NAVIGATE_ACTIONS[action])
+            elif action == 'goto':
+                return session.gotoPosition(int(query['position'][0])) is not None
+            elif action == 'card':
+                return session.gotoCardIndex(int(query['index'][0])) is not None
+            elif action == 'shuffle':
+                session.setShuffled(query.get('on', ['1'])[0] != '0')
+            else:
+                return False
+        except (KeyError, ValueError):
+            return False
+
+        return True
+
+    async def handleRequest(self, method, target):
+        # Returns (status, content type, body)
+        url = urllib.parse.urlsplit(target)
+        query = urllib.parse.parse_qs(url.query)
+        parts = url.path.strip('/').split('/')
+
+        if parts[0] == 'sounds' and len(parts) == 2:
+            if method != 'GET':
+                return self.getJsonResponse(405, {'error': 'method not allowed'})
+
+            return await self.getSoundResponse(parts[1])
+
+        if parts[0] != 'sessions' or len(parts) > 3:
+            return self.getJsonResponse(404, {'error': 'not found'})
+
+        if len(parts) == 1 or not parts[1]:
+            if method != 'POST':
+                return self.getJsonResponse(405, {'error': 'method not allowed'})
+
+            return self.getJsonResponse(200, self.getSessionState(self.createSession()))
+
+        session_id = parts[1]
+        session = self.sessions.get(session_id)
+
+        if session is None:
+            return self.getJsonResponse(404, {'error': 'no such session'})
+
+        self.last_used[session_id] = time.monotonic()
+
+        if len(parts) == 2:
+            if method == 'DELETE':
+                del self.sessions[session_id]
+                del self.last_used[session_id]
+                return self.getJsonResponse(200, {'session': session_id, 'deleted': True})
+            elif method == 'GET':
+                return self.getJsonResponse(200, self.getSessionState(session_id))
+
+            return self.getJsonResponse(405, {'error': 'method not allowed'})
+
+        action = parts[2]
 
-    args = parser.parse_args()
-    return args
+        if action == 'search':
+            if method != 'GET':
+                return self.getJsonResponse(405, {'error': 'method not allowed'})
 
-def isUrl(string):
-    regex = r"(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’]))"
-    url = re.findall(regex, string)
-    found_urls = [x[0] for x in url]
-    return (len(found_urls) > 0)
+            with self.profiler.measure('server.search'):
+                results = session.search(query.get('q', [''])[0])
 
-class Flashcard():
-    def __init__(self, _id, frontside_labeltext, backside_labeltext, soundfile):
-        # We assume the frontside holds the content you know
-        # such as your mother language
-        # The backside holds the stuff you want to learn, the foreign language
-        # There there is only one soundfile member
-        # because it should play what is on the backside (the foreign language)
-        self.id = int(_id)
-        self.frontside_labeltext = frontside_labeltext
-        self.backside_labeltext = backside_labeltext
-        self.soundfile = soundfile
-        self.cur_side = 'front'
+            return self.getJsonResponse(200, {'results': [{'index': index, 'front': self.deck.frontsides[index],
+                                                           'back': self.deck.backsides[index]} for index in results]})
 
-class Deck():
+        if method != 'POST':
+            return self.getJsonResponse(405, {'error': 'method not allowed'})
+
+        with self.profiler.measure(f'server.{action}'):
+            if action in self.THREADED_ACTIONS:
+                succeeded = await asyncio.get_running_loop().run_in_executor(None, self.runSessionAction, session, action, query)
+            else:
+                succeeded = self.runSessionAction(session, action, query)
+
+            if not succeeded:
+                return self.getJsonResponse(400, {'error': f'cannot {action}'})
+
+            return self.getJsonResponse(200, self.getSessionState(session_id))
+
+    async def getSoundResponse(self, index):
+        try:
+            index = int(index)
+        except ValueError:
+            return self.getJsonResponse(404, {'error': 'not found'})
+
+        if not 0 <= index < len(self.deck) or self.deck.sound_states[index] != SOUND_LOCAL:
+            return self.getJsonResponse(404, {'error': 'no local sound file'})
+
+        sndfile = self.deck.getSoundfile(index)
+        data = self.sound_cache.get(sndfile)
+
+        if data is None:
+            data = self.sound_reader.readBundled(sndfile)
+
+        if data is None:
+            try:
+                data = await asyncio.get_running_loop().run_in_executor(None, self.sound_reader.read, sndfile)
+            except OSError:
+                return self.getJsonResponse(404, {'error': 'sound file not readable'})
+
+            self.sound_cache.put(sndfile, data)
+
+        return 200, mimetypes.guess_type(sndfile)[0] or 'application/octet-stream', data
+
+    def getJsonResponse(self, status, payload):
+        return status, 'application/json', json.dumps(payload, ensure_ascii=False).encode('utf8')
+
+    async def handleConnection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.LimitOverrunError:
+                    await self.writeResponse(writer, *self.getJsonResponse(431, {'error': 'header too large'}), False)
+                    break
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                request_line, *header_lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+                headers = {}
+
+                for header_line in header_lines:
+                    name, _, value = header_line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.split(' ')
+                    content_length = int(headers.get('content-length', 0))
+
+                    if content_length < 0:
+                        raise ValueError(content_length)
+                except ValueError:
+                    await self.writeResponse(writer, *self.getJsonResponse(400, {'error': 'bad request'}), False)
+                    break
+
+                if content_length > self.MAX_BODY_BYTES:
+                    await self.writeResponse(writer, *self.getJsonResponse(413, {'error': 'body too large'}), False)
+                    break
+
+                if content_length:
+                    await reader.readexactly(content_length)
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                status, content_type, body = await self.handleRequest(method, target)
+                self.requests_handled += 1
+                await self.writeResponse(writer, status, content_type, body, keep_alive)
+
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def writeResponse(self, writer, status, content_type, body, keep_alive):
+        writer.write((f'HTTP/1.1 {status} {self.STATUS_TEXTS[status]}\r\n'
+                      f'Content-Type: {content_type}\r\n'
+                      f'Content-Length: {len(body)}\r\n'
+                      f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def expireSessionsPeriodically(self):
+        while True:
+            await asyncio.sleep(self.EXPIRE_INTERVAL)
+            self.expireSessions()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handleConnection, host, port, limit=self.MAX_HEADER_BYTES)
+        expire_task = asyncio.create_task(self.expireSessionsPeriodically())
+        print(f'Serving {len(self.deck)} card(s) on http://{host}:{port}')
+
+        # Stop on SIGTERM just like on Ctrl+C (not available on Windows)
+        with contextlib.suppress(NotImplementedError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+
+        try:
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            expire_task.cancel()
+
+def runServer(args):
+    # Headless entry point for --serve, no Tk involved
+    if args.stream or args.disk_store:
+        print('--stream and --disk-store are not supported together with --serve')
+        return
+
+    if args.srs:
+        print('--srs is not supported together with --serve, ignoring it')
+
+    host, _, port = args.serve.rpartition(':')
+    profiler = Profiler(args.profile, args.profile_cprofile)
+    paths_csv_deck = getDeckPaths(args.path_to_deck)
+    sound_reader = SoundReader.open(paths_csv_deck)
+
+    with profiler.measure('load.total'):
+        deck = loadDecks(paths_csv_deck, args, profiler, random.Random(args.seed), sound_reader)
+
+    with profiler.measure('load.search_index'):
+        search_index = SearchIndex(deck)
+        search_index.build()
+
+    sound_cache = SoundCache(int(args.sound_cache_mb * 1024 * 1024))
+    server = FlashcardServer(deck, search_index, sound_cache, args.seed, profiler, sound_reader)
+
+    try:
+        asyncio.run(server.serve(host or '127.0.0.1', int(port)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f'Handled {server.requests_handled} request(s) for {server.sessions_created} session(s)')
+        profiler.finish({'sound_cache': sound_cache.getStats(), 'sound_reads': sound_reader.getStats()})
+        sound_reader.close()
+
+def packSoundBundles(paths_csv_deck, args):
+    # Headless entry point for --pack-sounds. Which sounds exist is
+    # decided by the loose files only, never by an older bundle.
+    for path_csv_deck in paths_csv_deck:
+        time_started = time.perf_counter()
+        sndfile_basepath = getSoundBasePath(path_csv_deck)
+        deck = None if args.no_deck_cache else readDeckCache(path_csv_deck, sndfile_basepath)
+
+        if deck is None:
+            deck = classifySoundFiles(readDeckCsv(path_csv_deck), sndfile_basepath)
+
+        missing_sndfiles = checkSoundFilesExist(deck)
+
+        try:
+            count, size = writeSoundBundle(path_csv_deck, deck)
+        except OSError as e:
+            print(f'Could not pack the sound files of {path_csv_deck}: {e}')
+            continue
+
+        print(f'Packed {count} sound file(s) ({size / 1e6:.1f} MB) of {path_csv_deck} into '
+              f'{path_csv_deck}{SOUND_BUNDLE_SUFFIX} in {time.perf_counter() - time_started:.2f}s'
+              f'{f", {len(missing_sndfiles)} missing" if missing_sndfiles else ""}')
+
+def cleanImportedText(text):
+    # Anki fields may hold HTML, line breaks and NULs, a card
+    # side is a single line of plain text
+    if '<' in text or '&' in text:
+        text = html.unescape(HTML_TAG_REGEX.sub('', HTML_BREAK_REGEX.sub(' ', text)))
+
+    return ' '.join(text.replace('\0', '').split())
+
+def normalizeBackside(backside):
+    # Native writing and romanization always as 'native----romanized'
+    parts = NATIVE_ROMANIZED_SEP_REGEX.split(backside, maxsplit=1)
+
+    if len(parts) == 2 and parts[0] and parts[1]:
+        return f'{parts[0]}----{parts[1]}'
+
+    match = NATIVE_ROMANIZED_REGEX.match(backside)
+
+    if match:
+        return f'{match.group(1)}----{match.group(2)}'
+
+    return backside
+
+def normalizeImportedCard(frontside, backside, soundfile):
+    # Anki keeps sounds as [sound:<file>] inside a field
+    match = ANKI_SOUND_REGEX.search(soundfile)
+
+    if match:
+        soundfile = match.group(1)
+    elif not soundfile:
+        for text in (frontside, backside):
+            match = ANKI_SOUND_REGEX.search(text)
+
+            if match:
+                soundfile = match.group(1)
+                break
+
+    if '[sound:' in frontside or '[sound:' in backside:
+        frontside = ANKI_SOUND_REGEX.sub('', frontside)
+        backside = ANKI_SOUND_REGEX.sub('', backside)
+
+    return cleanImportedText(frontside), normalizeBackside(cleanImportedText(backside)), cleanImportedText(soundfile)
+
+def parseImportedRow(row, has_id_column):
+    # (id or None, front, back, sound) or None for a row to skip. With
+    # an id column (see getImportLayout()) the fields are those of a deck
+    # row, otherwise front, back and optionally the sound come first.
+    if has_id_column:
+        if len(row) < 3:
+            return None
+
+        return int(row[0]) if row[0].strip().isdigit() else None, row[1], row[2], row[3] if len(row) > 3 else ''
+
+    if len(row) >= 2:
+        return None, row[0], row[1], row[2] if len(row) > 2 else ''
+
+    return None
+
+def parseImportedJson(line):
+    # {"id", "front", "back", "sound"}, the back may also be
+    # given as "native" and "romanized"
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+
+    if not isinstance(record, dict):
+        return None
+
+    frontside = record.get('front')
+    backside = record.get('back')
+    soundfile = record.get('sound') or ''
+
+    if backside is None:
+        parts = [record.get(key) for key in ('native', 'romanized') if record.get(key) is not None]
+
+        if all(isinstance(part, str) for part in parts):
+            backside = '----'.join(part for part in parts if part)
+
+    # Other values than text (null, numbers, objects) are not a card
+    if not isinstance(frontside, str) or not isinstance(backside, str) or not frontside or not backside \
+            or not isinstance(soundfile, str):
+        return None
+
+    _id = record.get('id')
+
+    return (int(_id) if isinstance(_id, int) or (isinstance(_id, str) and _id.isdigit()) else None,
+            frontside, backside, soundfile)
+
+class ImportedIds():
+    # Gives the imported cards their ids in file order. Rows without an
+    # id and rows repeating an id used before get the one after the
+    # highest id so far. The used ids are kept in a sorted array at 8
+    # bytes per card as long as they ascend (the usual case, and every
+    # id handed out here does), the few that come out of order in a set.
     def __init__(self):
-        self.cards = {}
+        self.ascending_ids = array('q')
+        self.other_ids = set()
+        self.max_id = 0
+        self.renumbered = 0
+
+    def isUsed(self, _id):
+        if _id in self.other_ids:
+            return True
+
+        position = bisect.bisect_left(self.ascending_ids, _id)
+
+        return position < len(self.ascending_ids) and self.ascending_ids[position] == _id
+
+    def assign(self, _id):
+        if _id is None or (_id <= self.max_id and self.isUsed(_id)):
+            if _id is not None:
+                self.renumbered += 1
+
+            _id = self.max_id + 1
+
+        if _id > self.max_id:
+            self.ascending_ids.append(_id)
+            self.max_id = _id
+        else:
+            self.other_ids.add(_id)
+
+        return _id
+
+def getImportLayout(path_input, input_format):
+    # Decided once per file: the byte offset the rows start at, after a
+    # BOM, the header lines of an Anki export and the header row of a
+    # deck CSV, and whether the first column holds the card ids. It does
+    # after a deck CSV header, or when the first IMPORT_SAMPLE_ROWS rows
+    # all have the same four or more fields starting with a number.
+    bom = '\ufeff'.encode('utf8')
+
+    with open(path_input, 'rb') as inputfile:
+        start = len(bom) if inputfile.read(len(bom)) == bom else 0
+
+        if input_format == 'jsonl':
+            return start, False
+
+        inputfile.seek(start)
+        line = inputfile.readline()
+
+        while ANKI_HEADER_REGEX.match(line.decode('utf8', errors='replace')):
+            start = inputfile.tell()
+            line = inputfile.readline()
+
+        raw_lines = [line] + [inputfile.readline() for i in range(IMPORT_SAMPLE_ROWS - 1)]
+
+    lines = [line.decode('utf8', errors='replace').rstrip('\r\n') for line in raw_lines]
+    rows = [row for row in csv.reader(lines, delimiter='\t' if input_format == 'tsv' else ';') if row]
+
+    if rows and lines[0] and rows[0][0].strip().lower() == 'id':
+        return start + len(raw_lines[0]), True
+
+    return start, bool(rows) and all(len(row) == len(rows[0]) >= 4 and row[0].strip().isdigit() for row in rows)
+
+def getImportChunks(path_input, start):
+    # Byte ranges of about IMPORT_CHUNK_SIZE from start on, every one
+    # ends after a line break
+    size = os.path.getsize(path_input)
+
+    with open(path_input, 'rb') as inputfile:
+        while start < size:
+            inputfile.seek(min(start + IMPORT_CHUNK_SIZE, size))
+            inputfile.readline()
+            end = inputfile.tell()
+            yield start, end
+            start = end
+
+def parseImportChunk(path_input, start, end, input_format, has_id_column, has_sound_prefix):
+    # Runs in a worker process: parses and normalizes the rows in the
+    # byte range and resolves their sound state like classifySoundFiles().
+    # Returns the columns (ids are None where the input has none) and
+    # the number of skipped lines.
+    with open(path_input, 'rb') as inputfile:
+        inputfile.seek(start)
+        text = inputfile.read(end - start).decode('utf8', errors='replace')
+
+    lines = [line.rstrip('\r') for line in text.split('\n')]
+    lines = [line for line in lines if line.strip()]
+
+    if input_format == 'jsonl':
+        rows = map(parseImportedJson, lines)
+    else:
+        reader = csv.reader(lines, delimiter='\t' if input_format == 'tsv' else ';')
+        rows = (parseImportedRow(row, has_id_column) for row in reader)
+
+    ids = []
+    frontsides = []
+    backsides = []
+    soundfiles = []
+    sound_prefix_indices = array('I')
+    sound_states = array('B')
+    skipped = 0
+
+    for row in rows:
+        if row is None:
+            skipped += 1
+            continue
+
+        frontside, backside, soundfile = normalizeImportedCard(row[1], row[2], row[3])
+
+        if not frontside and not backside:
+            skipped += 1
+            continue
+
+        ids.append(row[0])
+        frontsides.append(frontside)
+        backsides.append(backside)
+        soundfiles.append(soundfile)
+
+        if not soundfile:
+            sound_prefix_indices.append(0)
+            sound_states.append(SOUND_NONE)
+        elif isUrl(soundfile):
+            sound_prefix_indices.append(0)
+            sound_states.append(SOUND_URL)
+        else:
+            sound_prefix_indices.append(1 if has_sound_prefix else 0)
+            sound_states.append(SOUND_LOCAL)
+
+    return ids, frontsides, backsides, soundfiles, sound_prefix_indices, sound_states, skipped
+
+def parseImportChunks(path_input, input_format, has_sound_prefix):
+    # Yields the parsed chunks in file order. With several CPUs they get
+    # parsed by a process pool, at most two chunks per worker are in
+    # flight so memory stays bounded however big the input is.
+    start, has_id_column = getImportLayout(path_input, input_format)
+    chunks = getImportChunks(path_input, start)
+    max_workers = os.cpu_count() or 1
+
+    if max_workers == 1:
+        for start, end in chunks:
+            yield parseImportChunk(path_input, start, end, input_format, has_id_column, has_sound_prefix)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=getProcessPoolContext()) as executor:
+        pending = deque()
+
+        for start, end in chunks:
+            pending.append(executor.submit(parseImportChunk, path_input, start, end, input_format, has_id_column,
+                                           has_sound_prefix))
+
+            if len(pending) >= max_workers * 2:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+def importDeck(args):
+    # Headless entry point for --import: convert the input into a deck
+    # CSV at --path-to-deck in one streaming pass. For --import-to deck
+    # the compiled deck cache gets written along, its columns are
+    # collected in temp files meanwhile and put together at the end.
+    # Returns whether the import succeeded.
+    if not args.path_to_deck or len(args.path_to_deck) != 1:
+        print('--import needs exactly one --path-to-deck to write the deck to')
+        return False
+
+    path_input = args.import_path
+    path_csv_deck = args.path_to_deck[0]
+    input_format = args.import_format
+
+    if input_format == 'auto':
+        input_format = IMPORT_FORMATS.get(os.path.splitext(path_input)[1].lower(), 'csv')
+
+    sndfile_basepath = getSoundBasePath(path_csv_deck)
+    sound_prefixes = [''] + ([sndfile_basepath if sndfile_basepath.endswith('/') else f'{sndfile_basepath}/'] if sndfile_basepath else [])
+    write_cache = args.import_to == 'deck'
+    column_files = [tempfile.TemporaryFile() for i in range(6)] if write_cache else []
+    path_csv_deck_tmp = f'{path_csv_deck}.tmp'
+    sha1 = hashlib.sha1()
+    rowcount = 0
+    skipped = 0
+    imported_ids = ImportedIds()
+    time_started = time.perf_counter()
+
+    try:
+        with open(path_csv_deck_tmp, 'wb') as csvfile:
+            header = f'{";".join(CSV_HEADER)}\n'.encode('utf8')
+            csvfile.write(header)
+            sha1.update(header)
+
+            for ids, frontsides, backsides, soundfiles, sound_prefix_indices, sound_states, chunk_skipped in \
+                    parseImportChunks(path_input, input_format, len(sound_prefixes) > 1):
+                ids = array('q', map(imported_ids.assign, ids))
+
+                buffer = io.StringIO()
+                csv.writer(buffer, delimiter=';', lineterminator='\n').writerows(zip(ids, frontsides, backsides, soundfiles))
+                data = buffer.getvalue().encode('utf8')
+                csvfile.write(data)
+                sha1.update(data)
+
+                if write_cache and ids:
+                    # The text columns are NUL seperated across chunks as well
+                    seperator = DECK_CACHE_FIELD_SEP if rowcount else ''
+
+                    for column_file, column in zip(column_files, (ids, sound_prefix_indices, sound_states)):
+                        column_file.write(column.tobytes())
+
+                    for column_file, column in zip(column_files[3:], (frontsides, backsides, soundfiles)):
+                        column_file.write(f'{seperator}{DECK_CACHE_FIELD_SEP.join(column)}'.encode('utf8'))
+
+                rowcount += len(ids)
+                skipped += chunk_skipped
+
+        os.replace(path_csv_deck_tmp, path_csv_deck)
+
+        if write_cache and rowcount:
+            writeDeckCacheFromColumns(path_csv_deck, sndfile_basepath, sha1.digest(), rowcount, sound_prefixes, column_files)
+    except OSError as error:
+        # E.g. a missing input file or deck directory, nothing half
+        # written is left behind
+        paths_tmp = {path_csv_deck_tmp: path_csv_deck, f'{path_csv_deck}{DECK_CACHE_SUFFIX}.tmp': f'{path_csv_deck}{DECK_CACHE_SUFFIX}'}
+
+        for path_tmp in paths_tmp:
+            with contextlib.suppress(OSError):
+                os.remove(path_tmp)
+
+        print(f'Import failed: {paths_tmp.get(error.filename, error.filename or path_input)}: {error.strerror or error}')
+        return False
+    finally:
+        for column_file in column_files:
+            column_file.close()
+
+    elapsed = time.perf_counter() - time_started
+    print(f'Imported {rowcount} card(s) from {path_input} ({input_format}) into {path_csv_deck}'
+          f'{" with its deck cache" if write_cache and rowcount else ""} in {elapsed:.2f}s '
+          f'({rowcount / elapsed:.0f} rows/s), {skipped} line(s) skipped, {imported_ids.renumbered} repeated id(s) renumbered')
+
+    return True
+
+def writeDeckCacheFromColumns(path_csv_deck, sndfile_basepath, digest, rowcount, sound_prefixes, column_files):
+    # Same layout as writeDeckCache() writes, but the columns come from
+    # the (binary) temp files of importDeck() instead of a Deck
+    path_cache = f'{path_csv_deck}{DECK_CACHE_SUFFIX}'
+    path_cache_tmp = f'{path_cache}.tmp'
+    csv_stat = os.stat(path_csv_deck)
+    basepath = (sndfile_basepath or '').encode('utf8')
+
+    with open(path_cache_tmp, 'wb') as cachefile:
+        cachefile.write(DECK_CACHE_HEADER.pack(DECK_CACHE_MAGIC, DECK_CACHE_VERSION, csv_stat.st_size, csv_stat.st_mtime_ns,
+                                               len(basepath), digest, rowcount, len(sound_prefixes)))
+        cachefile.write(basepath)
+
+        for column_file in column_files[:3]:
+            column_file.seek(0)
+            shutil.copyfileobj(column_file, cachefile)
+
+        cachefile.write(DECK_CACHE_FIELD_SEP.join(sound_prefixes).encode('utf8'))
+
+        for column_file in column_files[3:]:
+            cachefile.write(DECK_CACHE_FIELD_SEP.encode('utf8'))
+            column_file.seek(0)
+            shutil.copyfileobj(column_file, cachefile)
+
+    os.replace(path_cache_tmp, path_cache)
 
 class FlashcardsApp(tk.Frame):
-    def __init__(self, master, geometry, name, version, bgcolor, path_csv_deck, os, args):
+    def __init__(self, master, geometry, name, version, bgcolor, paths_csv_deck, os, args):
         super().__init__(master)
         self.pack()
         self.bgcolor = bgcolor
@@ -62,19 +4042,27 @@ class FlashcardsApp(tk.Frame):
         self.geometry = geometry
         self.name = name
         self.version = version
-        self.path_csv_deck = path_csv_deck
+        # SRS and watching the deck need the one CSV the deck came from
+        self.paths_csv_deck = paths_csv_deck
+        self.path_csv_deck = paths_csv_deck[0] if len(paths_csv_deck) == 1 else None
         self.os = os
         self.args = args
         self.master.configure(bg=self.bgcolor)
         self.configure(bg=self.bgcolor)
 
         self.title = f'{name} v{version}'
-        self.cur_flashcard_side = 'front'
-        self.cur_card = None
         self.deck = None
+        self.deck_future = None
+        self.session = None
+        self.deck_watcher = None
         self.validatecmd_goto_input = None
-        self.sndfile_basepath = self.args.path_to_deck[:self.args.path_to_deck.rfind('/')]
-        self.path_ffplay = self.getPathFfplay()
+        self.sndfile_basepath = getSoundBasePath(self.path_csv_deck) if self.path_csv_deck else None
+        self.profiler = Profiler(self.args.profile, self.args.profile_cprofile)
+        self.rng = random.Random(self.args.seed)
+        self.audio_player = AudioPlayer(self.args.path_to_ffplay, self.profiler)
+        self.sound_cache = SoundCache(int(self.args.sound_cache_mb * 1024 * 1024))
+        self.sound_reader = SoundReader.open(self.paths_csv_deck)
+        self.sound_prefetcher = SoundPrefetcher(self.sound_cache, self.args.prefetch_cards, sound_reader=self.sound_reader)
 
         self.font = self.args.font if self.args.font else 'roman'
         self.font_style = self.args.font_style if self.args.font_style  else 'bold'
@@ -83,7 +4071,9 @@ class FlashcardsApp(tk.Frame):
 
         self.autoflip = tk.IntVar()
         self.autowalk = tk.IntVar()
-        self.autoflip_thread = None
+        self.shuffled = tk.IntVar(value=1 if self.args.shuffle else 0)
+        self.browse = tk.IntVar()
+        self.autoflip_timer = None
 
         self.fliptime = 4.0 if not self.args.fliptime else self.args.fliptime
         self.switchtime = 3.0 if not self.args.switchtime else self.args.switchtime
@@ -102,7 +4092,9 @@ class FlashcardsApp(tk.Frame):
                         'mainframe': None, 'label': None, 'fwd_btn': None,
                         'jmp_end_btn': None, 'bwd_btn': None, 'jmp_start_btn': None,
                         'flp_btn': None, 'snd_btn': None, 'goto_input': None,
-                        'autoflip_chkbtn': None, 'autowalk_chkbtn': None, 'card_in_deck_pos': None}
+                        'search_input': None, 'search_results': None, 'grade_frame': None,
+                        'autoflip_chkbtn': None, 'autowalk_chkbtn': None, 'shuffle_chkbtn': None,
+                        'browse_chkbtn': None, 'card_in_deck_pos': None}
 
         # --------------------------------
         # Start of creating widget configs
@@ -116,18 +4108,29 @@ class FlashcardsApp(tk.Frame):
        # print(f"tkFont.names():\n{tkFont.names()}")
        # print(f"tkFont.families():\n{tkFont.families()}")
 
-        self.flashcard_config = {'text': 'No data loaded', 'wraplength': 450,
+        self.text_layouts = TextLayoutCache(self.flashcard_font, FLASHCARD_WRAPLENGTH)
+        self.layout_job = None
+        self.search_job = None
+        self.deck_browser = None
+
+        self.flashcard_config = {'text': 'No data loaded', 'wraplength': FLASHCARD_WRAPLENGTH,
                                  'bg': '#707070', 'fg': 'white', 'height': 10,
                                  'width': 24, 'font': self.flashcard_font}
-        self.snd_btn_config = {'text': '   🔊   ', 'command': lambda: self.playBacksideSound(self.cur_card)}
+        self.snd_btn_config = {'text': '   🔊   ', 'command': lambda: self.playBacksideSound()}
         self.fwd_btn_config = {'text': '  >>  ', 'command': lambda: self.navigateFlashcards('forward')}
         self.jmp_end_btn_config = {'text': '  >>|  ', 'command': lambda: self.navigateFlashcards('jmp_end')}
         self.bwd_btn_config = {'text': '  <<  ', 'command': lambda: self.navigateFlashcards('backward')}
         self.jmp_start_btn_config = {'text': '  |<<  ', 'command': lambda: self.navigateFlashcards('jmp_start')}
         self.flp_btn_config = {'text': 'F L I P', 'command': lambda: self.flipFlashcard()}
         self.goto_input_config = {'validate': 'key'}
+        self.grade_btn_configs = {name: {'text': f'  {name}  ', 'command': lambda grade=grade: self.gradeFlashcard(grade)}
+                                  for name, grade in SRS_GRADES.items()}
+        self.search_input_config = {'width': 30}
+        self.search_results_config = {'width': 40, 'height': 20, 'activestyle': 'none'}
         self.autoflip_chkbtn_config = {'text': 'Auto flip', 'variable': self.autoflip, 'command': lambda: self.autoflipEntryPoint()}
         self.autowalk_chkbtn_config = {'text': 'Auto walk', 'variable': self.autowalk, 'command': lambda: self.autoflipEntryPoint()}
+        self.shuffle_chkbtn_config = {'text': 'Shuffle', 'variable': self.shuffled, 'command': lambda: self.toggleShuffle()}
+        self.browse_chkbtn_config = {'text': 'Browse deck', 'variable': self.browse, 'command': lambda: self.toggleDeckBrowser()}
 
         front_card_indicator = tkFont.Font(size=10, weight='bold', slant='roman')
         self.card_in_deck_pos_config = {'text': '0/0', 'font': front_card_indicator}
@@ -143,180 +4146,41 @@ class FlashcardsApp(tk.Frame):
         self.registerOnExitCloseAutoflipThread()
         self.createWidgets()
 
-    def getPathFfplay(self):
-        if not self.args.path_to_ffplay:
-            if self.os == 'Windows':
-                return 'C:/ffmpeg/bin/ffplay.exe'
-            else:
-                get_path_ffplay = subprocess.run('whereis ffplay | cut -d" " -f2 | tr -d "\n" | tr -d "\n\r"', shell=True, text=True, capture_output=True)
-                path_ffplay = get_path_ffplay.stdout if not get_path_ffplay.stderr else '/usr/bin/ffplay'
-                return path_ffplay
-        else:
-            return self.args.path_to_ffplay
-
-    def prependSoundBasePathCsv(self, preliminary_deck):
-        if self.sndfile_basepath:
-            for pre_card in preliminary_deck.values():
-                last_item_index = len(pre_card) - 1
-                sndfile_fullpath = ''
-                sndfile_is_url = isUrl(pre_card[last_item_index])
-
-                if self.sndfile_basepath.endswith('/') and not sndfile_is_url:
-                    sndfile_fullpath = f'{self.sndfile_basepath}{pre_card[last_item_index]}'
-                elif not self.sndfile_basepath.endswith('/') and not sndfile_is_url:
-                    sndfile_fullpath = f'{self.sndfile_basepath}/{pre_card[last_item_index]}'
-
-                if sndfile_fullpath:
-                    pre_card[last_item_index] = sndfile_fullpath
-
-        return preliminary_deck
-
-    def preloadDeck(self):
-        preliminary_deck = {}
-
-        with open(self.path_csv_deck, 'r', encoding='utf8') as csvfile:
-            reader = csv.reader(csvfile, delimiter=';')
-            rowcounter = 0
-
-            for row in reader:
-                # Skip CSV header
-                if row[0] == 'id':
-                    continue
-
-                rowcounter += 1
-                preliminary_deck[f'card_{rowcounter}'] = row
-
-        preliminary_deck = self.prependSoundBasePathCsv(preliminary_deck)
-        preliminary_deck = self.decideToShufflePrelimDeckOrNot(preliminary_deck)
-        preliminary_deck = self.decideToEemoveDuplicatesPrelimDeckOrNot(preliminary_deck)
-
-        return preliminary_deck
-
-    def decideToEemoveDuplicatesPrelimDeckOrNot(self, preliminary_deck):
-        if not self.args.remove_duplicates:
-            return preliminary_deck
-
-        card_texts_to_check_for_duplicates = []
-        duplicate_card_map = {}
-
-        # Combine front and backside (only roman writing) to make a unique string
-        # Put the card number in front of the string to store the position so we now
-        # what to remove later
-        # The second half after '|||' without the card number is our indicator:
-        # if it exists more than once we have a duplicate
-
-        # Create a list of those indicator strings
-        for key in preliminary_deck:
-             flashcard_text = preliminary_deck[key]
-             frontside_text = flashcard_text[1]
-             backside_text = flashcard_text[2]
-             backside_text_no_nonroman_writing = ''
-
-             if backside_text.find('----') > 0:
-                 backside_text_no_nonroman_writing = flashcard_text[2].split('----')[1]
-             else:
-                 backside_text_no_nonroman_writing = flashcard_text[2]
+    def loadDeck(self):
+        # Runs in a background thread while the window is already shown.
+        # A daemon thread, closing the window does not wait for it.
+        try:
+            with self.profiler.measure('load.total'):
+                self.deck_future.set_result(loadDecks(self.paths_csv_deck, self.args, self.profiler, self.rng, self.sound_reader))
+        except Exception as e:
+            self.deck_future.set_exception(e)
 
-             str_to_check = f'{key}' + '|||' + frontside_text + '||' + backside_text_no_nonroman_writing
-             card_texts_to_check_for_duplicates.append(str_to_check)
+    def loadDeckInBackground(self):
+        self.deck_future = concurrent.futures.Future()
+        threading.Thread(target=self.loadDeck, name='DeckLoader', daemon=True).start()
 
+        # Tk may only be used from its own thread, so the
+        # loaded deck is picked up by polling from there
+        self.after(int(DECK_LOAD_POLL_INTERVAL * 1000), self.pollDeckLoaded)
 
-        # Identify matches as duplicates (only if card number is not the same)
-        # Make the string the key of a duplicate map dict and the card number the value
-        for key, val in preliminary_deck.items():
-            flashcard_text = preliminary_deck[key]
-            frontside_text = flashcard_text[1] 
-            backside_text = flashcard_text[2]
-            backside_text_no_nonroman_writing = ''
+    def pollDeckLoaded(self):
+        if not self.deck_future.done():
+            self.after(int(DECK_LOAD_POLL_INTERVAL * 1000), self.pollDeckLoaded)
+            return
 
-            if backside_text.find('----') > 0:
-                backside_text_no_nonroman_writing = flashcard_text[2].split('----')[1]
-            else:
-                backside_text_no_nonroman_writing = flashcard_text[2]
-
-            str_to_check = f'{key}' + '|||' + frontside_text + '||' + backside_text_no_nonroman_writing
-
-            for element in card_texts_to_check_for_duplicates:
-                val1 = element.split('|||')[1]
-                card1 = element.split('|||')[0]
-                val2 = str_to_check.split('|||')[1]
-                card2 = str_to_check.split('|||')[0]
-
-                if val1 == val2 and card1 != card2:
-                    dupmapkey = f'{val1}::::{val2}'
-
-                    try:
-                        duplicate_card_map[dupmapkey]
-                    except KeyError:
-                        duplicate_card_map[dupmapkey] = []
-
-                    duplicate_card_map[dupmapkey].append(card1)
-                    duplicate_card_map[dupmapkey].append(card2)
-
-        # Just to be sure filter out duplicate card numbers per key-val pair
-        # Now loop over the card numbers for each flashcard duplicate
-        # except for one element and delete all the others from the preliminary deck
-        # so all dups except one are removed.
-        for key, val in duplicate_card_map.items():
-            duplicate_card_map[key] = list(set(duplicate_card_map[key]))
-            newval = duplicate_card_map[key]
-            counter = 1
-
-            while counter < len(newval):
-                del preliminary_deck[newval[counter]]
-                counter += 1
-
-
-        dedupped_prelim_dict = {}
-
-        # Straighten out the card numbers and IDs again
-        # assign everything to a new dict because otherwise
-        # the original's dict size would change during iteration
-        # and python would crash
-        counter = 1
-        for key, val in preliminary_deck.items():
-            val[0] = counter
-            dedupped_prelim_dict[f'card_{counter}'] = val
-            counter += 1
-
-        # Delete the unduped dict and return the clean one :)
-        del preliminary_deck
-        return dedupped_prelim_dict
-
-    def decideToShufflePrelimDeckOrNot(self, unshuffled_prelim_deck):
+        # Creating the session already reads the first card, which can
+        # fail the same way for a DiskDeck
         try:
-            if self.args.shuffle:
-                shuffled_prelim_dict = {}
-                list_keys_prelim_deck = list(unshuffled_prelim_deck.keys())
-                random.shuffle(list_keys_prelim_deck)
-                counter = 0
-
-                for shuffledkey in list_keys_prelim_deck:
-                    new_val = unshuffled_prelim_deck[shuffledkey]
-                    new_val[0] = counter+1
-                    shuffled_prelim_dict[f'card_{counter+1}'] = new_val
-                    counter += 1
-
-                del(unshuffled_prelim_deck)
-                return shuffled_prelim_dict
-        except IndexError:
-            return unshuffled_prelim_deck
-        else:
-            return unshuffled_prelim_deck
-
-    def loadDeck(self):
-        deck = Deck()
-        preliminary_deck = self.preloadDeck()
+            deck = self.deck_future.result()
+            session = FlashcardSession(deck, self.rng)
+        except (OSError, ValueError, IndexError, csv.Error, sqlite3.Error) as e:
+            print(f'Could not load the deck: {e}')
+            self.widgets['label']['text'] = f'Could not load the deck:\n{e}'
+            return
 
-        for pre_card_key, pre_card_content in preliminary_deck.items():
-            _id = pre_card_content[0]
-            frontside = pre_card_content[1]
-            backside = pre_card_content[2]
-            soundfile = pre_card_content[3]
-            deck.cards[pre_card_key] = Flashcard(_id, frontside, backside, soundfile)
-
-        del(preliminary_deck)
         self.deck = deck
+        self.session = session
+        self.showDeck()
 
     def setWindowTitle(self):
         self.master.title(self.title)
@@ -325,49 +4189,64 @@ class FlashcardsApp(tk.Frame):
         self.master.geometry(self.geometry)
 
     def flipFlashcard(self):
-        self.widgets['label']['text'] = self.cur_card.backside_labeltext if self.cur_card.cur_side == 'front' else self.cur_card.frontside_labeltext
-        self.cur_card.cur_side = 'back' if self.cur_card.cur_side == 'front' else 'front'
-        self.cur_flashcard_side = 'back' if self.cur_card.cur_side == 'front' else 'front'
-        self.widgets['label'].update()
+        # Buttons do nothing while the deck is still loading
+        if self.session is None:
+            return
 
-        self.playBacksideSound(self.cur_card)
+        with self.profiler.measure('ui.flip'):
+            self.session.flip()
+            self.updateLabel()
 
-    def navigateFlashcards(self, direction):
-        cur_card_id = self.cur_card.id
-        valid_card_keys = [key for key in list(self.deck.cards.keys())]
-        valid_card_ids = list(map(lambda x: int(x[5:]), valid_card_keys))
-        index_cur_id_in_valid_ids = valid_card_ids.index(cur_card_id)
+            self.playBacksideSound()
 
-        card_to_navigate_to = None
-        id_card_to_nav_to = -1
+    def updateLabel(self):
+        # Only sets the already wrapped text, no forced update(): Tk
+        # redraws the label once the event handler returned and the
+        # event loop is idle
+        with self.profiler.measure('ui.widget_update'):
+            self.widgets['label']['text'] = self.text_layouts.get(self.session.getVisibleText())
 
-        if direction == 'forward':
-            id_card_to_nav_to = cur_card_id + 1 if index_cur_id_in_valid_ids != len(valid_card_ids) - 1 else 1
-        elif direction == 'backward':
-            id_card_to_nav_to = cur_card_id - 1 if index_cur_id_in_valid_ids != 0 else len(valid_card_ids)
-        elif direction == 'jmp_end':
-            id_card_to_nav_to = len(self.deck.cards)
-        elif direction == 'jmp_start':
-            id_card_to_nav_to = 1
+        self.scheduleLayoutAhead()
+
+    def scheduleLayoutAhead(self):
+        if self.layout_job is None:
+            self.layout_job = self.after_idle(self.layoutAhead)
+
+    def layoutAhead(self):
+        # Wrap both sides of the current and the upcoming cards (the
+        # same lookahead as for the sounds) while nothing else happens
+        self.layout_job = None
+
+        if not len(self.deck):
+            return
+
+        with self.profiler.measure('ui.layout_ahead'):
+            for offset in range(min(self.args.prefetch_cards + 1, len(self.deck))):
+                flashcard = self.deck[(self.deck.cur_index + offset) % len(self.deck)]
+
+                for text in (flashcard.frontside_labeltext, flashcard.backside_labeltext):
+                    if text not in self.text_layouts:
+                        self.text_layouts.prepare(text)
 
-        card_to_navigate_to = self.deck.cards[f'card_{id_card_to_nav_to}']
+    def showFlashcard(self):
+        # Display the front of the session's current card
+        self.updateLabel()
+        self.updateCardCounter()
+        self.sound_prefetcher.prefetch(self.deck)
+        self.deck_browser.showPosition(self.deck.cur_index)
 
-        if card_to_navigate_to:
-            self.widgets['label']['text'] = card_to_navigate_to.frontside_labeltext
-            self.widgets['label'].update()
-            self.cur_card = card_to_navigate_to
-            self.cur_flashcard_side = 'front'
-            self.deck.cur_card = card_to_navigate_to
-            self.deck.cur_side = 'front'
-            self.widgets['card_in_deck_pos']['text'] = f'{self.deck.cur_card.id}/{len(valid_card_ids)}'
+    def navigateFlashcards(self, direction):
+        if self.session is None:
+            return
+
+        with self.profiler.measure('ui.navigate'):
+            if self.session.navigate(direction):
+                self.showFlashcard()
 
     def gotoFlashcards(self, text):
-        if not text:
+        if not text or self.session is None:
             return None
 
-        valid_card_keys = [key for key in list(self.deck.cards.keys())]
-        valid_card_ids = list(map(lambda x: int(x[5:]), valid_card_keys))
-
         try:
             text = int(text)
         except ValueError:
@@ -386,86 +4265,200 @@ class FlashcardsApp(tk.Frame):
             except ValueError:
                 return None
 
-        if text in valid_card_ids:
-            card_to_navigate_to = self.deck.cards[f'card_{text}']
-        else:
-            return None
+        if self.session.gotoPosition(text):
+            self.showFlashcard()
 
-        if card_to_navigate_to:
-            self.widgets['label']['text'] = card_to_navigate_to.frontside_labeltext
-            self.widgets['label'].update()
-            self.cur_card = card_to_navigate_to
-            self.cur_flashcard_side = 'front'
-            self.deck.cur_card = card_to_navigate_to
-            self.deck.cur_side = 'front'
-            self.widgets['card_in_deck_pos']['text'] = f'{self.deck.cur_card.id}/{len(valid_card_ids)}'
+    def playBacksideSound(self):
+        if self.session is None:
+            return
 
-    def playBacksideSound(self, flashcard):
-        sndfile = flashcard.soundfile
+        sndfile = self.session.getSoundToPlay()
 
         if sndfile:
-            sndfile_is_url = isUrl(sndfile)
-            file_is_on_filesystem = os.path.exists(sndfile)
-
-            if flashcard.cur_side == 'back' and (sndfile_is_url or file_is_on_filesystem):
-
-                if self.os != 'Windows':
-                    cmd = f'sh -c "echo $$; exec {self.path_ffplay} -autoexit -vn -nodisp {sndfile} &> /dev/null &"&'
-                    ffplay_pid = -1
-
-                    if not ffplay_pids:
-                        ffplay_pid = int(subprocess.run(cmd, shell=True, text=True, capture_output=True).stdout.split('\n')[0]) + 2
-                        ffplay_pids.append(ffplay_pid)
-                    else:
-                        pgrep_ffplay = subprocess.run(f'pgrep ffplay', shell=True, text=True, capture_output=True).stdout.split('\n')
-                        pgrep_ffplay = list(filter(lambda x: x, pgrep_ffplay))
-                        ffplay_still_running = (str(ffplay_pids[0]) in pgrep_ffplay)
-
-                        if ffplay_still_running:
-                            os.system(f'kill {ffplay_pids[0]}')
-                            ffplay_pids.pop()
-                            ffplay_pid = int(subprocess.run(cmd, shell=True, text=True, capture_output=True).stdout.split('\n')[0]) + 2
-                            ffplay_pids.append(ffplay_pid)
-                        else:
-                            ffplay_pids.pop()
-                            ffplay_pid = int(subprocess.run(cmd, shell=True, text=True, capture_output=True).stdout.split('\n')[0]) + 2
-                            ffplay_pids.append(ffplay_pid)
-                else:
-                    if self.os == 'Windows':
-                        cmd = f'{self.path_ffplay} -autoexit -vn -nodisp {sndfile}'
-                        os.system(cmd)
+            data = self.sound_cache.get(sndfile)
 
-    def initCardCounter(self):
-        valid_card_keys = [key for key in list(self.deck.cards.keys())]
-        valid_card_ids = list(map(lambda x: int(x[5:]), valid_card_keys))
-        self.widgets['card_in_deck_pos']['text'] = f'{self.cur_card.id}/{len(valid_card_ids)}'
+            # Without the sound in memory ffplay opens the loose file itself
+            if data is None and self.sound_reader.bundles:
+                data = self.sound_reader.readBundled(sndfile)
 
-    def onExitCloseAutoflipThread(self):
-        print('onExitCloseThread()')
-        if isinstance(self.autoflip_thread, threading.Thread):
-            print('Closing thread...')
-            self.autoflip.set(False)
-            self.autowalk.set(False)
-
-            if self.widgets['autowalk_chkbtn']['state'] == "normal" and not self.autowalk.get():
-                self.master.destroy()
-
-                for widget in self.widgets:
-                    if widget != 'supermaster' and widget != 'master':
-                        self.widgets[widget].destroy()
-                        print("Joining thread")
-
-                print("Joining thread")
-                self.autoflip_thread.join()
-            elif self.widgets['autoflip_chkbtn']['state'] == "normal" and not self.autoflip.get():
-                self.autoflip_thread.join()
+            self.audio_player.play(sndfile, data)
+
+    def buildSearchIndex(self):
+        # A StreamingDeck or DiskDeck does not hold the card texts, so no search there
+        if not self.deck.holds_columns:
+            self.widgets['search_input']['state'] = tk.DISABLED
+            return
+
+        self.session.search_index = SearchIndex(self.deck)
+        self.session.search_index.buildInBackground()
+
+    def scheduleSearch(self):
+        # Typing fast searches once for the whole word, not for every key
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+
+        self.search_job = self.after(int(SEARCH_DEBOUNCE_INTERVAL * 1000), self.searchFlashcards)
+
+    def searchFlashcards(self):
+        self.search_job = None
+
+        if self.session is None:
+            return
+
+        results_listbox = self.widgets['search_results']
+        results_listbox.delete(0, tk.END)
+
+        with self.profiler.measure('ui.search'):
+            search_results = self.session.search(self.widgets['search_input'].get())
+
+        for index in search_results:
+            results_listbox.insert(tk.END, f'{self.deck.frontsides[index]} - {self.deck.backsides[index]}')
+
+    def gotoSearchResult(self):
+        selection = self.widgets['search_results'].curselection()
+
+        if not selection or selection[0] >= len(self.session.search_results):
+            return
+
+        if self.session.gotoCardIndex(self.session.search_results[selection[0]]):
+            self.showFlashcard()
+
+    def loadSpacedRepetition(self):
+        if not self.args.srs:
+            return
+
+        if not self.deck.holds_columns:
+            print('--srs is not supported together with --stream or --disk-store')
+            return
+
+        if not self.path_csv_deck:
+            print('--srs is only supported for a single deck')
+            return
+
+        with self.profiler.measure('load.srs'):
+            self.session.srs_scheduler = SpacedRepetitionScheduler(self.deck, self.path_csv_deck)
+            self.session.srs_scheduler.load()
+
+    def gradeFlashcard(self, grade):
+        with self.profiler.measure('ui.grade'):
+            if self.session.grade(grade):
+                self.showFlashcard()
+
+    def showNextDueFlashcard(self):
+        if self.session.showNextDueCard():
+            self.showFlashcard()
+
+    def toggleShuffle(self):
+        # While loading the checkbox is applied by showDeck()
+        if self.session is None:
+            return
+
+        self.session.setShuffled(self.shuffled.get())
+        self.updateCardCounter()
+        self.sound_prefetcher.prefetch(self.deck)
+        self.deck_browser.refresh()
+        self.deck_browser.showPosition(self.deck.cur_index)
+
+    def toggleDeckBrowser(self):
+        # While loading the checkbox is applied by showDeck()
+        if self.deck_browser is None:
+            return
+
+        if self.browse.get():
+            self.deck_browser.open()
         else:
-            print('No need to close autoflip thread on Exit')
+            self.deck_browser.close()
+
+    def closeDeckBrowser(self):
+        # The browser window's close button
+        self.browse.set(0)
+        self.toggleDeckBrowser()
+
+    def gotoBrowsedFlashcard(self, position):
+        with self.profiler.measure('ui.navigate'):
+            if self.session.gotoPosition(position + 1):
+                self.showFlashcard()
+
+    def startWatchingDeck(self):
+        if not self.args.watch:
+            return
+
+        if not self.deck.holds_columns:
+            print('--watch is not supported together with --stream or --disk-store')
+            return
+
+        if not self.path_csv_deck:
+            print('--watch is only supported for a single deck')
+            return
+
+        with self.profiler.measure('load.watch'):
+            self.deck_watcher = DeckWatcher(self.deck, self.path_csv_deck, self.sndfile_basepath, self.sound_reader)
+
+        self.after(int(DECK_WATCH_INTERVAL * 1000), self.watchDeckFile)
+
+    def watchDeckFile(self):
+        if self.deck_watcher.hasSettledChange():
+            time_started = time.perf_counter()
+
+            with self.profiler.measure('watch.reload'):
+                changes = self.deck_watcher.reload()
+
+                if changes:
+                    self.session.applyDeckChanges(changes, self.deck_watcher.deck)
+                    self.deck = self.session.deck
+                    self.deck_browser.setDeck(self.deck)
+                    self.showFlashcard()
+
+            if changes:
+                print(f'Deck reloaded in {(time.perf_counter() - time_started) * 1000:.1f}ms: {len(changes.changed)} changed, '
+                      f'{len(changes.added)} added, {changes.removed_count} removed card(s)'
+                      f'{" (read completely)" if changes.full_reload else ""}')
 
-        self.master.destroy()
+        self.after(int(DECK_WATCH_INTERVAL * 1000), self.watchDeckFile)
+
+    def updateCardCounter(self):
+        self.widgets['card_in_deck_pos']['text'] = self.session.getCounterText()
+
+    def refreshCardCounterWhileIndexing(self):
+        self.updateCardCounter()
+        # A StreamingDeck grows while being indexed and may get shuffled at the end
+        self.deck_browser.refresh()
+
+        if not self.deck.index_complete:
+            self.after(250, self.refreshCardCounterWhileIndexing)
+
+    def onExitCloseAutoflipThread(self):
+        # Autoflip/autowalk only has a pending Tk timer, no thread
+        # needs to be joined so closing the window is instant
+        self.cancelAutoflipTimer()
+
+        if self.layout_job is not None:
+            self.after_cancel(self.layout_job)
+
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+
+        if self.deck_browser:
+            self.deck_browser.cancelRender()
+
+        # Whatever fails while shutting down, the window still closes
+        try:
+            self.audio_player.shutdown()
+            self.sound_prefetcher.shutdown()
+
+            if self.session and self.session.srs_scheduler:
+                self.session.srs_scheduler.close()
+
+            self.profiler.finish({'audio_latency': self.audio_player.getLatencyStats(),
+                                  'sound_cache': self.sound_cache.getStats(),
+                                  'sound_reads': self.sound_reader.getStats(),
+                                  'text_layouts': self.text_layouts.getStats(),
+                                  'deck_browser': self.deck_browser.getStats() if self.deck_browser else None})
+            self.sound_reader.close()
+        finally:
+            self.master.destroy()
 
     def registerOnExitCloseAutoflipThread(self):
-        print('Registering: self.master.protocol("WM_DELETE_WINDOW", self.onExitCloseThread)')
         self.master.protocol("WM_DELETE_WINDOW", self.onExitCloseAutoflipThread)
 
     def createWidgets(self):
@@ -478,15 +4471,12 @@ class FlashcardsApp(tk.Frame):
         flipbtn.pack(side='top')
         self.widgets['flp_btn'] = flipbtn
 
-        self.loadDeck()
-
         # Create the label widget that will represent the text for
-        # all flashcards no matter whether front side or back side
-        # and set its initial text to that of the first card in the deck
+        # all flashcards no matter whether front side or back side.
+        # It shows the first card once the deck is loaded, see showDeck()
         flashcard_text = tk.Label(mainframe, **(self.flashcard_config))
-        flashcard_text['text'] = f'{self.deck.cards["card_1"].frontside_labeltext}'
+        flashcard_text['text'] = 'Loading deck ...'
         flashcard_text.place(x=450, y=250, anchor='center')
-        self.cur_card = self.deck.cards['card_1']
         self.widgets['label'] = flashcard_text
 
         jmp_end_btn = tk.Button(self, **(self.jmp_end_btn_config))
@@ -506,7 +4496,7 @@ class FlashcardsApp(tk.Frame):
         self.widgets['bwd_btn'] = backbtn
 
         goto_input = tk.Entry(self, **(self.goto_input_config))
-        self.bind_class('Entry', '<Return>', self.gotoFlashcards)
+        goto_input.bind('<Return>', self.gotoFlashcards)
         goto_input.pack(side='bottom')
         self.widgets['goto_input'] = goto_input
 
@@ -525,54 +4515,101 @@ class FlashcardsApp(tk.Frame):
         autowalk_chkbtn.place(relx=0.9, rely=0.15)
         self.widgets['autowalk_chkbtn'] = autowalk_chkbtn
 
+        # Search-as-you-type box with its result list on the left side
+        search_input = tk.Entry(self.master, **(self.search_input_config))
+        search_input.bind('<KeyRelease>', lambda event: self.scheduleSearch())
+        search_input.place(relx=0.01, rely=0.05)
+        self.widgets['search_input'] = search_input
+
+        search_results = tk.Listbox(self.master, **(self.search_results_config))
+        search_results.bind('<<ListboxSelect>>', lambda event: self.gotoSearchResult())
+        search_results.place(relx=0.01, rely=0.1)
+        self.widgets['search_results'] = search_results
+
+        shuffle_chkbtn = tk.Checkbutton(self.master, **(self.shuffle_chkbtn_config))
+        shuffle_chkbtn.place(relx=0.9, rely=0.2)
+        self.widgets['shuffle_chkbtn'] = shuffle_chkbtn
+
+        browse_chkbtn = tk.Checkbutton(self.master, **(self.browse_chkbtn_config))
+        browse_chkbtn.place(relx=0.9, rely=0.25)
+        self.widgets['browse_chkbtn'] = browse_chkbtn
+
         card_in_deck_pos = tk.Label(self.master, **self.card_in_deck_pos_config)
         card_in_deck_pos.place(relx=0.8, rely=0.9)
         self.widgets['card_in_deck_pos'] = card_in_deck_pos
-        self.initCardCounter()
 
-    def startAutoflipFunctionalityHandlerThreaded(self):
-        # Easy dirty fix for having the same time
-        # delay for the first card/click
+        # The window gets shown right away, the deck is loaded meanwhile
+        self.loadDeckInBackground()
 
-        get_time_method = lambda: time.clock_gettime(time.CLOCK_REALTIME)
+    def showDeck(self):
+        # Everything that needs the loaded deck, called once by pollDeckLoaded()
+        if bool(self.shuffled.get()) != self.deck.is_shuffled:
+            # The shuffle checkbox got toggled while loading, no card
+            # was shown yet so start with the first one
+            self.session.setShuffled(self.shuffled.get())
+            self.session.showCard(self.deck.firstCard())
 
-        if self.os == 'Windows' or self.os == 'Darwin':
-            # Windows and MacOS don't have time.clock()
-            # or time.clock_gettime()
-            get_time_method = lambda: time.perf_counter()
+        self.deck_browser = DeckBrowser(self.master, self.deck, self.gotoBrowsedFlashcard, self.closeDeckBrowser, self.profiler)
+        self.toggleDeckBrowser()
+        self.updateLabel()
+        self.buildSearchIndex()
 
-        next_action = 'flip'
-        next_time_diff = 4.0
+        self.loadSpacedRepetition()
 
-        time_started = get_time_method()
+        if self.session.srs_scheduler:
+            # Grade buttons below the card, grading shows the next due card
+            grade_frame = tk.Frame(self.master, bg=self.bgcolor)
+            grade_frame.place(relx=0.5, rely=0.8, anchor='n')
+            self.widgets['grade_frame'] = grade_frame
 
-        while self.autoflip.get() or self.autowalk.get():
-            # Don't burn our CPU
-            time.sleep(0.05)
+            for name in SRS_GRADES:
+                tk.Button(grade_frame, **(self.grade_btn_configs[name])).pack(side='left')
 
-            current_time = get_time_method()
+            self.showNextDueFlashcard()
 
-            if current_time - time_started < next_time_diff:
-                continue
+        self.refreshCardCounterWhileIndexing()
+        self.sound_prefetcher.prefetch(self.deck)
+        self.startWatchingDeck()
 
-            time_started = current_time
-
-            if next_action == 'flip':
-                self.flipFlashcard()
-                if self.autowalk.get():
-                    next_action = 'walk'
-                    next_time_diff = self.fliptime
-            elif next_action == 'walk':
-                self.navigateFlashcards('forward')
-                next_action = 'flip'
-                next_time_diff = self.switchtime
-        else:
-            return False
+        if self.args.exit_after_first_card:
+            # For benchmarks/bench_startup.py: the first card is painted
+            # once the pending redraws are done
+            self.update_idletasks()
+            print('First card shown', flush=True)
+            self.onExitCloseAutoflipThread()
+
+    def scheduleAutoflipAction(self, action, delay):
+        # Runs on the Tk event loop: nothing wakes up
+        # until the next flip or walk is actually due
+        self.autoflip_timer = self.after(int(delay * 1000), lambda: self.runAutoflipAction(action))
+
+    def cancelAutoflipTimer(self):
+        if self.autoflip_timer is not None:
+            self.after_cancel(self.autoflip_timer)
+            self.autoflip_timer = None
+
+    def runAutoflipAction(self, action):
+        self.autoflip_timer = None
+
+        if not (self.autoflip.get() or self.autowalk.get()):
+            return
+
+        if action == 'flip':
+            self.flipFlashcard()
+
+            if self.autowalk.get():
+                self.scheduleAutoflipAction('walk', self.fliptime)
+            else:
+                self.scheduleAutoflipAction('flip', AUTOFLIP_INTERVAL)
+        elif action == 'walk':
+            self.navigateFlashcards('forward')
+            self.scheduleAutoflipAction('flip', self.switchtime)
 
     def autoflipEntryPoint(self):
+        self.cancelAutoflipTimer()
+
         if self.autoflip.get() or self.autowalk.get():
-            self.autoflip_thread = threading.Thread(target=self.startAutoflipFunctionalityHandlerThreaded)
-            self.autoflip_thread.start()
+            self.scheduleAutoflipAction('flip', AUTOFLIP_INTERVAL)
 
         if self.autoflip.get():
             self.widgets['autowalk_chkbtn']['state'] = tk.DISABLED
@@ -596,7 +4633,24 @@ def main():
 
     args = constructAndGetArgs()
 
-    csv_to_use = args.path_to_deck
+    if args.import_path:
+        if not importDeck(args):
+            sys.exit(1)
+        return
+
+    csv_to_use = getDeckPaths(args.path_to_deck)
+
+    if not csv_to_use:
+        print('No deck found, pass a CSV or a directory of CSV files with -p')
+        return
+
+    if args.pack_sounds:
+        packSoundBundles(csv_to_use, args)
+        return
+
+    if args.serve:
+        runServer(args)
+        return
 
     top_lvl_win = tk.Tk()
 